@@ -127,6 +127,15 @@ DATABASES = {
     }
 }
 
+if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    # wait for a busy database instead of failing; booking approval takes the
+    # write lock up front (villas.utils.take_write_lock), other transactions
+    # stay deferred
+    DATABASES["default"]["OPTIONS"] = {"timeout": 20}
+    # file-backed test database: the shared-cache in-memory one uses table locks
+    # that fail immediately instead of honouring the busy timeout
+    DATABASES["default"]["TEST"] = {"NAME": BASE_DIR / "test_db.sqlite3"}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -316,6 +325,47 @@ CHANNEL_LAYERS = {
 
 
 
+# Cache Configuration
+# Redis when REDIS_CACHE_URL is set (e.g. redis://127.0.0.1:6379/1), otherwise
+# per-process local memory. Version counters used for invalidation are only
+# shared between workers with Redis.
+REDIS_CACHE_URL = config('REDIS_CACHE_URL', default='')
+
+if REDIS_CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_CACHE_URL,
+            "KEY_PREFIX": "eastmondvilla",
+        },
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "eastmondvilla",
+        },
+    }
+
+# Seconds an anonymous property list/detail response stays cached
+PROPERTY_CACHE_TIMEOUT = config('PROPERTY_CACHE_TIMEOUT', default=300, cast=int)
+
+# Seconds cached analytics of the current day/month stay fresh; closed
+# periods are cached for 30 days (villas.cache.ANALYTICS_CLOSED_TIMEOUT)
+ANALYTICS_CACHE_TIMEOUT = config('ANALYTICS_CACHE_TIMEOUT', default=60, cast=int)
+
+# Seconds view/download/booking counters and analytics events are buffered in
+# each process before they are written (and once more at shutdown). 0 writes
+# every increment straight through.
+ANALYTICS_FLUSH_INTERVAL = config('ANALYTICS_FLUSH_INTERVAL', default=5, cast=float)
+
+# Reverse proxies in front of the app that append to X-Forwarded-For. 0 uses
+# REMOTE_ADDR as the client address (for analytics visitor ids) and ignores
+# the header, which clients can set to anything.
+TRUSTED_PROXY_COUNT = config('TRUSTED_PROXY_COUNT', default=0, cast=int)
+
+
+
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 if not DEBUG:
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('list_vila', '0004_alter_vilalisting_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='contectus',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
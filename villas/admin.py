@@ -92,7 +92,7 @@ class PropertyAdmin(ModelAdmin):
     list_display = ( 'id', 'title', 'status', 'listing_type', 'price', 'assigned_agent_link', 'booking_count', 'created_at' )
     list_filter = ( 'status', 'listing_type', 'city', 'created_at', )
     search_fields = ( 'title', 'description', 'address', 'city', 'assigned_agent__name', )
-    readonly_fields = ( 'slug', 'created_at', 'updated_at', 'booking_count', 'assigned_agent_link' )
+    readonly_fields = ( 'slug', 'created_at', 'updated_at', 'booking_count', 'assigned_agent_link', 'review_count', 'rating_sum', 'avg_rating' )
     inlines = [ BookingInline, PropertyImageInline, BedroomImageInline ]
     ordering = ('-created_at',)
 
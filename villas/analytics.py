@@ -0,0 +1,394 @@
+import hashlib
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.core.cache import cache
+from django.db.models import Count, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from list_vila.models import ContectUs
+
+from .cache import ANALYTICS_CLOSED_TIMEOUT, safe_cache, analytics_key, analytics_timeout, analytics_version, bump_analytics_version, forget_analytics
+from .events import DEFAULT_SETTLE
+from .hll import HyperLogLog
+from .models import AnalyticsWatermark, DailyAnalytics, MonthlyAnalytics, Property, SiteVisitorSketch, WeeklyAnalytics
+from .rollups import month_start, next_month
+
+
+# Site-wide analytics over long ranges. Closed days are folded into
+# WeeklyAnalytics and MonthlyAnalytics; a range is answered from whole rollup
+# rows where they fit and from daily rows at the edges. Results are cached per
+# day or whole month (see villas.cache), so closed periods are seldom recomputed.
+PERIOD_WATERMARK = 'period_rollup'
+COUNTERS = ('views', 'bookings', 'downloads')
+FIELDS = COUNTERS + ('inquiries',)
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def _empty():
+    return dict.fromkeys(FIELDS, 0)
+
+
+def _add(total, values):
+    for field in FIELDS:
+        total[field] += values.get(field) or 0
+    return total
+
+
+def _day_bounds(start, end):
+    """Aware datetimes [start 00:00, end + 1 day 00:00) for created_at filters."""
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), tz),
+        timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz),
+    )
+
+
+def daily_totals(ranges):
+    """{day: {views, bookings, downloads, inquiries}} over the given (start, end) day ranges, in two queries."""
+    if not ranges:
+        return {}
+    analytics_q, inquiry_q = Q(), Q()
+    for start, end in ranges:
+        analytics_q |= Q(date__range=(start, end))
+        low, high = _day_bounds(start, end)
+        inquiry_q |= Q(created_at__gte=low, created_at__lt=high)
+
+    days = {}
+    for row in (
+        DailyAnalytics.objects.filter(analytics_q).order_by().values('date')
+        .annotate(views=Sum('views'), bookings=Sum('bookings'), downloads=Sum('downloads'))
+    ):
+        _add(days.setdefault(row['date'], _empty()), row)
+    for row in (
+        ContectUs.objects.filter(inquiry_q).annotate(day=TruncDate('created_at'))
+        .order_by().values('day').annotate(inquiries=Count('id'))
+    ):
+        _add(days.setdefault(row['day'], _empty()), row)
+    return days
+
+
+def close_days(until=None):
+    """
+    Fold every day after the watermark up to `until` (by default the last
+    day that ended more than DEFAULT_SETTLE ago) into the weekly and monthly
+    rollups. Only the weeks and months containing those days are rewritten.
+    Returns the number of days closed.
+    """
+    if until is None:
+        until = (timezone.now() - DEFAULT_SETTLE).date() - timedelta(days=1)
+
+    with transaction.atomic():
+        watermark, _ = AnalyticsWatermark.objects.select_for_update().get_or_create(name=PERIOD_WATERMARK)
+        if watermark.last_day is not None:
+            first = watermark.last_day + timedelta(days=1)
+        else:
+            earliest = [
+                DailyAnalytics.objects.aggregate(first=Min('date'))['first'],
+                ContectUs.objects.aggregate(first=Min('created_at'))['first'],
+            ]
+            earliest = [timezone.localdate(value) if isinstance(value, datetime) else value for value in earliest if value]
+            first = min(earliest, default=until + timedelta(days=1))
+        if first > until:
+            return 0
+
+        from_day = min(week_start(first), month_start(first))
+        days = daily_totals([(from_day, until)])
+
+        weeks, months = {}, {}
+        day = from_day
+        while day <= until:
+            values = days.get(day, {})
+            if day >= week_start(first):
+                _add(weeks.setdefault(week_start(day), _empty()), values)
+            if day >= month_start(first):
+                _add(months.setdefault(month_start(day), _empty()), values)
+            day += timedelta(days=1)
+
+        WeeklyAnalytics.objects.filter(week__in=weeks).delete()
+        WeeklyAnalytics.objects.bulk_create([
+            WeeklyAnalytics(week=week, through=min(week + timedelta(days=6), until), **values)
+            for week, values in weeks.items()
+        ], batch_size=500)
+        MonthlyAnalytics.objects.filter(month__in=months).delete()
+        MonthlyAnalytics.objects.bulk_create([
+            MonthlyAnalytics(month=month, through=min(next_month(month) - timedelta(days=1), until), **values)
+            for month, values in months.items()
+        ], batch_size=500)
+
+        watermark.last_day = until
+        watermark.save(update_fields=['last_day', 'updated_at'])
+    return (until - first).days + 1
+
+
+def reopen_periods(day):
+    """
+    Rows counted by the rollups were deleted on `day`. Drops the weekly and
+    monthly rows from `day` on, so reads fall back to the daily rows, moves
+    the watermark back so the next close_days() rebuilds them, and drops the
+    cached results.
+    """
+    with transaction.atomic():
+        reopened = AnalyticsWatermark.objects.filter(name=PERIOD_WATERMARK, last_day__gte=day).update(
+            last_day=day - timedelta(days=1), updated_at=timezone.now(),
+        )
+        if reopened:
+            WeeklyAnalytics.objects.filter(through__gte=day).delete()
+            MonthlyAnalytics.objects.filter(through__gte=day).delete()
+        transaction.on_commit(bump_analytics_version)
+
+
+def reset_periods():
+    """Drop the weekly and monthly rollups; the next close_days() rebuilds them from the first day."""
+    with transaction.atomic():
+        WeeklyAnalytics.objects.all().delete()
+        MonthlyAnalytics.objects.all().delete()
+        AnalyticsWatermark.objects.filter(name=PERIOD_WATERMARK).update(last_day=None)
+        transaction.on_commit(bump_analytics_version)
+
+
+def _plan(start, end, months, weeks):
+    """
+    Cover [start, end] with the largest rollup rows that fit entirely inside
+    it. Returns (rows, day ranges left for the daily table).
+    """
+    rows, ranges = [], []
+    gap = None
+    cursor = start
+    while cursor <= end:
+        row = months.get(cursor)
+        if row is None or row.through > end:
+            row = weeks.get(cursor)
+        if row is not None and row.through <= end:
+            if gap is not None:
+                ranges.append((gap, cursor - timedelta(days=1)))
+                gap = None
+            rows.append(row)
+            cursor = row.through + timedelta(days=1)
+        else:
+            if gap is None:
+                gap = cursor
+            cursor += timedelta(days=1)
+    if gap is not None:
+        ranges.append((gap, end))
+    return rows, ranges
+
+
+def _merge(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def buckets(start, end, monthly):
+    """(bucket start, bucket end) per day, or per month clipped to [start, end]."""
+    result = []
+    cursor = start
+    while cursor <= end:
+        last = min(next_month(cursor) - timedelta(days=1), end) if monthly else cursor
+        result.append((cursor, last))
+        cursor = last + timedelta(days=1)
+    return result
+
+
+def units(start, end):
+    """Cache units of [start, end]: each whole month inside it, and single days elsewhere."""
+    result = []
+    cursor = start
+    while cursor <= end:
+        month_end = next_month(cursor) - timedelta(days=1)
+        if cursor.day == 1 and month_end <= end:
+            result.append((cursor, month_end))
+            cursor = month_end + timedelta(days=1)
+        else:
+            result.append((cursor, cursor))
+            cursor += timedelta(days=1)
+    return result
+
+
+def _cached(scope, kind, wanted, compute):
+    """
+    {unit: value} for the `wanted` units, computing only those not cached
+    yet with compute(missing units). Closed units are kept for ANALYTICS_CLOSED_TIMEOUT.
+    """
+    version = analytics_version()
+    if version is None:
+        return compute(wanted)
+    keys = {unit: analytics_key(version, scope, kind, unit) for unit in wanted}
+    cached = safe_cache({}, cache.get_many, list(keys.values()))
+    found = {unit: cached[key] for unit, key in keys.items() if key in cached}
+
+    missing = [unit for unit in wanted if unit not in found]
+    if missing:
+        fresh = compute(missing)
+        closed_before = (timezone.now() - DEFAULT_SETTLE).date()
+        closed = {keys[unit]: value for unit, value in fresh.items() if unit[1] < closed_before}
+        open_ = {keys[unit]: value for unit, value in fresh.items() if unit[1] >= closed_before}
+        if closed:
+            safe_cache(None, cache.set_many, closed, ANALYTICS_CLOSED_TIMEOUT)
+        if open_:
+            safe_cache(None, cache.set_many, open_, analytics_timeout())
+        found.update(fresh)
+    return found
+
+
+def _each_day(start, end):
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def _compute_totals(wanted):
+    """{unit: (values, has_data)}, from the largest rollup rows that fit in each unit plus daily rows."""
+    whole_months = [start for start, end in wanted if start != end]
+    months = weeks = {}
+    if whole_months:
+        months = {row.month: row for row in MonthlyAnalytics.objects.filter(month__in=whole_months)}
+        weeks = {
+            row.week: row for row in WeeklyAnalytics.objects.filter(week__range=(min(whole_months), max(end for _, end in wanted)))
+        }
+
+    plans = {unit: _plan(unit[0], unit[1], months, weeks) for unit in wanted}
+    days = daily_totals(_merge([r for _, ranges in plans.values() for r in ranges]))
+
+    result = {}
+    for unit, (rows, ranges) in plans.items():
+        values, has_data = _empty(), False
+        for row in rows:
+            _add(values, {field: getattr(row, field) for field in FIELDS})
+        for range_start, range_end in ranges:
+            for day in _each_day(range_start, range_end):
+                if day in days:
+                    _add(values, days[day])
+                    has_data = True
+        result[unit] = (values, has_data or any(values.values()))
+    return result
+
+
+def summarize(start, end, monthly):
+    """
+    Site-wide counters and inquiries over [start, end]: (totals, [(bucket
+    start, values, has_data)] per day or per month). Each bucket is summed
+    from cached day/month units; uncached units are computed together.
+    """
+    periods = [(low, units(low, high)) for low, high in buckets(start, end, monthly)]
+    cached = _cached('site', 'totals', [unit for _, parts in periods for unit in parts], _compute_totals)
+
+    totals, series = _empty(), []
+    for low, parts in periods:
+        values, has_data = _empty(), False
+        for unit in parts:
+            unit_values, unit_has_data = cached[unit]
+            _add(values, unit_values)
+            has_data = has_data or unit_has_data
+        _add(totals, values)
+        series.append((low, values, has_data))
+    return totals, series
+
+
+def _compute_sketches(wanted):
+    """{unit: merged HyperLogLog registers (b'' when empty)} from the SiteVisitorSketch rows, one per day."""
+    unit_of = {day: unit for unit in wanted for day in _each_day(*unit)}
+    q = Q()
+    for start, end in _merge(wanted):
+        q |= Q(date__range=(start, end))
+    per_unit = {}
+    for day, registers in SiteVisitorSketch.objects.filter(q).values_list('date', 'registers').iterator():
+        per_unit.setdefault(unit_of[day], []).append(registers)
+    return {
+        unit: HyperLogLog.merged(per_unit[unit]).to_bytes() if unit in per_unit else b''
+        for unit in wanted
+    }
+
+
+def site_visitors(start, end):
+    """Estimated distinct visitors over [start, end], merging cached day/month sketches."""
+    sketches = _cached('site', 'visitors', units(start, end), _compute_sketches)
+    return HyperLogLog.merged(registers for registers in sketches.values() if registers).count()
+
+
+def forget_visitor_days(days):
+    """Called when the event rollup changes the sketches of `days`."""
+    touched = set()
+    for day in days:
+        month = month_start(day)
+        touched.update({(day, day), (month, next_month(month) - timedelta(days=1))})
+    forget_analytics('site', 'visitors', touched)
+
+
+def _assignment_scope(prefix, assignments):
+    # per-agent history follows the current assignments, so they are part of the key
+    digest = hashlib.sha1(repr(sorted(assignments)).encode()).hexdigest()[:16]
+    return f'{prefix}:{digest}'
+
+
+def agent_totals(agents, start, end):
+    """
+    [{id, name, total_properties, total_views, total_downloads, total_bookings}]
+    for `agents`, counting only DailyAnalytics rows in [start, end]. Property
+    counts come from the assignment list and the counters from one grouped
+    pass per uncached day/month unit, so neither is multiplied by the other.
+    """
+    rows = list(agents.values('id', 'name'))
+    assignments = list(
+        Property.objects.filter(assigned_agent__in=[row['id'] for row in rows]).values_list('id', 'assigned_agent')
+    )
+    property_counts = Counter(agent for _, agent in assignments)
+
+    def compute(wanted):
+        unit_of = {day: unit for unit in wanted for day in _each_day(*unit)}
+        q = Q()
+        for low, high in _merge(wanted):
+            q |= Q(date__range=(low, high))
+        result = {unit: {} for unit in wanted}
+        for row in (
+            DailyAnalytics.objects.filter(q, property_id__in=[pk for pk, _ in assignments])
+            .order_by().values('property__assigned_agent', 'date')
+            .annotate(views=Sum('views'), downloads=Sum('downloads'), bookings=Sum('bookings'))
+        ):
+            sums = result[unit_of[row['date']]].setdefault(row['property__assigned_agent'], _empty())
+            _add(sums, row)
+        return result
+
+    per_unit = {}
+    if assignments:
+        per_unit = _cached(_assignment_scope('agents', assignments), 'totals', units(start, end), compute)
+
+    for row in rows:
+        row['total_properties'] = property_counts.get(row['id'], 0)
+        for field in COUNTERS:
+            row[f'total_{field}'] = sum(unit.get(row['id'], {}).get(field, 0) for unit in per_unit.values())
+    return rows
+
+
+def agent_downloads(agent_id, start, end):
+    """Downloads of the properties currently assigned to one agent over [start, end]."""
+    property_ids = sorted(Property.objects.filter(assigned_agent_id=agent_id).values_list('id', flat=True))
+    if not property_ids:
+        return 0
+
+    def compute(wanted):
+        unit_of = {day: unit for unit in wanted for day in _each_day(*unit)}
+        q = Q()
+        for low, high in _merge(wanted):
+            q |= Q(date__range=(low, high))
+        result = dict.fromkeys(wanted, 0)
+        for day, downloads in (
+            DailyAnalytics.objects.filter(q, property_id__in=property_ids)
+            .order_by().values('date').annotate(total=Sum('downloads')).values_list('date', 'total')
+        ):
+            result[unit_of[day]] += downloads or 0
+        return result
+
+    scope = _assignment_scope(f'agent:{agent_id}', property_ids)
+    return sum(_cached(scope, 'downloads', units(start, end), compute).values())
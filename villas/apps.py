@@ -1,7 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class VillasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'villas'
     verbose_name = 'Villas'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .search import repair_sqlite_search_index
+
+        post_migrate.connect(repair_sqlite_search_index, sender=self)
@@ -0,0 +1,109 @@
+from bisect import bisect_left
+from datetime import date, timedelta
+
+from .models import Booking, ExternalCalendarBlock, Property, PropertyOccupancy
+from .utils import unavailable_ranges
+
+
+MAX_AVAILABILITY_DAYS = 731
+MAX_BATCH_PROPERTIES = 100
+
+
+def merge_intervals(ranges):
+    """Sort (start, end) date pairs and merge the ones that overlap or touch."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def rebuild_occupancy(property_id, create=True):
+    """
+    Recompute the occupancy index of one property from its approved bookings
+    and imported external blocks.
+    With create=False only an existing index is updated (used on deletes,
+    which may be part of deleting the property itself).
+    """
+    ranges = Booking.objects.filter(
+        property_id=property_id, status=Booking.STATUS.Approved
+    ).order_by().values_list('check_in', 'check_out').union(
+        ExternalCalendarBlock.objects.filter(property_id=property_id).order_by().values_list('start', 'end'),
+        all=True,
+    )
+    intervals = [[start.isoformat(), end.isoformat()] for start, end in merge_intervals(ranges)]
+    if not create:
+        PropertyOccupancy.objects.filter(property_id=property_id).update(intervals=intervals)
+        return None
+    occupancy, _ = PropertyOccupancy.objects.update_or_create(
+        property_id=property_id, defaults={'intervals': intervals}
+    )
+    return occupancy
+
+
+def get_occupancy(property_id):
+    """The occupancy index of a property, or None if the property does not exist."""
+    occupancy = PropertyOccupancy.objects.filter(property_id=property_id).first()
+    if occupancy is None:
+        if not Property.objects.filter(pk=property_id).exists():
+            return None
+        # built lazily for properties that had no booking transition yet
+        occupancy = rebuild_occupancy(property_id)
+    return occupancy
+
+
+def booked_ranges(intervals, start, end):
+    """
+    Ranges of `intervals` (sorted, merged, ISO strings) that fall inside
+    [start, end], clipped to it. Binary search finds the first candidate.
+    """
+    start_iso, end_iso = start.isoformat(), end.isoformat()
+    # interval ends are sorted as well because the intervals are merged
+    index = bisect_left(intervals, start_iso, key=lambda interval: interval[1])
+
+    result = []
+    for interval_start, interval_end in intervals[index:]:
+        if interval_start > end_iso:
+            break
+        result.append({
+            "start": max(interval_start, start_iso),
+            "end": min(interval_end, end_iso),
+        })
+    return result
+
+
+def free_ranges(booked, start, end):
+    """Complement of `booked` (sorted {'start', 'end'} ISO dicts) within [start, end]."""
+    free = []
+    cursor = start
+    for interval in booked:
+        booked_start = date.fromisoformat(interval['start'])
+        booked_end = date.fromisoformat(interval['end'])
+        if booked_start > cursor:
+            free.append({"start": cursor.isoformat(), "end": (booked_start - timedelta(days=1)).isoformat()})
+        cursor = max(cursor, booked_end + timedelta(days=1))
+    if cursor <= end:
+        free.append({"start": cursor.isoformat(), "end": end.isoformat()})
+    return free
+
+
+def batch_availability(property_ids, start, end):
+    """
+    Booked and free ranges inside [start, end] for many properties, from a
+    single query over the approved bookings and external blocks that overlap
+    the window.
+    """
+    ranges = {property_id: [] for property_id in property_ids}
+    rows = unavailable_ranges(start, end, property_ids)
+    for property_id, check_in, check_out in rows:
+        ranges[property_id].append((check_in, check_out))
+
+    result = {}
+    for property_id, stays in ranges.items():
+        intervals = [[a.isoformat(), b.isoformat()] for a, b in merge_intervals(stays)]
+        booked = booked_ranges(intervals, start, end)
+        result[str(property_id)] = {"booked": booked, "free": free_ranges(booked, start, end)}
+    return result
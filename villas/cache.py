@@ -0,0 +1,175 @@
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import http_date
+
+
+logger = logging.getLogger(__name__)
+
+# Anonymous property responses are cached under version counters:
+#   * one global counter, part of every list key
+#   * one counter per property, stored inside every detail entry
+# Bumping a counter makes the old entries unreachable; they simply expire.
+GLOBAL_VERSION_KEY = 'villas:property:version'
+PROPERTY_VERSION_KEY = 'villas:property:{pk}:version'
+
+
+def _timeout():
+    return getattr(settings, 'PROPERTY_CACHE_TIMEOUT', 300)
+
+
+def safe_cache(default, func, *args):
+    """
+    func(*args), or `default` if the cache backend fails. The cache is an
+    optimization: a cache outage must never break a read.
+    """
+    try:
+        return func(*args)
+    except Exception:
+        logger.warning("Cache unavailable", exc_info=True)
+        return default
+
+
+def _seed():
+    # a fresh counter starts from the clock so an evicted counter never
+    # comes back with a value that old entries were stored under
+    return time.time_ns() // 1000
+
+
+def _get_versions(keys):
+    versions = safe_cache({}, cache.get_many, keys)
+    missing = [key for key in keys if key not in versions]
+    for key in missing:
+        safe_cache(None, cache.add, key, _seed(), None)
+    if missing:
+        versions.update(safe_cache({}, cache.get_many, missing))
+    return versions
+
+
+def global_version():
+    return _get_versions([GLOBAL_VERSION_KEY]).get(GLOBAL_VERSION_KEY)
+
+
+def property_version(pk):
+    key = PROPERTY_VERSION_KEY.format(pk=pk)
+    return _get_versions([key]).get(key)
+
+
+def property_versions(pks):
+    """{pk: version} for many properties in one cache round trip (None if the cache is down)."""
+    keys = {PROPERTY_VERSION_KEY.format(pk=pk): pk for pk in pks}
+    versions = _get_versions(list(keys))
+    return {pk: versions.get(key) for key, pk in keys.items()}
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _seed(), None)
+
+
+def bump_property_version(pk):
+    """Invalidate cached responses that include property `pk` (and every list)."""
+    for key in (GLOBAL_VERSION_KEY, PROPERTY_VERSION_KEY.format(pk=pk)):
+        safe_cache(None, _bump, key)
+
+
+def _fingerprint(request):
+    # scheme and host are part of the key because pagination links are absolute
+    params = sorted((key, sorted(values)) for key, values in request.query_params.lists())
+    raw = f"{request.scheme}://{request.get_host()}{request.path}?{params}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def get_cached_list(request):
+    """Return (cached data or None, key to store a fresh response under)."""
+    version = global_version()
+    if version is None:
+        return None, None
+    key = f"villas:property:list:{version}:{_fingerprint(request)}"
+    return safe_cache(None, cache.get, key), key
+
+
+def set_cached_list(key, data):
+    if key:
+        safe_cache(None, cache.set, key, data, _timeout())
+
+
+def _detail_key(request, lookup):
+    return f"villas:property:detail:{lookup}:{_fingerprint(request)}"
+
+
+def get_cached_detail(request, lookup):
+    """Cached detail data for `lookup` (pk or slug), if its property has not changed since."""
+    entry = safe_cache(None, cache.get, _detail_key(request, lookup))
+    if not entry:
+        return None
+    if entry['version'] != property_version(entry['pk']):
+        return None
+    return entry['data']
+
+
+def set_cached_detail(request, lookup, pk, version, data):
+    """`version` must be read before the response was built, so a concurrent change wins."""
+    if version is None:
+        return
+    entry = {'pk': pk, 'version': version, 'data': data}
+    safe_cache(None, cache.set, _detail_key(request, lookup), entry, _timeout())
+
+
+def property_validators(row):
+    """
+    (ETag, Last-Modified timestamp) for a property detail built from a cheap
+    values() row with id, updated_at, content_version and optionally is_favorited.
+    """
+    updated_at = row['updated_at']
+    tag = f"p{row['id']}-{int(updated_at.timestamp() * 1_000_000)}-{row['content_version']}"
+    if row.get('is_favorited'):
+        tag += '-fav'
+    return f'"{tag}"', int(updated_at.timestamp())
+
+
+def set_validators(response, validators):
+    if validators and response.status_code == 200:
+        etag, last_modified = validators
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+# Analytics are cached per (scope, kind, period) unit, where a unit is one day
+# or one whole month. Units that ended before the settle cutoff rarely change
+# and are kept for ANALYTICS_CLOSED_TIMEOUT; the open unit expires after
+# ANALYTICS_CACHE_TIMEOUT. Rebuilds and deletes bump the analytics version.
+# The finite timeout also retires keys nobody asks for again, such as those
+# of superseded versions or agent assignments.
+ANALYTICS_VERSION_KEY = 'villas:analytics:version'
+ANALYTICS_KEY = 'villas:analytics:{version}:{scope}:{kind}:{start:%Y%m%d}-{end:%Y%m%d}'
+ANALYTICS_CLOSED_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def analytics_timeout():
+    return getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 60)
+
+
+def analytics_version():
+    return _get_versions([ANALYTICS_VERSION_KEY]).get(ANALYTICS_VERSION_KEY)
+
+
+def bump_analytics_version():
+    safe_cache(None, _bump, ANALYTICS_VERSION_KEY)
+
+
+def analytics_key(version, scope, kind, unit):
+    return ANALYTICS_KEY.format(version=version, scope=scope, kind=kind, start=unit[0], end=unit[1])
+
+
+def forget_analytics(scope, kind, units):
+    """Drop cached units that were computed before their data changed."""
+    version = analytics_version()
+    if version is not None and units:
+        safe_cache(None, cache.delete_many, [analytics_key(version, scope, kind, unit) for unit in units])
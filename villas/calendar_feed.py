@@ -0,0 +1,142 @@
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+
+from django.core import signing
+from django.core.cache import cache
+from django.utils import timezone
+
+from .cache import safe_cache, property_versions
+from .models import Booking, Property
+
+
+# iCalendar feeds of approved bookings. Each property's VEVENT block is
+# rendered once per property version (bumped on every booking change) and
+# reused by the property feed and by every agent feed that includes it.
+CONTENT_TYPE = 'text/calendar; charset=utf-8'
+PRODID = '-//Eastmond Villa//Bookings//EN'
+EVENTS_KEY = 'villas:calendar:{pk}:{version}'
+EVENTS_TIMEOUT = 60 * 60 * 24
+# approved stays that ended longer ago than this are left out
+PAST_DAYS = 90
+AGENT_FEED_SALT = 'villas.calendar.agent'
+
+
+def _escape(text):
+    return (
+        text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def _fold(line):
+    # RFC 5545: content lines longer than 75 octets continue on lines starting with a space
+    raw = line.encode('utf-8')
+    if len(raw) <= 75:
+        return line
+    parts, start = [], 0
+    while start < len(raw):
+        end = min(start + (75 if not parts else 74), len(raw))
+        # never split a multi-byte character
+        while end < len(raw) and (raw[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(raw[start:end].decode('utf-8'))
+        start = end
+    return '\r\n '.join(parts)
+
+
+def render_events(title, bookings):
+    """VEVENT lines for (id, check_in, check_out, created_at) rows of one property."""
+    lines = []
+    for booking_id, check_in, check_out, created_at in bookings:
+        lines += [
+            'BEGIN:VEVENT',
+            f'UID:booking-{booking_id}@eastmondvilla',
+            f"DTSTAMP:{created_at.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')}",
+            f"DTSTART;VALUE=DATE:{check_in.strftime('%Y%m%d')}",
+            # the check-out day stays blocked (no same-day turnover), and DTEND is exclusive
+            f"DTEND;VALUE=DATE:{(check_out + timedelta(days=1)).strftime('%Y%m%d')}",
+            _fold(f'SUMMARY:{_escape(f"Booked - {title}")}'),
+            'TRANSP:OPAQUE',
+            'END:VEVENT',
+        ]
+    return ''.join(f'{line}\r\n' for line in lines)
+
+
+def render_calendar(name, blocks):
+    head = ['BEGIN:VCALENDAR', 'VERSION:2.0', f'PRODID:{PRODID}', 'CALSCALE:GREGORIAN', 'METHOD:PUBLISH',
+            _fold(f'X-WR-CALNAME:{_escape(name)}')]
+    return ''.join(f'{line}\r\n' for line in head) + ''.join(blocks) + 'END:VCALENDAR\r\n'
+
+
+def property_events(versions):
+    """
+    {pk: (title, VEVENT block)} for {pk: version}. Cached blocks are reused;
+    the rest are rendered with two queries. Unknown properties are left out.
+    """
+    keys = {pk: EVENTS_KEY.format(pk=pk, version=version) for pk, version in versions.items() if version is not None}
+    cached = safe_cache({}, cache.get_many, list(keys.values()))
+    blocks = {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+    missing = [pk for pk in versions if pk not in blocks]
+    if not missing:
+        return blocks
+
+    titles = dict(Property.objects.filter(pk__in=missing).values_list('id', 'title'))
+    rows = {pk: [] for pk in titles}
+    since = timezone.now().date() - timedelta(days=PAST_DAYS)
+    for property_id, *row in Booking.objects.filter(
+        property_id__in=titles, status=Booking.STATUS.Approved, check_out__gte=since,
+    ).order_by('check_in', 'id').values_list('property_id', 'id', 'check_in', 'check_out', 'created_at'):
+        rows[property_id].append(row)
+
+    fresh = {pk: (title, render_events(title, rows[pk])) for pk, title in titles.items()}
+    safe_cache(None, cache.set_many, {keys[pk]: block for pk, block in fresh.items() if pk in keys}, EVENTS_TIMEOUT)
+    blocks.update(fresh)
+    return blocks
+
+
+def feed_etag(versions):
+    if not versions or None in versions.values():
+        return None
+    digest = hashlib.sha1(repr(sorted(versions.items())).encode()).hexdigest()
+    return f'"cal-{digest}"'
+
+
+def property_feed(pk):
+    """(etag or None, callable rendering the feed or None if the property does not exist)."""
+    versions = property_versions([pk])
+
+    def render():
+        blocks = property_events(versions)
+        if pk not in blocks:
+            return None
+        title, events = blocks[pk]
+        return render_calendar(title, [events])
+
+    return feed_etag(versions), render
+
+
+def agent_feed(agent):
+    """Like property_feed(), over every property assigned to `agent`."""
+    ids = sorted(Property.objects.filter(assigned_agent=agent).values_list('id', flat=True))
+    versions = property_versions(ids)
+    # an agent without properties still gets a (stable) empty calendar
+    etag = feed_etag(versions) if ids else f'"cal-agent-{agent.pk}-empty"'
+
+    def render():
+        blocks = property_events(versions)
+        return render_calendar(f'{agent.name} - bookings', [blocks[pk][1] for pk in ids if pk in blocks])
+
+    return etag, render
+
+
+def agent_feed_token(agent_id):
+    """Unguessable path token for an agent's feed; calendar clients cannot send auth headers."""
+    return signing.Signer(salt=AGENT_FEED_SALT).sign(str(agent_id))
+
+
+def agent_id_from_token(token):
+    try:
+        return int(signing.Signer(salt=AGENT_FEED_SALT).unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
@@ -0,0 +1,240 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import requests
+from django.db import transaction
+from django.utils import timezone
+
+from .availability import rebuild_occupancy
+from .models import ExternalCalendarBlock, ExternalCalendarSync, Property
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 8
+DEFAULT_TIMEOUT = 20
+MAX_FEED_BYTES = 5 * 1024 * 1024
+USER_AGENT = 'EastmondVilla-CalendarImport/1.0'
+# our own feeds (villas.calendar_feed) must not come back as external blocks
+OWN_UID_SUFFIX = '@eastmondvilla'
+
+
+class FeedTooLarge(Exception):
+    pass
+
+
+@dataclass
+class FetchResult:
+    property_id: int
+    url: str
+    not_modified: bool = False
+    blocks: dict = field(default_factory=dict)
+    etag: str = ''
+    last_modified: str = ''
+    error: str = ''
+
+
+def _unfold(lines):
+    """Join RFC 5545 continuation lines (leading space or tab) while streaming."""
+    pending = None
+    for raw in lines:
+        line = raw.decode('utf-8', 'replace') if isinstance(raw, bytes) else raw
+        line = line.rstrip('\r\n')
+        if not line:
+            # also absorbs the blank line a CRLF split across chunks leaves behind
+            continue
+        if line[:1] in (' ', '\t') and pending is not None:
+            pending += line[1:]
+            continue
+        if pending is not None:
+            yield pending
+        pending = line
+    if pending is not None:
+        yield pending
+
+
+def _parse_date(value):
+    """(date, has_time) of a DTSTART/DTEND value, or (None, False)."""
+    try:
+        if 'T' in value:
+            return datetime.strptime(value[:15], '%Y%m%dT%H%M%S').date(), value[9:15] != '000000'
+        return datetime.strptime(value[:8], '%Y%m%d').date(), False
+    except ValueError:
+        return None, False
+
+
+def _unescape(text):
+    return text.replace('\\n', ' ').replace('\\N', ' ').replace('\\,', ',').replace('\\;', ';').replace('\\\\', '\\')
+
+
+def parse_ics(lines):
+    """
+    Yield (uid, start, end, summary) for the VEVENTs in an iterable of ICS
+    lines, one event at a time. `end` is inclusive: an all-day DTEND is
+    exclusive, so the last blocked day is the one before it. Cancelled events
+    and events without a UID or start are skipped; recurrence rules are not
+    expanded.
+    """
+    event = None
+    for line in _unfold(lines):
+        if line == 'BEGIN:VEVENT':
+            event = {}
+            continue
+        if event is None:
+            continue
+        if line == 'END:VEVENT':
+            start = event.get('DTSTART')
+            uid = event.get('UID')
+            if start and uid and event.get('STATUS', '').upper() != 'CANCELLED':
+                end, end_has_time = event.get('DTEND', (None, False))
+                if end is None:
+                    end = start[0]
+                elif not end_has_time:
+                    end -= timedelta(days=1)
+                yield uid, start[0], max(end, start[0]), event.get('SUMMARY', '')
+            event = None
+            continue
+
+        name, _, value = line.partition(':')
+        name = name.split(';', 1)[0].upper()
+        if name in ('DTSTART', 'DTEND'):
+            parsed, has_time = _parse_date(value.strip())
+            if parsed is not None:
+                event[name] = (parsed, has_time)
+        elif name == 'UID':
+            event['UID'] = value.strip()[:255]
+        elif name == 'SUMMARY':
+            event['SUMMARY'] = _unescape(value)[:255]
+        elif name == 'STATUS':
+            event['STATUS'] = value.strip()
+
+
+def _limited(lines, limit):
+    read = 0
+    for line in lines:
+        read += len(line)
+        if read > limit:
+            raise FeedTooLarge(f"Feed is larger than {limit} bytes.")
+        yield line
+
+
+def fetch_feed(property_id, url, etag='', last_modified='', timeout=DEFAULT_TIMEOUT):
+    """
+    Conditionally GET one ICS feed and parse it as it streams in. Runs without
+    touching the database, so it is safe in worker threads.
+    """
+    result = FetchResult(property_id=property_id, url=url)
+    if urlsplit(url).scheme not in ('http', 'https'):
+        result.error = "Only http(s) calendar links can be imported."
+        return result
+
+    headers = {'User-Agent': USER_AGENT, 'Accept': 'text/calendar, */*;q=0.5'}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    try:
+        with requests.get(url, headers=headers, timeout=timeout, stream=True) as response:
+            if response.status_code == 304:
+                result.not_modified = True
+                return result
+            response.raise_for_status()
+            for uid, start, end, summary in parse_ics(_limited(response.iter_lines(), MAX_FEED_BYTES)):
+                if uid.endswith(OWN_UID_SUFFIX):
+                    continue
+                result.blocks[uid] = (start, end, summary)
+            result.etag = response.headers.get('ETag', '')[:255]
+            result.last_modified = response.headers.get('Last-Modified', '')[:64]
+    except (requests.RequestException, FeedTooLarge) as exc:
+        result.error = str(exc) or exc.__class__.__name__
+    return result
+
+
+def apply_blocks(property_id, blocks):
+    """
+    Diff `blocks` ({uid: (start, end, summary)}) against the blocks imported
+    before and write only the differences. Returns (added, updated, removed).
+    """
+    existing = {
+        block.uid: block
+        for block in ExternalCalendarBlock.objects.filter(property_id=property_id).only('id', 'uid', 'start', 'end', 'summary')
+    }
+    added, updated = [], []
+    for uid, (start, end, summary) in blocks.items():
+        block = existing.get(uid)
+        if block is None:
+            added.append(ExternalCalendarBlock(property_id=property_id, uid=uid, start=start, end=end, summary=summary))
+        elif (block.start, block.end, block.summary) != (start, end, summary):
+            block.start, block.end, block.summary = start, end, summary
+            updated.append(block)
+    removed = [block.id for uid, block in existing.items() if uid not in blocks]
+
+    if added or updated or removed:
+        with transaction.atomic():
+            ExternalCalendarBlock.objects.filter(id__in=removed).delete()
+            ExternalCalendarBlock.objects.bulk_update(updated, ['start', 'end', 'summary'])
+            ExternalCalendarBlock.objects.bulk_create(added)
+            rebuild_occupancy(property_id)
+    return len(added), len(updated), len(removed)
+
+
+def _record(result, sync, changed):
+    now = timezone.now()
+    sync.url = result.url
+    sync.checked_at = now
+    sync.error = result.error
+    if changed:
+        sync.changed_at = now
+    if not result.error and not result.not_modified:
+        sync.etag, sync.last_modified = result.etag, result.last_modified
+    sync.save()
+
+
+def import_calendars(properties=None, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT):
+    """
+    Import the calendar_link of every property (or of `properties`). Feeds
+    are fetched and parsed by a bounded thread pool; the database is only
+    touched from the calling thread. Returns per-status counts.
+    """
+    full_run = properties is None
+    if full_run:
+        properties = Property.objects.all()
+    targets = dict(
+        properties.exclude(calendar_link__isnull=True).exclude(calendar_link='').values_list('id', 'calendar_link')
+    )
+
+    if full_run:
+        # blocks of properties whose link was removed are stale
+        stale = ExternalCalendarBlock.objects.exclude(property_id__in=targets).values_list('property_id', flat=True)
+        for property_id in set(stale):
+            apply_blocks(property_id, {})
+
+    syncs = {sync.property_id: sync for sync in ExternalCalendarSync.objects.filter(property_id__in=targets)}
+
+    summary = {'changed': 0, 'unchanged': 0, 'not_modified': 0, 'failed': 0}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = []
+        for property_id, url in targets.items():
+            sync = syncs.get(property_id) or ExternalCalendarSync(property_id=property_id, url=url)
+            syncs[property_id] = sync
+            # a new link starts from scratch
+            etag, last_modified = (sync.etag, sync.last_modified) if sync.url == url else ('', '')
+            futures.append(pool.submit(fetch_feed, property_id, url, etag, last_modified, timeout))
+
+        for future in as_completed(futures):
+            result = future.result()
+            changed = False
+            if result.error:
+                logger.warning("Calendar import failed for property %s: %s", result.property_id, result.error)
+                summary['failed'] += 1
+            elif result.not_modified:
+                summary['not_modified'] += 1
+            else:
+                changed = any(apply_blocks(result.property_id, result.blocks))
+                summary['changed' if changed else 'unchanged'] += 1
+            _record(result, syncs[result.property_id], changed)
+    return summary
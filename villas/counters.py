@@ -0,0 +1,185 @@
+import abc
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .models import AnalyticsEvent, Property
+from .utils import increment_daily_analytics
+
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = ('views', 'bookings', 'downloads')
+
+
+class BackgroundFlusher(abc.ABC):
+    """
+    Base of the in-process write buffers below. With interval > 0 a daemon
+    thread calls flush() every `interval` seconds, and once more at
+    interpreter exit; with interval <= 0 subclasses write straight through.
+    Without an explicit interval, settings.ANALYTICS_FLUSH_INTERVAL is read
+    on every use, so override_settings applies to the shared buffers too.
+    """
+
+    def __init__(self, interval=None):
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def interval(self):
+        if self._interval is not None:
+            return self._interval
+        return settings.ANALYTICS_FLUSH_INTERVAL
+
+    @abc.abstractmethod
+    def flush(self):
+        """Write everything buffered so far. Returns the number of items written."""
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=f'{type(self).__name__}-flush', daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        # keeps draining at least once a second if the interval drops to 0
+        while not self._stop.wait(self.interval if self.interval > 0 else 1):
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("%s flush failed", type(self).__name__)
+        connection.close()
+
+    def stop(self):
+        """Stop the flush thread and write what is left (runs at shutdown)."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(self.interval, 1) + 5)
+        self.flush()
+
+
+class CounterBuffer(BackgroundFlusher):
+    """
+    Buffer of DailyAnalytics increments. add() only bumps an in-memory
+    counter under a lock; flush() swaps the counters out and writes them as
+    one atomic upsert (F(field) + n) per day and field.
+
+    A failed write puts its counts back, so increments are delayed, never lost.
+    """
+
+    def __init__(self, interval=None):
+        super().__init__(interval)
+        self._counts = Counter()
+
+    def add(self, property_id, field, n=1):
+        if field not in COUNTER_FIELDS or not n:
+            return
+        if self.interval <= 0:
+            # write-through: the caller just loaded the property, so skip flush()'s bookkeeping
+            increment_daily_analytics({property_id: n}, field)
+            return
+        with self._lock:
+            self._counts[(timezone.now().date(), field, property_id)] += n
+        if self._thread is None:
+            self._start()
+
+    def pending(self):
+        with self._lock:
+            return sum(self._counts.values())
+
+    def flush(self):
+        """Write everything buffered so far. Returns the number of increments written."""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return 0
+
+        try:
+            # counts for properties deleted in the meantime are dropped
+            existing = set(Property.objects.filter(pk__in={key[2] for key in counts}).values_list('pk', flat=True))
+        except Exception:
+            logger.warning("Could not flush analytics counters, will retry", exc_info=True)
+            with self._lock:
+                self._counts.update(counts)
+            return 0
+
+        groups = {}
+        for (day, field, property_id), n in counts.items():
+            if property_id in existing:
+                groups.setdefault((day, field), {})[property_id] = n
+
+        written = 0
+        for (day, field), per_property in groups.items():
+            try:
+                with transaction.atomic():
+                    increment_daily_analytics(per_property, field, day)
+            except Exception:
+                logger.warning("Could not flush %s counters for %s, will retry", field, day, exc_info=True)
+                self._restore(day, field, per_property)
+            else:
+                written += sum(per_property.values())
+        return written
+
+    def _restore(self, day, field, per_property):
+        with self._lock:
+            for property_id, n in per_property.items():
+                self._counts[(day, field, property_id)] += n
+
+
+class EventBuffer(BackgroundFlusher):
+    """
+    Buffer of AnalyticsEvent rows, written with one bulk INSERT per flush.
+    Events of properties deleted in the meantime are dropped; a failed write
+    puts the batch back.
+    """
+    BATCH_SIZE = 500
+
+    def __init__(self, interval=None):
+        super().__init__(interval)
+        self._events = []
+
+    def add(self, event):
+        if self.interval <= 0:
+            event.save(force_insert=True)
+            return
+        with self._lock:
+            self._events.append(event)
+        if self._thread is None:
+            self._start()
+
+    def pending(self):
+        with self._lock:
+            return len(self._events)
+
+    def flush(self):
+        """Write everything buffered so far. Returns the number of events written."""
+        with self._lock:
+            events, self._events = self._events, []
+        if not events:
+            return 0
+        try:
+            existing = set(
+                Property.objects.filter(pk__in={event.property_id for event in events}).values_list('pk', flat=True)
+            )
+            events = [event for event in events if event.property_id in existing]
+            AnalyticsEvent.objects.bulk_create(events, batch_size=self.BATCH_SIZE)
+        except Exception:
+            logger.warning("Could not flush %s analytics events, will retry", len(events), exc_info=True)
+            with self._lock:
+                self._events[:0] = events
+            return 0
+        return len(events)
+
+
+analytics_buffer = CounterBuffer()
+event_buffer = EventBuffer()
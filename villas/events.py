@@ -0,0 +1,194 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+
+from .cache import bump_analytics_version
+from .hll import HyperLogLog
+from .models import AnalyticsEvent, AnalyticsWatermark, DailyAnalytics, SiteVisitorSketch, VisitorSketch
+
+
+EVENT_TYPES = {
+    'views': AnalyticsEvent.EventType.VIEW,
+    'bookings': AnalyticsEvent.EventType.BOOKING,
+    'downloads': AnalyticsEvent.EventType.DOWNLOAD,
+}
+ROLLUP_WATERMARK = 'daily_rollup'
+DEFAULT_BATCH_SIZE = 5000
+# Ids are handed out at insert time, so on PostgreSQL a lower id can become
+# visible after a higher one, and buffered events are inserted up to one flush
+# interval after their created_at. Events younger than this are left for the
+# next run instead of being skipped for good by the watermark.
+DEFAULT_SETTLE = timedelta(seconds=30 + 2 * settings.ANALYTICS_FLUSH_INTERVAL)
+VISITOR_SALT = 'villas.analytics.visitor'
+
+
+def _client_ip(request):
+    # X-Forwarded-For is whatever the client sent plus one entry per proxy;
+    # only the entries added by our own TRUSTED_PROXY_COUNT proxies are real
+    proxies = getattr(settings, 'TRUSTED_PROXY_COUNT', 0)
+    if proxies > 0:
+        forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def visitor_id(request=None, user_id=None, email=None):
+    """
+    'user:<pk>' for signed-in users; otherwise a keyed hash of the email or
+    of the client address and user agent, so no raw identifier is stored.
+    """
+    if user_id is None and request is not None and request.user.is_authenticated:
+        user_id = request.user.pk
+    if user_id is not None:
+        return f'user:{user_id}'
+    if email:
+        basis = email.strip().lower()
+    elif request is not None:
+        basis = f"{_client_ip(request)}|{request.META.get('HTTP_USER_AGENT', '')}"
+    else:
+        basis = ''
+    return 'anon:' + salted_hmac(VISITOR_SALT, basis).hexdigest()[:32]
+
+
+def record_event(property_id, field, request=None, user_id=None, email=None):
+    """Queue one AnalyticsEvent for a counted view, booking or download."""
+    from .counters import event_buffer
+
+    if field not in EVENT_TYPES:
+        return
+    if user_id is None and request is not None and request.user.is_authenticated:
+        user_id = request.user.pk
+    referrer = request.META.get('HTTP_REFERER', '')[:500] if request is not None else ''
+    event_buffer.add(AnalyticsEvent(
+        event_type=EVENT_TYPES[field],
+        property_id=property_id,
+        user_id=user_id,
+        visitor_id=visitor_id(request, user_id, email),
+        referrer=referrer,
+        created_at=timezone.now(),
+    ))
+
+
+def _sketch(registers, visitors):
+    hll = HyperLogLog(registers)
+    for visitor in visitors:
+        hll.add(visitor)
+    return hll
+
+
+def rollup_batch(batch_size=DEFAULT_BATCH_SIZE, settle=DEFAULT_SETTLE):
+    """
+    Fold the next `batch_size` events after the watermark into the per-day
+    VisitorSketch and SiteVisitorSketch rows and DailyAnalytics.unique_visitors,
+    and move the watermark past them, in one transaction. Returns the number
+    of events read.
+
+    The view/booking/download counters are not derived here: villas.counters
+    maintains them as the events happen, and they predate (and outlive) the
+    event log, which is pruned. The log is the source of unique visitors only.
+    """
+    from .analytics import forget_visitor_days
+
+    cutoff = timezone.now() - settle
+    with transaction.atomic():
+        watermark, _ = AnalyticsWatermark.objects.select_for_update().get_or_create(name=ROLLUP_WATERMARK)
+        rows = list(
+            AnalyticsEvent.objects.filter(id__gt=watermark.last_event_id, created_at__lte=cutoff)
+            .order_by('id').values_list('id', 'property_id', 'created_at', 'visitor_id')[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        visitors = {}
+        for _, property_id, created_at, visitor in rows:
+            visitors.setdefault((property_id, created_at.date()), set()).add(visitor)
+
+        property_ids = {property_id for property_id, _ in visitors}
+        days = {day for _, day in visitors}
+        sketches = {
+            (sketch.property_id, sketch.date): sketch
+            for sketch in VisitorSketch.objects.filter(property_id__in=property_ids, date__in=days)
+            if (sketch.property_id, sketch.date) in visitors
+        }
+        estimates = {}
+        added = []
+        for key, ids in visitors.items():
+            sketch = sketches.get(key)
+            hll = _sketch(sketch.registers if sketch else None, ids)
+            if sketch is None:
+                added.append(VisitorSketch(property_id=key[0], date=key[1], registers=hll.to_bytes()))
+            else:
+                sketch.registers = hll.to_bytes()
+            estimates[key] = hll.count()
+        VisitorSketch.objects.bulk_update(sketches.values(), ['registers'])
+        VisitorSketch.objects.bulk_create(added)
+
+        site_visitors = {}
+        for (_, day), ids in visitors.items():
+            site_visitors.setdefault(day, set()).update(ids)
+        site_sketches = {sketch.date: sketch for sketch in SiteVisitorSketch.objects.filter(date__in=days)}
+        added = []
+        for day, ids in site_visitors.items():
+            sketch = site_sketches.get(day)
+            registers = _sketch(sketch.registers if sketch else None, ids).to_bytes()
+            if sketch is None:
+                added.append(SiteVisitorSketch(date=day, registers=registers))
+            else:
+                sketch.registers = registers
+        SiteVisitorSketch.objects.bulk_update(site_sketches.values(), ['registers'])
+        SiteVisitorSketch.objects.bulk_create(added)
+
+        DailyAnalytics.objects.bulk_create(
+            [DailyAnalytics(property_id=property_id, date=day) for property_id, day in visitors],
+            ignore_conflicts=True,
+        )
+        daily = [
+            row for row in DailyAnalytics.objects.filter(property_id__in=property_ids, date__in=days).only('id', 'property_id', 'date')
+            if (row.property_id, row.date) in estimates
+        ]
+        for row in daily:
+            row.unique_visitors = estimates[(row.property_id, row.date)]
+        DailyAnalytics.objects.bulk_update(daily, ['unique_visitors'])
+
+        watermark.last_event_id = rows[-1][0]
+        watermark.save(update_fields=['last_event_id', 'updated_at'])
+        transaction.on_commit(lambda: forget_visitor_days(days))
+    return len(rows)
+
+
+def rollup_events(batch_size=DEFAULT_BATCH_SIZE, max_batches=None, settle=DEFAULT_SETTLE):
+    """Roll up in batches until caught up (or `max_batches` ran). Returns the number of events read."""
+    processed = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = rollup_batch(batch_size, settle)
+        if not count:
+            break
+        processed += count
+        batches += 1
+    return processed
+
+
+def reset_rollup():
+    """
+    Forget all sketches and start the rollup over from the first event still
+    in the log. The counters are left alone (see rollup_batch()).
+    """
+    with transaction.atomic():
+        VisitorSketch.objects.all().delete()
+        SiteVisitorSketch.objects.all().delete()
+        DailyAnalytics.objects.filter(unique_visitors__gt=0).update(unique_visitors=0)
+        AnalyticsWatermark.objects.filter(name=ROLLUP_WATERMARK).update(last_event_id=0)
+        transaction.on_commit(bump_analytics_version)
+
+
+def prune_events(before):
+    """Delete rolled-up events created before `before`. Returns the number deleted."""
+    watermark = AnalyticsWatermark.objects.filter(name=ROLLUP_WATERMARK).values_list('last_event_id', flat=True).first()
+    if not watermark:
+        return 0
+    deleted, _ = AnalyticsEvent.objects.filter(id__lte=watermark, created_at__lt=before).delete()
+    return deleted
@@ -1,5 +1,10 @@
 from django_filters import rest_framework as filters
-from .models import Property
+from django.db.models import Count, Exists, OuterRef
+from django.utils.text import slugify
+from rest_framework import serializers
+from .models import Property, PropertyAmenity
+from .geo import bbox_q, haversine_km, parse_coordinates, radius_bbox
+from .utils import approved_overlapping, external_blocks_overlapping
 from datetime import date
 
 class PropertyFilter(filters.FilterSet):
@@ -13,6 +18,86 @@ class PropertyFilter(filters.FilterSet):
 
     guests = filters.NumberFilter(field_name="add_guest", lookup_expr='gte')
 
+    # ?amenities=wifi,pool_private&amenities_match=any (default: all)
+    amenities = filters.CharFilter(method='filter_amenities')
+    amenities_match = filters.ChoiceFilter(choices=[('all', 'All'), ('any', 'Any')], method='filter_noop')
+
+    # ?near=lat,lng&radius_km=25 (sorted by distance) and ?bbox=west,south,east,north
+    near = filters.CharFilter(method='filter_near')
+    radius_km = filters.NumberFilter(method='filter_noop')
+    bbox = filters.CharFilter(method='filter_bbox')
+
+    # ?check_in=2026-01-10&check_out=2026-01-17: hide villas with an overlapping approved booking
+    check_in = filters.DateFilter(method='filter_available')
+    check_out = filters.DateFilter(method='filter_check_out')
+
     class Meta:
         model = Property
-        fields = ['title', 'min_price', 'max_price', 'min_beds', 'min_baths', 'guests']
\ No newline at end of file
+        fields = [
+            'title', 'min_price', 'max_price', 'min_beds', 'min_baths', 'guests', 'amenities', 'amenities_match',
+            'near', 'radius_km', 'bbox', 'check_in', 'check_out',
+        ]
+
+    def filter_amenities(self, queryset, name, value):
+        keys = {slugify(key).replace('-', '_') for key in value.split(',')} - {''}
+        if not keys:
+            return queryset
+
+        matches = PropertyAmenity.objects.filter(key__in=keys)
+        if self.data.get('amenities_match') == 'any':
+            return queryset.filter(Exists(matches.filter(property=OuterRef('pk'))))
+
+        with_all = (
+            matches.values('property')
+            .annotate(n=Count('key', distinct=True))
+            .filter(n=len(keys))
+            .values('property')
+        )
+        return queryset.filter(pk__in=with_all)
+
+    def filter_near(self, queryset, name, value):
+        coords = parse_coordinates(value, 2)
+        if not coords or not (-90 <= coords[0] <= 90 and -180 <= coords[1] <= 180):
+            raise serializers.ValidationError({"near": "Expected 'lat,lng'."})
+        lat, lng = coords
+
+        queryset = queryset.annotate(distance_km=haversine_km(lat, lng))
+        radius = self.form.cleaned_data.get('radius_km')
+        if radius is not None:
+            if radius <= 0:
+                raise serializers.ValidationError({"radius_km": "Must be greater than 0."})
+            # bounding-box prefilter hits the (geo_lat, geo_lng) index,
+            # exact haversine only runs on the remaining candidates
+            queryset = queryset.filter(bbox_q(*radius_bbox(lat, lng, float(radius))))
+            queryset = queryset.filter(distance_km__lte=float(radius))
+        else:
+            queryset = queryset.filter(geo_lat__isnull=False)
+        return queryset.order_by('distance_km', 'id')
+
+    def filter_bbox(self, queryset, name, value):
+        coords = parse_coordinates(value, 4)
+        if not coords:
+            raise serializers.ValidationError({"bbox": "Expected 'west,south,east,north'."})
+        west, south, east, north = coords
+        return queryset.filter(bbox_q(south, west, north, east))
+
+    def filter_available(self, queryset, name, value):
+        check_out = self.form.cleaned_data.get('check_out')
+        if check_out is None:
+            raise serializers.ValidationError({"check_out": "check_out is required together with check_in."})
+        if check_out <= value:
+            raise serializers.ValidationError({"check_out": "Check-out date must be after check-in date."})
+
+        # NOT EXISTS anti-joins, served by the Booking and external block overlap indexes
+        booked = approved_overlapping(value, check_out).filter(property=OuterRef('pk'))
+        blocked = external_blocks_overlapping(value, check_out).filter(property=OuterRef('pk'))
+        return queryset.filter(~Exists(booked), ~Exists(blocked))
+
+    def filter_check_out(self, queryset, name, value):
+        # applied by filter_available(); on its own it would filter nothing
+        if self.form.cleaned_data.get('check_in') is None:
+            raise serializers.ValidationError({"check_in": "check_in is required together with check_out."})
+        return queryset
+
+    def filter_noop(self, queryset, name, value):
+        return queryset
\ No newline at end of file
@@ -0,0 +1,59 @@
+import math
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.045
+
+
+def radius_bbox(lat, lng, radius_km):
+    """(south, west, north, east) box that contains every point within `radius_km`."""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    south, north = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+
+    cos_lat = math.cos(math.radians(lat))
+    if south <= -90.0 or north >= 90.0 or cos_lat < 1e-6:
+        return south, -180.0, north, 180.0
+    dlng = radius_km / (KM_PER_DEGREE_LAT * cos_lat)
+    if dlng >= 180.0:
+        return south, -180.0, north, 180.0
+
+    west, east = lng - dlng, lng + dlng
+    # wrap across the antimeridian; bbox_q treats west > east as wrapped
+    if west < -180.0:
+        west += 360.0
+    if east > 180.0:
+        east -= 360.0
+    return south, west, north, east
+
+
+def bbox_q(south, west, north, east):
+    """Index-friendly range predicate over the float coordinate columns."""
+    q = Q(geo_lat__gte=south, geo_lat__lte=north)
+    if west <= east:
+        return q & Q(geo_lng__gte=west, geo_lng__lte=east)
+    return q & (Q(geo_lng__gte=west) | Q(geo_lng__lte=east))
+
+
+def haversine_km(lat, lng):
+    """Great-circle distance in km from (lat, lng) to each row's coordinates."""
+    lat1 = Radians(Value(lat, output_field=FloatField()))
+    lat2 = Radians(F('geo_lat'))
+    dlat = Radians(F('geo_lat') - Value(lat, output_field=FloatField())) / 2
+    dlng = Radians(F('geo_lng') - Value(lng, output_field=FloatField())) / 2
+    a = Power(Sin(dlat), 2) + Cos(lat1) * Cos(lat2) * Power(Sin(dlng), 2)
+    # clamp rounding noise so ASIN never leaves its domain
+    return Value(2 * EARTH_RADIUS_KM, output_field=FloatField()) * ASin(Least(Sqrt(a), Value(1.0)))
+
+
+def parse_coordinates(raw, count):
+    """Parse 'a,b,...' into `count` floats, or return None."""
+    try:
+        values = [float(part) for part in raw.split(',')]
+    except (AttributeError, ValueError):
+        return None
+    if len(values) != count or not all(math.isfinite(v) for v in values):
+        return None
+    return values
@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from villas.archive import DEFAULT_BATCH_SIZE, archivable_bookings, archive_bookings
+
+
+class Command(BaseCommand):
+    help = 'Move old completed, cancelled and rejected bookings into the booking archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=365, help='Archive stays that ended more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Bookings moved per transaction')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+
+    def handle(self, *args, **options):
+        before = timezone.now().date() - timedelta(days=options['older_than_days'])
+
+        if options['dry_run']:
+            count = archivable_bookings(before).count()
+            self.stdout.write(f'{count} bookings would be archived (check-out before {before})')
+            return
+
+        moved = archive_bookings(before, max(1, options['batch_size']), options['max_batches'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Archived {moved} bookings (check-out before {before})'))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from villas.calendar_import import DEFAULT_TIMEOUT, DEFAULT_WORKERS, import_calendars
+from villas.models import Property
+
+
+class Command(BaseCommand):
+    help = 'Import blocked dates from the external ICS calendars in Property.calendar_link'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--property',
+            type=int,
+            action='append',
+            dest='property_ids',
+            help='Only import the given property id (can be repeated)'
+        )
+        parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Feeds fetched concurrently')
+        parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='Per-request timeout in seconds')
+
+    def handle(self, *args, **options):
+        properties = None
+        if options['property_ids']:
+            properties = Property.objects.filter(pk__in=options['property_ids'])
+
+        summary = import_calendars(properties, workers=options['workers'], timeout=options['timeout'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Imported calendars: {summary['changed']} changed, {summary['unchanged']} unchanged, "
+            f"{summary['not_modified']} not modified, {summary['failed']} failed"
+        ))
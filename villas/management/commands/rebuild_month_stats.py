@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from villas.models import Property
+from villas.rollups import rebuild_month_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the property-month occupancy and revenue rollup from approved bookings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--property',
+            type=int,
+            action='append',
+            dest='property_ids',
+            help='Only rebuild the given property id (can be repeated)'
+        )
+        parser.add_argument('--batch-size', type=int, default=200, help='Properties rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        properties = Property.objects.order_by('pk')
+        if options['property_ids']:
+            properties = properties.filter(pk__in=options['property_ids'])
+
+        ids = list(properties.values_list('pk', flat=True))
+        batch_size = max(1, options['batch_size'])
+        rows = 0
+        for start in range(0, len(ids), batch_size):
+            rows += rebuild_month_stats(ids[start:start + batch_size])
+        self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt month stats ({len(ids)} properties, {rows} rows)'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from villas.models import Property
+from villas.utils import rebuild_review_counters
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized review counters (review_count, rating_sum, avg_rating) on properties'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--property',
+            type=int,
+            action='append',
+            dest='property_ids',
+            help='Only rebuild the given property id (can be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        properties = Property.objects.all()
+        if options['property_ids']:
+            properties = properties.filter(pk__in=options['property_ids'])
+
+        updated = rebuild_review_counters(properties)
+        self.stdout.write(self.style.SUCCESS(f'✓ Rebuilt review counters ({updated} properties changed)'))
@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from villas.analytics import close_days, reset_periods
+from villas.events import DEFAULT_BATCH_SIZE, DEFAULT_SETTLE, prune_events, reset_rollup, rollup_events
+
+
+class Command(BaseCommand):
+    help = 'Roll new analytics events up into unique-visitor sketches and fold closed days into the weekly/monthly rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Events read per transaction')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+        parser.add_argument('--settle-seconds', type=int, default=int(DEFAULT_SETTLE.total_seconds()),
+                            help='Leave events younger than this for the next run')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Drop all sketches and period rollups and rebuild them from the events still '
+                                 'in the log; the view/booking/download counters are kept as they are')
+        parser.add_argument('--prune-days', type=int, default=None,
+                            help='Afterwards, delete rolled-up events older than this many days')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            reset_rollup()
+            reset_periods()
+
+        settle = timedelta(seconds=max(0, options['settle_seconds']))
+        processed = rollup_events(max(1, options['batch_size']), options['max_batches'], settle)
+        self.stdout.write(self.style.SUCCESS(f'✓ Rolled up {processed} analytics events'))
+
+        closed = close_days((timezone.now() - settle).date() - timedelta(days=1))
+        self.stdout.write(self.style.SUCCESS(f'✓ Closed {closed} days into the weekly and monthly rollups'))
+
+        if options['prune_days'] is not None:
+            pruned = prune_events(timezone.now() - timedelta(days=options['prune_days']))
+            self.stdout.write(self.style.SUCCESS(f'✓ Pruned {pruned} rolled-up events'))
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:39
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_review_counters(apps, schema_editor):
+    Property = apps.get_model('villas', 'Property')
+    Review = apps.get_model('villas', 'Review')
+
+    totals = (
+        Review.objects.filter(status='approved')
+        .values('property')
+        .annotate(count=Count('id'), total=Sum('rating'))
+    )
+    for row in totals:
+        Property.objects.filter(pk=row['property']).update(
+            review_count=row['count'],
+            rating_sum=row['total'],
+            avg_rating=round(Decimal(row['total']) / row['count'], 2),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0024_alter_property_bathrooms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='avg_rating',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_review_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,87 @@
+from django.db import migrations
+
+
+# Frozen copy of the index definition in villas.search at the time of this
+# migration; later edits there must not change what this migration does.
+FTS_TABLE = 'villas_property_fts'
+FTS_COLUMNS = "title, city, description, amenities"
+FTS_VALUES = "{row}.title, {row}.city, {row}.description, {row}.interior_amenities || ' ' || {row}.outdoor_amenities"
+
+SQLITE_FTS_TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON villas_property BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {FTS_COLUMNS}) VALUES (new.id, {FTS_VALUES.format(row='new')});
+        END
+    """,
+    f'{FTS_TABLE}_au': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+        AFTER UPDATE OF title, city, description, interior_amenities, outdoor_amenities ON villas_property BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+            INSERT INTO {FTS_TABLE}(rowid, {FTS_COLUMNS}) VALUES (new.id, {FTS_VALUES.format(row='new')});
+        END
+    """,
+    f'{FTS_TABLE}_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON villas_property BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        END
+    """,
+}
+
+SQLITE_FORWARD = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({FTS_COLUMNS}, tokenize = 'porter unicode61')",
+    *SQLITE_FTS_TRIGGERS.values(),
+    f"DELETE FROM {FTS_TABLE}",
+    f"INSERT INTO {FTS_TABLE}(rowid, {FTS_COLUMNS}) SELECT id, {FTS_VALUES.format(row='villas_property')} FROM villas_property",
+]
+
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE villas_property ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english'::regconfig, coalesce(city, '')), 'A') ||
+        setweight(jsonb_to_tsvector('english'::regconfig, coalesce(interior_amenities, '{}'::jsonb), '["key", "string"]'), 'B') ||
+        setweight(jsonb_to_tsvector('english'::regconfig, coalesce(outdoor_amenities, '{}'::jsonb), '["key", "string"]'), 'B') ||
+        setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX villas_property_search_idx ON villas_property USING GIN (search_vector)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS villas_property_search_idx",
+    "ALTER TABLE villas_property DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def forwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for sql in POSTGRES_FORWARD:
+            schema_editor.execute(sql)
+    elif vendor == 'sqlite':
+        for sql in SQLITE_FORWARD:
+            schema_editor.execute(sql)
+
+
+def backwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for sql in POSTGRES_BACKWARD:
+            schema_editor.execute(sql)
+    elif vendor == 'sqlite':
+        for name in SQLITE_FTS_TRIGGERS:
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0026_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
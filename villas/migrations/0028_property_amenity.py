@@ -0,0 +1,72 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+SOURCE_FIELDS = {
+    'outdoor': 'outdoor_amenities',
+    'interior': 'interior_amenities',
+    'concierge': 'concierge_services',
+}
+
+
+def amenity_keys(value):
+    # frozen copy of villas.models.amenity_keys at the time of this migration
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, (list, tuple)):
+        items = ((name, True) for name in value if isinstance(name, str))
+    else:
+        return set()
+
+    keys = set()
+    for name, flag in items:
+        key = slugify(str(name)).replace('-', '_')[:100]
+        if not key or not flag:
+            continue
+        keys.add(key)
+        if isinstance(flag, str):
+            suffix = slugify(flag).replace('-', '_')
+            if suffix:
+                keys.add(f"{key}_{suffix}"[:120])
+    return keys
+
+
+def backfill_amenities(apps, schema_editor):
+    Property = apps.get_model('villas', 'Property')
+    PropertyAmenity = apps.get_model('villas', 'PropertyAmenity')
+
+    rows = []
+    for prop in Property.objects.only('id', *SOURCE_FIELDS.values()).iterator():
+        for source, field in SOURCE_FIELDS.items():
+            rows.extend(
+                PropertyAmenity(property_id=prop.id, source=source, key=key)
+                for key in amenity_keys(getattr(prop, field))
+            )
+    PropertyAmenity.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0027_property_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertyAmenity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('outdoor', 'Outdoor'), ('interior', 'Interior'), ('concierge', 'Concierge')], max_length=20)),
+                ('key', models.CharField(max_length=120)),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='amenities', to='villas.property')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', 'property'], name='villas_amenity_key_prop_idx')],
+                'unique_together': {('property', 'source', 'key')},
+            },
+        ),
+        migrations.RunPython(backfill_amenities, migrations.RunPython.noop),
+    ]
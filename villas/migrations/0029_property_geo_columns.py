@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_geo_columns(apps, schema_editor):
+    Property = apps.get_model('villas', 'Property')
+    rows = Property.objects.filter(latitude__isnull=False, longitude__isnull=False).only('id', 'latitude', 'longitude')
+    for prop in rows.iterator():
+        Property.objects.filter(pk=prop.pk).update(geo_lat=float(prop.latitude), geo_lng=float(prop.longitude))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0028_property_amenity'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='geo_lat',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='geo_lng',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['geo_lat', 'geo_lng'], name='villas_prop_geo_idx'),
+        ),
+        migrations.RunPython(backfill_geo_columns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0029_property_geo_columns'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['property', 'status', 'check_in', 'check_out'], name='villas_book_overlap_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:47
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_primary_image(apps, schema_editor):
+    Property = apps.get_model('villas', 'Property')
+    PropertyImage = apps.get_model('villas', 'PropertyImage')
+
+    first_image = PropertyImage.objects.filter(property=OuterRef('pk')).order_by('id').values('image')[:1]
+    Property.objects.update(primary_image=Coalesce(Subquery(first_image), Value('')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0030_booking_overlap_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='primary_image',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_primary_image, migrations.RunPython.noop),
+    ]
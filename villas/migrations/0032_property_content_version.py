@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0031_property_primary_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='content_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
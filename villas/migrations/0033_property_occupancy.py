@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0032_property_content_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertyOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('intervals', models.JSONField(blank=True, default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('property', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='villas.property')),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+# PostgreSQL only: no two approved bookings of a property may share a day
+# (check-out day included, matching validate_date_range). Existing
+# overlapping approved bookings must be resolved before this migration runs.
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    """
+    ALTER TABLE villas_booking ADD CONSTRAINT villas_booking_no_approved_overlap
+    EXCLUDE USING gist (property_id WITH =, daterange(check_in, check_out, '[]') WITH &&)
+    WHERE (status = 'approved')
+    """,
+]
+
+POSTGRES_BACKWARD = [
+    "ALTER TABLE villas_booking DROP CONSTRAINT IF EXISTS villas_booking_no_approved_overlap",
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0033_property_occupancy'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(POSTGRES_FORWARD), _run(POSTGRES_BACKWARD)),
+    ]
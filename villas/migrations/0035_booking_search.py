@@ -0,0 +1,100 @@
+# Generated by Django 5.2.7 on 2026-10-18 19:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Frozen copy of the booking index definition in villas.search at the time
+# of this migration; later edits there must not change what this migration does.
+BOOKING_FTS_TABLE = 'villas_booking_fts'
+BOOKING_FTS_COLUMNS = "full_name, email, phone, phone_digits"
+BOOKING_FTS_VALUES = (
+    "{row}.full_name, {row}.email, {row}.phone, "
+    "replace(replace(replace(replace(replace(replace({row}.phone, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', '')"
+)
+
+SQLITE_BOOKING_FTS_TRIGGERS = {
+    f'{BOOKING_FTS_TABLE}_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS {BOOKING_FTS_TABLE}_ai AFTER INSERT ON villas_booking BEGIN
+            INSERT INTO {BOOKING_FTS_TABLE}(rowid, {BOOKING_FTS_COLUMNS}) VALUES (new.id, {BOOKING_FTS_VALUES.format(row='new')});
+        END
+    """,
+    f'{BOOKING_FTS_TABLE}_au': f"""
+        CREATE TRIGGER IF NOT EXISTS {BOOKING_FTS_TABLE}_au
+        AFTER UPDATE OF full_name, email, phone ON villas_booking BEGIN
+            DELETE FROM {BOOKING_FTS_TABLE} WHERE rowid = old.id;
+            INSERT INTO {BOOKING_FTS_TABLE}(rowid, {BOOKING_FTS_COLUMNS}) VALUES (new.id, {BOOKING_FTS_VALUES.format(row='new')});
+        END
+    """,
+    f'{BOOKING_FTS_TABLE}_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS {BOOKING_FTS_TABLE}_ad AFTER DELETE ON villas_booking BEGIN
+            DELETE FROM {BOOKING_FTS_TABLE} WHERE rowid = old.id;
+        END
+    """,
+}
+
+SQLITE_FORWARD = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {BOOKING_FTS_TABLE} USING fts5({BOOKING_FTS_COLUMNS}, tokenize = 'trigram')",
+    *SQLITE_BOOKING_FTS_TRIGGERS.values(),
+    f"DELETE FROM {BOOKING_FTS_TABLE}",
+    f"INSERT INTO {BOOKING_FTS_TABLE}(rowid, {BOOKING_FTS_COLUMNS}) "
+    f"SELECT id, {BOOKING_FTS_VALUES.format(row='villas_booking')} FROM villas_booking",
+]
+
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    ALTER TABLE villas_booking ADD COLUMN search_text text
+    GENERATED ALWAYS AS (
+        lower(full_name || ' ' || email || ' ' || phone || ' ' || regexp_replace(phone, '[^0-9]', '', 'g'))
+    ) STORED
+    """,
+    "CREATE INDEX villas_booking_search_idx ON villas_booking USING GIN (search_text gin_trgm_ops)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS villas_booking_search_idx",
+    "ALTER TABLE villas_booking DROP COLUMN IF EXISTS search_text",
+]
+
+
+def forwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for sql in POSTGRES_FORWARD:
+            schema_editor.execute(sql)
+    elif vendor == 'sqlite':
+        for sql in SQLITE_FORWARD:
+            schema_editor.execute(sql)
+
+
+def backwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for sql in POSTGRES_BACKWARD:
+            schema_editor.execute(sql)
+    elif vendor == 'sqlite':
+        for name in SQLITE_BOOKING_FTS_TRIGGERS:
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {BOOKING_FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0034_booking_no_approved_overlap'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['check_in'], name='villas_book_check_in_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['check_out'], name='villas_book_check_out_idx'),
+        ),
+        migrations.RunPython(forwards, backwards),
+    ]
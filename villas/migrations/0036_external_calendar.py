@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0035_booking_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExternalCalendarSync',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=500)),
+                ('etag', models.CharField(blank=True, max_length=255)),
+                ('last_modified', models.CharField(blank=True, max_length=64)),
+                ('checked_at', models.DateTimeField(blank=True, null=True)),
+                ('changed_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('property', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='calendar_sync', to='villas.property')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ExternalCalendarBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uid', models.CharField(max_length=255)),
+                ('start', models.DateField()),
+                ('end', models.DateField()),
+                ('summary', models.CharField(blank=True, max_length=255)),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='external_blocks', to='villas.property')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['property', 'start', 'end'], name='villas_extblock_overlap_idx')],
+                'unique_together': {('property', 'uid')},
+            },
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:04
+
+from calendar import monthrange
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+CENT = Decimal('0.01')
+
+
+def _next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def backfill_month_stats(apps, schema_editor):
+    # self-contained copy of the villas.rollups logic at the time of this migration
+    Booking = apps.get_model('villas', 'Booking')
+    PropertyMonthStats = apps.get_model('villas', 'PropertyMonthStats')
+
+    stats = {}
+    bookings = Booking.objects.filter(status='approved').values_list('property_id', 'check_in', 'check_out', 'total_price')
+    for property_id, check_in, check_out, total_price in bookings.iterator():
+        total_nights = (check_out - check_in).days
+        if total_nights <= 0:
+            continue
+        total_price = Decimal(total_price or 0)
+        counted, allocated = 0, Decimal('0')
+        month = check_in.replace(day=1)
+        while month < check_out:
+            nights = (min(check_out, _next_month(month)) - max(check_in, month)).days
+            counted += nights
+            # cumulative rounding, so the shares add up to total_price exactly
+            cumulative = (total_price * counted / total_nights).quantize(CENT, rounding=ROUND_HALF_UP)
+            row = stats.setdefault((property_id, month), {'booked_nights': 0, 'booking_count': 0, 'revenue': Decimal('0')})
+            row['booked_nights'] += nights
+            row['booking_count'] += 1
+            row['revenue'] += cumulative - allocated
+            allocated = cumulative
+            month = _next_month(month)
+
+    rows = []
+    for (property_id, month), values in stats.items():
+        days = monthrange(month.year, month.month)[1]
+        rate = min(Decimal(values['booked_nights'] * 100) / days, Decimal(100)).quantize(CENT, rounding=ROUND_HALF_UP)
+        rows.append(PropertyMonthStats(property_id=property_id, month=month, occupancy_rate=rate, **values))
+    PropertyMonthStats.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0036_external_calendar'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertyMonthStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month.')),
+                ('booked_nights', models.PositiveIntegerField(default=0)),
+                ('occupancy_rate', models.DecimalField(decimal_places=2, default=0, help_text='Booked nights / days in month, in %.', max_digits=5)),
+                ('booking_count', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='month_stats', to='villas.property')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month', 'property'], name='villas_monthstats_month_idx')],
+                'unique_together': {('property', 'month')},
+            },
+        ),
+        migrations.RunPython(backfill_month_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 20:44
+
+from django.db import migrations, models
+
+
+def backfill_site_sketches(apps, schema_editor):
+    # the union of a day's property sketches is their register-wise max
+    VisitorSketch = apps.get_model('villas', 'VisitorSketch')
+    SiteVisitorSketch = apps.get_model('villas', 'SiteVisitorSketch')
+
+    merged = {}
+    for day, registers in VisitorSketch.objects.order_by('date').values_list('date', 'registers').iterator():
+        registers = bytes(registers)
+        merged[day] = bytes(map(max, merged[day], registers)) if day in merged else registers
+    SiteVisitorSketch.objects.bulk_create(
+        [SiteVisitorSketch(date=day, registers=registers) for day, registers in merged.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0041_review_rating_range'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SiteVisitorSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('registers', models.BinaryField()),
+            ],
+        ),
+        migrations.RunPython(backfill_site_sketches, migrations.RunPython.noop),
+    ]
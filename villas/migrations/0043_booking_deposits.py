@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 21:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0042_site_visitor_sketch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedbooking',
+            name='deposits',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Refundable security and damage deposits included in total_price.', max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='deposits',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Refundable security and damage deposits included in total_price.', max_digits=10),
+        ),
+    ]
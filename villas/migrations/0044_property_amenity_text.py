@@ -0,0 +1,126 @@
+from django.db import migrations, models
+
+
+# Frozen copy of the index definition in villas.search at the time of this
+# migration; later edits there must not change what this migration does.
+FTS_TABLE = 'villas_property_fts'
+FTS_COLUMNS = "title, city, description, amenities"
+OLD_FTS_VALUES = "{row}.title, {row}.city, {row}.description, {row}.interior_amenities || ' ' || {row}.outdoor_amenities"
+NEW_FTS_VALUES = "{row}.title, {row}.city, {row}.description, {row}.amenity_text"
+
+
+def sqlite_index(values, update_columns):
+    triggers = [
+        f"""
+        CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON villas_property BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {FTS_COLUMNS}) VALUES (new.id, {values.format(row='new')});
+        END
+        """,
+        f"""
+        CREATE TRIGGER {FTS_TABLE}_au
+        AFTER UPDATE OF {update_columns} ON villas_property BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+            INSERT INTO {FTS_TABLE}(rowid, {FTS_COLUMNS}) VALUES (new.id, {values.format(row='new')});
+        END
+        """,
+        f"""
+        CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON villas_property BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        END
+        """,
+    ]
+    return [
+        *(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}" for suffix in ('ai', 'au', 'ad')),
+        f"DROP TABLE IF EXISTS {FTS_TABLE}",
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({FTS_COLUMNS}, tokenize = 'porter unicode61')",
+        *triggers,
+        f"INSERT INTO {FTS_TABLE}(rowid, {FTS_COLUMNS}) SELECT id, {values.format(row='villas_property')} FROM villas_property",
+    ]
+
+
+SQLITE_FORWARD = sqlite_index(NEW_FTS_VALUES, "title, city, description, amenity_text")
+SQLITE_BACKWARD = sqlite_index(OLD_FTS_VALUES, "title, city, description, interior_amenities, outdoor_amenities")
+
+
+def postgres_index(amenities):
+    return [
+        "DROP INDEX IF EXISTS villas_property_search_idx",
+        "ALTER TABLE villas_property DROP COLUMN IF EXISTS search_vector",
+        f"""
+        ALTER TABLE villas_property ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english'::regconfig, coalesce(city, '')), 'A') ||
+            {amenities} ||
+            setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'C')
+        ) STORED
+        """,
+        "CREATE INDEX villas_property_search_idx ON villas_property USING GIN (search_vector)",
+    ]
+
+
+POSTGRES_FORWARD = postgres_index(
+    "setweight(to_tsvector('english'::regconfig, coalesce(amenity_text, '')), 'B')"
+)
+POSTGRES_BACKWARD = postgres_index(
+    "setweight(jsonb_to_tsvector('english'::regconfig, coalesce(interior_amenities, '{}'::jsonb), '[\"key\", \"string\"]'), 'B') ||\n"
+    "            setweight(jsonb_to_tsvector('english'::regconfig, coalesce(outdoor_amenities, '{}'::jsonb), '[\"key\", \"string\"]'), 'B')"
+)
+
+
+def fill_amenity_text(apps, schema_editor):
+    # the interior/outdoor PropertyAmenity rows already hold the normalized keys
+    Property = apps.get_model('villas', 'Property')
+    PropertyAmenity = apps.get_model('villas', 'PropertyAmenity')
+    keys = {}
+    rows = PropertyAmenity.objects.filter(source__in=('interior', 'outdoor')).values_list('property_id', 'key')
+    for property_id, key in rows.iterator():
+        keys.setdefault(property_id, set()).add(key)
+
+    properties = []
+    for property_id, property_keys in keys.items():
+        properties.append(Property(id=property_id, amenity_text=' '.join(sorted(property_keys))))
+    Property.objects.bulk_update(properties, ['amenity_text'], batch_size=500)
+
+
+def forwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRES_FORWARD
+    elif vendor == 'sqlite':
+        statements = SQLITE_FORWARD
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def backwards(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        statements = POSTGRES_BACKWARD
+    elif vendor == 'sqlite':
+        statements = SQLITE_BACKWARD
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0043_booking_deposits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='amenity_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_amenity_text, migrations.RunPython.noop),
+        # index the normalized keys instead of the raw JSON, whose `false`
+        # flags and literals used to match searches
+        migrations.RunPython(forwards, backwards),
+    ]
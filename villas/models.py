@@ -5,6 +5,7 @@ from django.utils.text import slugify
 import random
 import string
 from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
 import os 
 
 
@@ -63,6 +64,14 @@ class Property(models.Model):
 
     place_id = models.CharField(max_length=255, blank=True, null=True)
 
+    # float copies of latitude/longitude for indexed geo search, set in save()
+    geo_lat = models.FloatField(null=True, blank=True, editable=False)
+    geo_lng = models.FloatField(null=True, blank=True, editable=False)
+
+    # normalized interior/outdoor amenity keys (see amenity_keys), set in
+    # save(); read by the full-text index instead of the raw JSON
+    amenity_text = models.TextField(blank=True, default='', editable=False)
+
     seo_title = models.CharField(max_length=255, blank=True)
     seo_description = models.TextField(blank=True)
     signature_distinctions = models.JSONField(blank=True, null=True, help_text="List of unique features in JSON format, e.g., ['Ocean view', 'Private beach access']")
@@ -87,6 +96,29 @@ class Property(models.Model):
     commission_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0, help_text="Commission rate (%) for the assigned agent.")
     damage_deposit = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Damage deposit amount for the property.")
 
+    # storage name of the first PropertyImage, maintained by villas.signals
+    primary_image = models.CharField(max_length=255, blank=True, default='', editable=False)
+
+    # bumped (with updated_at) whenever images, videos, reviews or bookings
+    # change; part of the detail ETag
+    content_version = models.PositiveIntegerField(default=0, editable=False)
+
+    # review counters (approved reviews only, maintained by villas.signals)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    avg_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+
+    # columns written only with UPDATE ... F() by villas.signals/utils; an
+    # ordinary save() must not write stale in-memory copies back over them
+    MAINTAINED_FIELDS = ('primary_image', 'content_version', 'review_count', 'rating_sum', 'avg_rating')
+
+    class Meta:
+        indexes = [
+            # keyset pagination order: (-created_at, id)
+            models.Index(fields=['-created_at', 'id'], name='villas_prop_created_id_idx'),
+            models.Index(fields=['geo_lat', 'geo_lng'], name='villas_prop_geo_idx'),
+        ]
+
     def __str__(self):
         return f"{self.title} ({self.city})"
 
@@ -103,7 +135,103 @@ class Property(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = self._generate_unique_slug()
+        self.sync_geo()
+        self.sync_amenity_text()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'interior_amenities', 'outdoor_amenities'} & set(update_fields):
+            kwargs['update_fields'] = [*update_fields, 'amenity_text']
+        if not self._state.adding and update_fields is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.MAINTAINED_FIELDS
+            ]
         super().save(*args, **kwargs)
+        self.sync_amenities()
+
+    def sync_geo(self):
+        """Mirror latitude/longitude into the indexed float columns."""
+        if self.latitude is None or self.longitude is None:
+            self.geo_lat = self.geo_lng = None
+        else:
+            self.geo_lat, self.geo_lng = float(self.latitude), float(self.longitude)
+
+    def sync_amenity_text(self):
+        """Mirror the searchable amenity keys into amenity_text; false flags are left out."""
+        keys = amenity_keys(self.interior_amenities) | amenity_keys(self.outdoor_amenities)
+        self.amenity_text = ' '.join(sorted(keys))
+
+    def sync_amenities(self):
+        """Bring the PropertyAmenity rows in line with the amenity JSON fields."""
+        wanted = {
+            (source, key)
+            for source, field in PropertyAmenity.SOURCE_FIELDS.items()
+            for key in amenity_keys(getattr(self, field))
+        }
+        current = set(self.amenities.values_list('source', 'key'))
+        if wanted == current:
+            return
+
+        stale = current - wanted
+        for source, key in stale:
+            self.amenities.filter(source=source, key=key).delete()
+        PropertyAmenity.objects.bulk_create(
+            [PropertyAmenity(property=self, source=source, key=key) for source, key in wanted - current],
+            ignore_conflicts=True,
+        )
+
+
+def amenity_keys(value):
+    """
+    Normalize an amenity JSON value into filterable keys.
+    {'wifi': True, 'pool': 'private'} -> {'wifi', 'pool', 'pool_private'};
+    lists of names are accepted too, falsy flags are skipped.
+    """
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, (list, tuple)):
+        items = ((name, True) for name in value if isinstance(name, str))
+    else:
+        return set()
+
+    keys = set()
+    for name, flag in items:
+        key = slugify(str(name)).replace('-', '_')[:100]
+        if not key or not flag:
+            continue
+        keys.add(key)
+        if isinstance(flag, str):
+            suffix = slugify(flag).replace('-', '_')
+            if suffix:
+                keys.add(f"{key}_{suffix}"[:120])
+    return keys
+
+
+class PropertyAmenity(models.Model):
+    """One normalized amenity key of a property; maintained by Property.save()."""
+
+    class Source(models.TextChoices):
+        OUTDOOR = 'outdoor', 'Outdoor'
+        INTERIOR = 'interior', 'Interior'
+        CONCIERGE = 'concierge', 'Concierge'
+
+    SOURCE_FIELDS = {
+        Source.OUTDOOR: 'outdoor_amenities',
+        Source.INTERIOR: 'interior_amenities',
+        Source.CONCIERGE: 'concierge_services',
+    }
+
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='amenities')
+    source = models.CharField(max_length=20, choices=Source.choices)
+    key = models.CharField(max_length=120)
+
+    class Meta:
+        unique_together = ('property', 'source', 'key')
+        indexes = [
+            models.Index(fields=['key', 'property'], name='villas_amenity_key_prop_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.source}) for property {self.property_id}"
 
 
 
@@ -237,17 +365,142 @@ class Booking(models.Model):
     check_out = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS.choices, default=STATUS.Pending)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    deposits = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0,
+        help_text="Refundable security and damage deposits included in total_price.",
+    )
     google_event_id = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', 'id'], name='villas_book_created_id_idx'),
+            # overlap / availability lookups
+            models.Index(fields=['property', 'status', 'check_in', 'check_out'], name='villas_book_overlap_idx'),
+            # admin search by date
+            models.Index(fields=['check_in'], name='villas_book_check_in_idx'),
+            models.Index(fields=['check_out'], name='villas_book_check_out_idx'),
+        ]
 
     def __str__(self):
         return f"Booking {self.id} - {self.property_id} ({self.check_in} → {self.check_out})"
 
 
 
+class ArchivedBooking(models.Model):
+    """
+    Old bookings in a terminal state (completed, cancelled, rejected), moved
+    out of villas_booking by the archive_bookings command. Keeps the original
+    booking id; read-only from the API.
+    """
+    TERMINAL_STATUSES = (Booking.STATUS.Completed, Booking.STATUS.Cancelled, Booking.STATUS.Rejected)
+
+    id = models.BigIntegerField(primary_key=True)
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='archived_bookings')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_bookings')
+    full_name = models.CharField(max_length=255)
+    email = models.EmailField()
+    phone = models.CharField(max_length=30, blank=True)
+    check_in = models.DateField()
+    check_out = models.DateField()
+    status = models.CharField(max_length=20, choices=Booking.STATUS.choices)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    deposits = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0,
+        help_text="Refundable security and damage deposits included in total_price.",
+    )
+    google_event_id = models.CharField(max_length=255, blank=True, null=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-check_in', 'id']
+        indexes = [
+            # history is browsed by year of stay, per property
+            models.Index(fields=['check_in'], name='villas_archbook_check_in_idx'),
+            models.Index(fields=['property', 'check_in'], name='villas_archbook_prop_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived booking {self.id} - {self.property_id} ({self.check_in} → {self.check_out})"
+
+
+class ExternalCalendarBlock(models.Model):
+    """
+    Dates blocked in a property's external calendar (calendar_link), imported
+    by the import_calendars command. `end` is inclusive, like Booking.check_out.
+    """
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='external_blocks')
+    uid = models.CharField(max_length=255)
+    start = models.DateField()
+    end = models.DateField()
+    summary = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        unique_together = ('property', 'uid')
+        indexes = [
+            models.Index(fields=['property', 'start', 'end'], name='villas_extblock_overlap_idx'),
+        ]
+
+    def __str__(self):
+        return f"External block {self.uid} - {self.property_id} ({self.start} → {self.end})"
+
+
+class ExternalCalendarSync(models.Model):
+    """Conditional-request state of the last import of a property's calendar_link."""
+    property = models.OneToOneField(Property, on_delete=models.CASCADE, related_name='calendar_sync')
+    url = models.URLField(max_length=500)
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
+    checked_at = models.DateTimeField(null=True, blank=True)
+    changed_at = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"Calendar sync for property {self.property_id}"
+
+
+class PropertyMonthStats(models.Model):
+    """
+    Approved-booking rollup of one property for one calendar month, maintained
+    by villas.rollups. Nights are the nights slept inside the month; revenue
+    is each booking's stay price (total_price less the refundable deposits)
+    pro-rated by those nights.
+    """
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='month_stats')
+    month = models.DateField(help_text="First day of the month.")
+    booked_nights = models.PositiveIntegerField(default=0)
+    occupancy_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0, help_text="Booked nights / days in month, in %.")
+    booking_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('property', 'month')
+        indexes = [
+            models.Index(fields=['month', 'property'], name='villas_monthstats_month_idx'),
+        ]
+
+    def __str__(self):
+        return f"Stats for property {self.property_id} ({self.month:%Y-%m})"
+
+
+class PropertyOccupancy(models.Model):
+    """
+    Merged, sorted [start, end] date ranges (inclusive, ISO strings) covered by a
+    property's approved bookings and imported external blocks. Rebuilt by
+    villas.availability when either changes.
+    """
+    property = models.OneToOneField(Property, on_delete=models.CASCADE, related_name='occupancy')
+    intervals = models.JSONField(default=list, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Occupancy for property {self.property_id} ({len(self.intervals)} ranges)"
+
+
+
 class PropertyImage(models.Model):
     property = models.ForeignKey("Property", on_delete=models.CASCADE, related_name="media_images")
     image = models.ImageField(upload_to="properties/")
@@ -268,13 +521,17 @@ class ReviewStatus(models.TextChoices):
 class Review(models.Model):
     property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='reviews')
-    rating = models.PositiveIntegerField()
+    # avg_rating (max_digits=3) relies on this range
+    rating = models.PositiveIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
     comment = models.TextField(blank=True)
     status = models.CharField(max_length=20, choices=ReviewStatus.choices, default=ReviewStatus.PENDING)
     created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at', 'id'], name='villas_rev_created_id_idx'),
+        ]
 
     def __str__(self):
         return f"Review {self.id} - {self.property.title} ({self.rating} stars)"
@@ -305,13 +562,123 @@ class DailyAnalytics(models.Model):
     views = models.PositiveIntegerField(default=0)
     bookings = models.PositiveIntegerField(default=0)
     downloads = models.PositiveIntegerField(default=0)
+    unique_visitors = models.PositiveIntegerField(default=0, help_text="Estimated from the day's VisitorSketch.")
 
     class Meta:
         unique_together = ('property', 'date')
         ordering = ['-date']
+        indexes = [
+            models.Index(fields=['date', 'property'], name='villas_daily_date_idx'),
+        ]
 
     def __str__(self):
         return f"Analytics for {self.property.title} on {self.date}"
+
+
+class AnalyticsEvent(models.Model):
+    """
+    Append-only log of analytics events, written in batches by
+    villas.counters and rolled up by the rollup_analytics command.
+    """
+    class EventType(models.TextChoices):
+        VIEW = 'view', 'View'
+        BOOKING = 'booking', 'Booking'
+        DOWNLOAD = 'download', 'Download'
+
+    id = models.BigAutoField(primary_key=True)
+    event_type = models.CharField(max_length=10, choices=EventType.choices)
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='analytics_events')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    visitor_id = models.CharField(max_length=64, help_text="user:<id> or a hashed anonymous id.")
+    referrer = models.CharField(max_length=500, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='villas_event_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} of property {self.property_id} by {self.visitor_id}"
+
+
+class VisitorSketch(models.Model):
+    """HyperLogLog registers (villas.hll) of the visitors of one property on one day."""
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='visitor_sketches')
+    date = models.DateField()
+    registers = models.BinaryField()
+
+    class Meta:
+        unique_together = ('property', 'date')
+        indexes = [
+            models.Index(fields=['date', 'property'], name='villas_sketch_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Visitor sketch for property {self.property_id} on {self.date}"
+
+
+class SiteVisitorSketch(models.Model):
+    """
+    HyperLogLog registers of all visitors on one day, across properties, so a
+    site-wide range merges one sketch per day. A sketch cannot forget, so the
+    visitors of properties deleted since are still counted.
+    """
+    date = models.DateField(unique=True)
+    registers = models.BinaryField()
+
+    def __str__(self):
+        return f"Site visitor sketch for {self.date}"
+
+
+class AnalyticsWatermark(models.Model):
+    """How far a rollup has got: the last AnalyticsEvent id, or the last closed day."""
+    name = models.CharField(max_length=50, unique=True)
+    last_event_id = models.BigIntegerField(default=0)
+    last_day = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at event {self.last_event_id}"
+
+
+class WeeklyAnalytics(models.Model):
+    """
+    Site-wide DailyAnalytics totals and ContectUs inquiries of one week
+    (Monday to Sunday), maintained by villas.analytics as days close.
+    `through` is the last day included; it is before the week's end while
+    the week is still running.
+    """
+    week = models.DateField(unique=True, help_text="Monday of the week.")
+    through = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    bookings = models.PositiveIntegerField(default=0)
+    downloads = models.PositiveIntegerField(default=0)
+    inquiries = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-week']
+
+    def __str__(self):
+        return f"Analytics for the week of {self.week}"
+
+
+class MonthlyAnalytics(models.Model):
+    """Like WeeklyAnalytics, for one calendar month."""
+    month = models.DateField(unique=True, help_text="First day of the month.")
+    through = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    bookings = models.PositiveIntegerField(default=0)
+    downloads = models.PositiveIntegerField(default=0)
+    inquiries = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-month']
+
+    def __str__(self):
+        return f"Analytics for {self.month:%Y-%m}"
     
 
 
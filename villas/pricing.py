@@ -0,0 +1,174 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.core.cache import cache
+
+from .cache import safe_cache
+from .models import Property
+
+
+MAX_BATCH_QUOTES = 100
+RATE_CARD_KEY = 'villas:property:{pk}:rates'
+# cards are deleted on Property save/delete; the timeout only bounds
+# staleness after queryset.update(), which sends no signals
+RATE_CARD_TIMEOUT = 60 * 60 * 24
+
+CENT = Decimal('0.01')
+# package prices in booking_rate, as {key: nights they cover}
+PERIOD_KEYS = {'nightly': 1, 'daily': 1, 'weekly': 7, 'monthly': 30}
+NIGHTS_KEYS = ('day', 'days', 'nights', 'min_nights')
+
+
+def _money(value):
+    try:
+        amount = Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    if not amount.is_finite() or amount < 0:
+        return None
+    return amount
+
+
+def _nights(entry):
+    for key in NIGHTS_KEYS:
+        if key in entry:
+            try:
+                nights = int(entry[key])
+            except (TypeError, ValueError):
+                return None
+            return nights if nights >= 1 else None
+    return None
+
+
+def parse_booking_rate(booking_rate):
+    """
+    Tiers found in a booking_rate blob, as (min_nights, amount, period) where
+    `amount` buys `period` nights. Two shapes are understood:
+
+      {"booking": [{"day": 2, "price": 500}]}   -> 500 a night from 2 nights
+      {"weekly": 4200, "monthly": 15000}       -> 4200 per 7 nights from 7 nights
+
+    Entries that do not fit either shape are ignored.
+    """
+    tiers = []
+    if isinstance(booking_rate, list):
+        booking_rate = {'booking': booking_rate}
+    if not isinstance(booking_rate, dict):
+        return tiers
+
+    for key, value in booking_rate.items():
+        if key in PERIOD_KEYS:
+            amount = _money(value)
+            if amount is not None:
+                tiers.append((PERIOD_KEYS[key], amount, PERIOD_KEYS[key]))
+        elif isinstance(value, list):
+            for entry in value:
+                if not isinstance(entry, dict):
+                    continue
+                nights, amount = _nights(entry), _money(entry.get('price'))
+                if nights is not None and amount is not None:
+                    tiers.append((nights, amount, 1))
+    return tiers
+
+
+def compile_rate_card(prop):
+    """Everything needed to price a stay at `prop`, without touching the database."""
+    tiers = parse_booking_rate(prop.booking_rate)
+    base = _money(prop.price)
+    if base is not None:
+        tiers.append((1, base, 1))
+    # longest minimum stay first; for equal minimums the cheaper rate wins
+    tiers.sort(key=lambda tier: (-tier[0], tier[1] / tier[2]))
+    return {
+        'tiers': tuple(tiers),
+        'security_deposit': _money(prop.security_deposit) or Decimal('0'),
+        'damage_deposit': _money(prop.damage_deposit) or Decimal('0'),
+    }
+
+
+def invalidate_rate_card(pk):
+    safe_cache(None, cache.delete, RATE_CARD_KEY.format(pk=pk))
+
+
+def get_rate_cards(property_ids):
+    """{pk: rate card} for the given ids; unknown ids are left out."""
+    keys = {RATE_CARD_KEY.format(pk=pk): pk for pk in property_ids}
+    cached = safe_cache({}, cache.get_many, list(keys))
+    cards = {keys[key]: card for key, card in cached.items()}
+
+    missing = [pk for pk in keys.values() if pk not in cards]
+    if missing:
+        fresh = {
+            prop.pk: compile_rate_card(prop)
+            for prop in Property.objects.filter(pk__in=missing).only(
+                'id', 'price', 'booking_rate', 'security_deposit', 'damage_deposit'
+            )
+        }
+        safe_cache(None, cache.set_many, {RATE_CARD_KEY.format(pk=pk): card for pk, card in fresh.items()}, RATE_CARD_TIMEOUT)
+        cards.update(fresh)
+    return cards
+
+
+def rate_card_for(prop):
+    """Rate card of a loaded Property instance, compiled from it on a cache miss."""
+    key = RATE_CARD_KEY.format(pk=prop.pk)
+    card = safe_cache(None, cache.get, key)
+    if card is None:
+        card = compile_rate_card(prop)
+        safe_cache(None, cache.set, key, card, RATE_CARD_TIMEOUT)
+    return card
+
+
+def price_stay(card, check_in, check_out):
+    """Quote for the nights from check_in to check_out (check-out day not charged)."""
+    nights = (check_out - check_in).days
+    if nights < 1:
+        raise ValueError("Check-out must be after check-in.")
+
+    for min_nights, amount, period in card['tiers']:
+        if nights >= min_nights:
+            break
+    else:
+        min_nights, amount, period = 1, Decimal('0'), 1
+
+    subtotal = (amount * nights / period).quantize(CENT, rounding=ROUND_HALF_UP)
+    security = card['security_deposit'].quantize(CENT)
+    damage = card['damage_deposit'].quantize(CENT)
+    return {
+        'nights': nights,
+        'nightly_rate': (amount / period).quantize(CENT, rounding=ROUND_HALF_UP),
+        'subtotal': subtotal,
+        'security_deposit': security,
+        'damage_deposit': damage,
+        'total': subtotal + security + damage,
+    }
+
+
+def batch_quotes(items, property_ids=None):
+    """
+    Price many (property_id, check_in, check_out) stays with at most one query.
+    Returns one dict per item, in order, with either the quote or an `error`.
+    With `property_ids`, stays of any other property are reported as not found.
+    """
+    wanted = {property_id for property_id, _, _ in items}
+    if property_ids is not None:
+        wanted &= set(property_ids)
+    cards = get_rate_cards(wanted)
+    results = []
+    for property_id, check_in, check_out in items:
+        result = {'property': property_id, 'check_in': check_in, 'check_out': check_out}
+        card = cards.get(property_id)
+        if card is None:
+            result['error'] = "Property not found."
+        else:
+            try:
+                quote = price_stay(card, check_in, check_out)
+            except ValueError as exc:
+                result['error'] = str(exc)
+            else:
+                # money as strings, like the serializers' DecimalFields
+                result.update({
+                    key: str(value) if isinstance(value, Decimal) else value
+                    for key, value in quote.items()
+                })
+        results.append(result)
+    return results
@@ -0,0 +1,127 @@
+from calendar import monthrange
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import transaction
+
+from .models import Booking, PropertyMonthStats
+
+
+CENT = Decimal('0.01')
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    return (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def months_between(start, end):
+    """First days of the months that contain a night in [start, end)."""
+    months = []
+    current = month_start(start)
+    while current < end:
+        months.append(current)
+        current = next_month(current)
+    return months
+
+
+def month_shares(check_in, check_out, total_price):
+    """
+    [(month, nights, revenue)] of one stay. Nights run from check_in up to
+    (not including) check_out. Revenue is split by cumulative rounding, so the
+    shares always add up to total_price exactly.
+    """
+    total_nights = (check_out - check_in).days
+    if total_nights <= 0:
+        return []
+    total_price = Decimal(total_price or 0)
+
+    shares, counted, allocated = [], 0, Decimal('0')
+    for month in months_between(check_in, check_out):
+        nights = (min(check_out, next_month(month)) - max(check_in, month)).days
+        counted += nights
+        cumulative = (total_price * counted / total_nights).quantize(CENT, rounding=ROUND_HALF_UP)
+        shares.append((month, nights, cumulative - allocated))
+        allocated = cumulative
+    return shares
+
+
+def compute_month_stats(bookings, months=None):
+    """
+    {(property_id, month): {booked_nights, booking_count, revenue}} from
+    (property_id, check_in, check_out, stay price) rows, limited to `months`
+    when given.
+    """
+    stats = {}
+    for property_id, check_in, check_out, total_price in bookings:
+        for month, nights, revenue in month_shares(check_in, check_out, total_price):
+            if months is not None and month not in months:
+                continue
+            row = stats.setdefault((property_id, month), {'booked_nights': 0, 'booking_count': 0, 'revenue': Decimal('0')})
+            row['booked_nights'] += nights
+            row['booking_count'] += 1
+            row['revenue'] += revenue
+    return stats
+
+
+def occupancy_rate(month, booked_nights):
+    days = monthrange(month.year, month.month)[1]
+    # overlapping approvals cannot happen, but never report more than 100%
+    return min(Decimal(booked_nights * 100) / days, Decimal(100)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _approved_rows(property_ids, start=None, end=None):
+    bookings = Booking.objects.filter(status=Booking.STATUS.Approved, property_id__in=property_ids)
+    if start is not None:
+        bookings = bookings.filter(check_in__lt=end, check_out__gt=start)
+    # the deposits in total_price are refunded, so only the stay price is revenue
+    return (
+        (property_id, check_in, check_out, (total_price or 0) - (deposits or 0))
+        for property_id, check_in, check_out, total_price, deposits in bookings.values_list(
+            'property_id', 'check_in', 'check_out', 'total_price', 'deposits'
+        )
+    )
+
+
+def refresh_month_stats(property_id, months, create=True):
+    """
+    Recompute the rollup rows of one property for the given months from its
+    approved bookings (one read query). Months left without bookings lose
+    their row. With create=False, rows are only updated or deleted (used on
+    deletes, which may be part of deleting the property itself).
+    """
+    months = set(months)
+    if not months:
+        return
+    stats = compute_month_stats(
+        _approved_rows([property_id], min(months), next_month(max(months))), months
+    )
+    with transaction.atomic():
+        empty = [month for month in months if (property_id, month) not in stats]
+        PropertyMonthStats.objects.filter(property_id=property_id, month__in=empty).delete()
+        for (_, month), values in stats.items():
+            values = dict(values, occupancy_rate=occupancy_rate(month, values['booked_nights']))
+            if create:
+                PropertyMonthStats.objects.update_or_create(property_id=property_id, month=month, defaults=values)
+            else:
+                PropertyMonthStats.objects.filter(property_id=property_id, month=month).update(**values)
+
+
+def rebuild_month_stats(property_ids):
+    """Recompute every rollup row of the given properties. Returns the number of rows written."""
+    property_ids = list(property_ids)
+    stats = compute_month_stats(_approved_rows(property_ids))
+    rows = [
+        PropertyMonthStats(
+            property_id=property_id, month=month,
+            occupancy_rate=occupancy_rate(month, values['booked_nights']), **values,
+        )
+        for (property_id, month), values in stats.items()
+    ]
+    with transaction.atomic():
+        PropertyMonthStats.objects.filter(property_id__in=property_ids).delete()
+        PropertyMonthStats.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
@@ -0,0 +1,247 @@
+import re
+
+from django.db import connection, connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+
+# Full-text index over Property. Both live outside the Django model and are
+# created by migration 0027_property_search (amenities re-sourced from the
+# normalized `amenity_text` column by 0044_property_amenity_text):
+#   * PostgreSQL: generated `search_vector` tsvector column + GIN index
+#   * SQLite: FTS5 shadow table kept in sync by triggers
+SEARCH_CONFIG = 'english'
+FTS_TABLE = 'villas_property_fts'
+
+_FTS_COLUMNS = "title, city, description, amenities"
+_FTS_VALUES = "{row}.title, {row}.city, {row}.description, {row}.amenity_text"
+
+SQLITE_FTS_TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON villas_property BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {_FTS_COLUMNS}) VALUES (new.id, {_FTS_VALUES.format(row='new')});
+        END
+    """,
+    f'{FTS_TABLE}_au': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+        AFTER UPDATE OF title, city, description, amenity_text ON villas_property BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+            INSERT INTO {FTS_TABLE}(rowid, {_FTS_COLUMNS}) VALUES (new.id, {_FTS_VALUES.format(row='new')});
+        END
+    """,
+    f'{FTS_TABLE}_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON villas_property BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        END
+    """,
+}
+
+
+def install_sqlite_search_index(cursor):
+    """Create the FTS5 table and its triggers if missing, then reindex every property."""
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({_FTS_COLUMNS}, tokenize = 'porter unicode61')"
+    )
+    for sql in SQLITE_FTS_TRIGGERS.values():
+        cursor.execute(sql)
+    cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    cursor.execute(
+        f"INSERT INTO {FTS_TABLE}(rowid, {_FTS_COLUMNS}) "
+        f"SELECT id, {_FTS_VALUES.format(row='villas_property')} FROM villas_property"
+    )
+
+
+# Substring index over Booking contact fields, created by migration
+# 0035_booking_search:
+#   * PostgreSQL: generated, lower-cased `search_text` column + trigram GIN index
+#   * SQLite: FTS5 table with the trigram tokenizer, kept in sync by triggers
+# Phones are indexed both as typed and as bare digits.
+BOOKING_FTS_TABLE = 'villas_booking_fts'
+
+_BOOKING_FTS_COLUMNS = "full_name, email, phone, phone_digits"
+_BOOKING_FTS_VALUES = (
+    "{row}.full_name, {row}.email, {row}.phone, "
+    "replace(replace(replace(replace(replace(replace({row}.phone, ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', '')"
+)
+
+SQLITE_BOOKING_FTS_TRIGGERS = {
+    f'{BOOKING_FTS_TABLE}_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS {BOOKING_FTS_TABLE}_ai AFTER INSERT ON villas_booking BEGIN
+            INSERT INTO {BOOKING_FTS_TABLE}(rowid, {_BOOKING_FTS_COLUMNS}) VALUES (new.id, {_BOOKING_FTS_VALUES.format(row='new')});
+        END
+    """,
+    f'{BOOKING_FTS_TABLE}_au': f"""
+        CREATE TRIGGER IF NOT EXISTS {BOOKING_FTS_TABLE}_au
+        AFTER UPDATE OF full_name, email, phone ON villas_booking BEGIN
+            DELETE FROM {BOOKING_FTS_TABLE} WHERE rowid = old.id;
+            INSERT INTO {BOOKING_FTS_TABLE}(rowid, {_BOOKING_FTS_COLUMNS}) VALUES (new.id, {_BOOKING_FTS_VALUES.format(row='new')});
+        END
+    """,
+    f'{BOOKING_FTS_TABLE}_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS {BOOKING_FTS_TABLE}_ad AFTER DELETE ON villas_booking BEGIN
+            DELETE FROM {BOOKING_FTS_TABLE} WHERE rowid = old.id;
+        END
+    """,
+}
+
+
+def install_sqlite_booking_search_index(cursor):
+    """Create the booking FTS5 table and its triggers if missing, then reindex every booking."""
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {BOOKING_FTS_TABLE} USING fts5({_BOOKING_FTS_COLUMNS}, tokenize = 'trigram')"
+    )
+    for sql in SQLITE_BOOKING_FTS_TRIGGERS.values():
+        cursor.execute(sql)
+    cursor.execute(f"DELETE FROM {BOOKING_FTS_TABLE}")
+    cursor.execute(
+        f"INSERT INTO {BOOKING_FTS_TABLE}(rowid, {_BOOKING_FTS_COLUMNS}) "
+        f"SELECT id, {_BOOKING_FTS_VALUES.format(row='villas_booking')} FROM villas_booking"
+    )
+
+
+SQLITE_INDEXES = (
+    # (FTS table, its triggers, indexed table, columns it reads, installer)
+    (
+        FTS_TABLE, SQLITE_FTS_TRIGGERS, 'villas_property',
+        {'title', 'city', 'description', 'amenity_text'}, install_sqlite_search_index,
+    ),
+    (
+        BOOKING_FTS_TABLE, SQLITE_BOOKING_FTS_TRIGGERS, 'villas_booking',
+        {'full_name', 'email', 'phone'}, install_sqlite_booking_search_index,
+    ),
+)
+
+
+def repair_sqlite_search_index(using='default', **kwargs):
+    """
+    post_migrate hook. SQLite migrations that alter an indexed table rebuild
+    it, which silently drops its triggers; put them back and reindex. Tables
+    migrated back to before a column the index reads are left alone.
+    """
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        tables = conn.introspection.table_names(cursor)
+        for fts_table, triggers, source, columns, install in SQLITE_INDEXES:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s",
+                (f'{fts_table}%',),
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+            if fts_table in existing and existing.issuperset(triggers):
+                continue
+            if source not in tables:
+                continue
+            described = {column.name for column in conn.introspection.get_table_description(cursor, source)}
+            if not columns <= described:
+                continue
+            install(cursor)
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_tokens(text):
+    """Split free text into plain word tokens, dropping any query syntax."""
+    return TOKEN_RE.findall(text.lower())
+
+
+def _postgres_search(queryset, tokens):
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    # prefix match on every token, like the old ^istartswith lookups
+    tsquery = ' & '.join(f'{token}:*' for token in tokens)
+    return queryset.annotate(
+        search_match=RawSQL(
+            f"{table}.search_vector @@ to_tsquery(%s, %s)",
+            (SEARCH_CONFIG, tsquery),
+            output_field=BooleanField(),
+        ),
+        search_rank=RawSQL(
+            f"ts_rank({table}.search_vector, to_tsquery(%s, %s))",
+            (SEARCH_CONFIG, tsquery),
+            output_field=FloatField(),
+        ),
+    ).filter(search_match=True)
+
+
+def _sqlite_search(queryset, tokens):
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    match = ' '.join(f'"{token}"*' for token in tokens)
+    return queryset.filter(
+        id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,))
+    ).annotate(
+        # bm25() is lower-is-better; negate it so both backends sort descending
+        search_rank=RawSQL(
+            f"SELECT -bm25({FTS_TABLE}, 10.0, 10.0, 1.0, 4.0) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id",
+            (match,),
+            output_field=FloatField(),
+        ),
+    )
+
+
+def search_properties(queryset, text):
+    """
+    Filter a Property queryset by full-text relevance and annotate `search_rank`.
+    Returns None when the database has no full-text index for properties.
+    """
+    tokens = search_tokens(text)
+    if connection.vendor == 'postgresql':
+        search = _postgres_search
+    elif connection.vendor == 'sqlite':
+        search = _sqlite_search
+    else:
+        return None
+    if not tokens:
+        return queryset
+    return search(queryset, tokens)
+
+
+class PropertySearchFilter(SearchFilter):
+    """
+    `?search=` backed by the property full-text index and ordered by relevance.
+    An explicit `?ordering=` still wins; unsupported databases fall back to
+    the view's `search_fields`.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+
+        results = search_properties(queryset, ' '.join(terms))
+        if results is None:
+            return super().filter_queryset(request, queryset, view)
+        if 'search_rank' not in results.query.annotations:
+            return results
+        return results.order_by('-search_rank', '-created_at')
+
+
+PHONE_RE = re.compile(r'^[\d\s().+-]+$')
+# trigram indexes cannot serve shorter terms
+MIN_TRIGRAM_LENGTH = 3
+
+
+def booking_search_term(text):
+    """Normalize an admin search term: lower case, and bare digits for phone numbers."""
+    term = text.strip().lower()
+    if PHONE_RE.match(term) and any(ch.isdigit() for ch in term):
+        term = re.sub(r'\D', '', term)
+    return term
+
+
+def booking_search_q(text):
+    """
+    Q matching bookings whose name, email or phone contains `text`, through
+    the booking search index where the database has one.
+    """
+    term = booking_search_term(text)
+    if connection.vendor == 'postgresql':
+        pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        return Q(id__in=RawSQL("SELECT id FROM villas_booking WHERE search_text LIKE %s", (pattern,)))
+    if connection.vendor == 'sqlite' and len(term) >= MIN_TRIGRAM_LENGTH:
+        match = '"' + term.replace('"', '""') + '"'
+        return Q(id__in=RawSQL(f"SELECT rowid FROM {BOOKING_FTS_TABLE} WHERE {BOOKING_FTS_TABLE} MATCH %s", (match,)))
+    return Q(full_name__icontains=text) | Q(email__icontains=text) | Q(phone__icontains=text)
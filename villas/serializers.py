@@ -1,12 +1,28 @@
 from rest_framework import serializers
-from .models import Property, Media, Booking, PropertyImage, BedroomImage, Review, ReviewImage, Favorite, DailyAnalytics, PropertyVideo
+from .models import Property, Media, Booking, ArchivedBooking, PropertyImage, BedroomImage, Review, ReviewImage, Favorite, DailyAnalytics, PropertyVideo
 from accounts.models import User
 from datetime import date, datetime
-from .utils import validate_date_range, is_valid_date
+from .utils import validate_date_range, is_valid_date, attach_booking_stats
+from .pricing import price_stay, rate_card_for
 from django.db.models import Avg, Count
+from django.db import models
 
 
 
+class DynamicFieldsMixin:
+    """
+    Takes an optional `fields` argument naming the fields to keep
+    (sparse fieldsets, `?fields=id,title`). Unknown names are ignored.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
 class PropertyMiniSerializer(serializers.ModelSerializer):
     class Meta:
         model = Property
@@ -48,7 +64,7 @@ class PropertyFavoriteSerializer(serializers.ModelSerializer):
 
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class FavoriteSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     property_details = PropertyFavoriteSerializer(source='property', read_only=True)
     class Meta:
         model = Favorite
@@ -69,7 +85,18 @@ class PropertyVideoSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'video']
 
 
-class PropertySerializer(serializers.ModelSerializer):
+class PropertyListSerializer(serializers.ListSerializer):
+    """Loads the booking histogram for the whole page before serializing the rows."""
+
+    def to_representation(self, data):
+        items = data.all() if isinstance(data, models.manager.BaseManager) else data
+        items = list(items)
+        if {'property_stats', 'booking_count'} & set(self.child.fields):
+            attach_booking_stats(items)
+        return super().to_representation(items)
+
+
+class PropertySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     created_by_name = serializers.SerializerMethodField()
     location_coords = serializers.SerializerMethodField()
     booking_count = serializers.SerializerMethodField()
@@ -82,10 +109,12 @@ class PropertySerializer(serializers.ModelSerializer):
 
     total_reviews = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
+    distance_km = serializers.SerializerMethodField()
 
 
     class Meta:
         model = Property
+        list_serializer_class = PropertyListSerializer
         fields = [
             'id', 'title', 'slug', 'description', 'price', 'price_display', 'booking_rate',
             'listing_type', 'status', 'address', 'city', 'add_guest',
@@ -93,18 +122,23 @@ class PropertySerializer(serializers.ModelSerializer):
             'longitude', 'place_id', 'seo_title', 'seo_description',
             'signature_distinctions', 'staff', 'calendar_link',
             'created_at', 'updated_at', 'assigned_agent', 'created_by', 'created_by_name',
-            'booking_count', 'location_coords', 'property_stats', 'media_images', 'bedrooms_images', 'is_favorited', 'videos', 'check_in', 'check_out', 'rules_and_etiquette', 'total_reviews', 'average_rating', 'security_deposit', 'damage_deposit', 'commission_rate', 'concierge_services'
+            'booking_count', 'location_coords', 'property_stats', 'media_images', 'bedrooms_images', 'is_favorited', 'videos', 'check_in', 'check_out', 'rules_and_etiquette', 'total_reviews', 'average_rating', 'security_deposit', 'damage_deposit', 'commission_rate', 'concierge_services', 'distance_km'
         ]
         read_only_fields = [
             'slug', 'created_by', 'created_by_name', 'booking_count', 'media_images', 'bedrooms_images',
-            'created_at', 'updated_at', 'location_coords', 'price_display', 'property_stats', 'total_reviews', 'average_rating', 'is_favorited', 'videos'
+            'created_at', 'updated_at', 'location_coords', 'price_display', 'property_stats', 'total_reviews', 'average_rating', 'is_favorited', 'videos', 'distance_km'
         ]
     
     def get_total_reviews(self, obj):
-        return getattr(obj, "total_reviews", 0)
+        return obj.review_count
 
     def get_average_rating(self, obj):
-        return round(getattr(obj, "avg_rating", 0) or 0, 2)
+        return round(float(obj.avg_rating or 0), 2)
+
+    def get_distance_km(self, obj):
+        # only present when the list is filtered with ?near=
+        distance = getattr(obj, 'distance_km', None)
+        return round(distance, 2) if distance is not None else None
 
     def get_created_by_name(self, obj):
         return obj.created_by.name if obj.created_by else None
@@ -122,7 +156,7 @@ class PropertySerializer(serializers.ModelSerializer):
 
 
     def get_booking_count(self, obj):
-        return getattr(obj, 'bookings', []).count() if hasattr(obj, 'bookings') else 0
+        return self.get_property_stats(obj)['total_bookings']
 
     def get_price_display(self, obj):
         try:
@@ -131,23 +165,12 @@ class PropertySerializer(serializers.ModelSerializer):
             return "0.00"
 
     def get_property_stats(self, obj):
-        # Aggregate booking statuses for quick overview
-        stats = {
-            'total_bookings': 0,
-            'pending': 0,
-            'approved': 0,
-            'rejected': 0,
-            'completed': 0,
-            'cancelled': 0,
-        }
-        qs = getattr(obj, 'bookings', None)
-        if qs is not None:
-            stats['total_bookings'] = qs.count()
-            # Use values_list to avoid N+1
-            for status in qs.values_list('status', flat=True):
-                if status in stats:
-                    stats[status] += 1
-        return stats
+        # Aggregate booking statuses for quick overview; list pages batch this
+        # in PropertyListSerializer, a single instance costs one grouped query
+        if obj.pk is None:
+            return {'total_bookings': 0, 'pending': 0, 'approved': 0, 'rejected': 0, 'completed': 0, 'cancelled': 0}
+        attach_booking_stats([obj])
+        return dict(obj.booking_stats)
 
     # def validate(self, data):
     #     lat = data.get('latitude')
@@ -158,6 +181,37 @@ class PropertySerializer(serializers.ModelSerializer):
 
 
 
+class PropertyCardSerializer(serializers.ModelSerializer):
+    """Compact catalog row (`?view=card`); reads only the columns in CARD_FIELDS."""
+
+    CARD_FIELDS = [
+        'id', 'title', 'slug', 'city', 'price', 'bedrooms', 'bathrooms', 'add_guest',
+        'avg_rating', 'review_count', 'primary_image', 'created_at',
+    ]
+
+    guests = serializers.IntegerField(source='add_guest', read_only=True)
+    average_rating = serializers.SerializerMethodField()
+    total_reviews = serializers.IntegerField(source='review_count', read_only=True)
+    image = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Property
+        fields = [
+            'id', 'title', 'slug', 'city', 'price', 'bedrooms', 'bathrooms', 'guests',
+            'average_rating', 'total_reviews', 'image',
+        ]
+
+    def get_average_rating(self, obj):
+        return round(float(obj.avg_rating or 0), 2)
+
+    def get_image(self, obj):
+        if not obj.primary_image:
+            return None
+        url = PropertyImage._meta.get_field('image').storage.url(obj.primary_image)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+
 class BookingPropertySerializer(serializers.ModelSerializer):
     class Meta:
         model = Property
@@ -169,7 +223,7 @@ class BookingUserSerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'name', 'email']
 
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     property_details = BookingPropertySerializer(source='property', read_only=True)
     user_details = BookingUserSerializer(source='user', read_only=True)
 
@@ -177,10 +231,11 @@ class BookingSerializer(serializers.ModelSerializer):
         model = Booking
         fields = [
             'id', 'property', 'full_name', 'email', 'phone', 'check_in', 'check_out',
-            'total_price', 'user', 'status', 'created_at',
+            'total_price', 'deposits', 'user', 'status', 'created_at',
             'property_details', 'user_details'
         ]
-        read_only_fields = ['user', 'status', 'created_at']
+        # total_price and deposits are quoted from the property's rates in validate()
+        read_only_fields = ['user', 'status', 'created_at', 'total_price', 'deposits']
         extra_kwargs = {
             'property': {'write_only': True}
         }
@@ -219,7 +274,11 @@ class BookingSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({
                 "non_field_errors": ["The selected dates are not available for this property. Please choose different dates."]
             })
-        
+
+        quote = price_stay(rate_card_for(prop), check_in, check_out)
+        data['total_price'] = quote['total']
+        data['deposits'] = quote['security_deposit'] + quote['damage_deposit']
+
         # check_availability = self.context.get('check_availability', True)
         # if check_availability:
         #     is_unavailable = validate_date_range(prop, check_in, check_out)
@@ -230,6 +289,20 @@ class BookingSerializer(serializers.ModelSerializer):
         return data
 
 
+class ArchivedBookingSerializer(serializers.ModelSerializer):
+    property_details = BookingPropertySerializer(source='property', read_only=True)
+    user_details = BookingUserSerializer(source='user', read_only=True)
+
+    class Meta:
+        model = ArchivedBooking
+        fields = [
+            'id', 'full_name', 'email', 'phone', 'check_in', 'check_out',
+            'total_price', 'deposits', 'user', 'status', 'created_at', 'archived_at',
+            'property_details', 'user_details'
+        ]
+        read_only_fields = fields
+
+
 class ReviewImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ReviewImage
@@ -257,7 +330,7 @@ class ReviewSerializer(serializers.ModelSerializer):
         return data
 
 
-class ReadReviewSerializer(serializers.ModelSerializer):
+class ReadReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     images = ReviewImageSerializer(many=True, read_only=True)
     user_name = serializers.SerializerMethodField()
     address = serializers.CharField(source='user.address', read_only=True)
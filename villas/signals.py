@@ -0,0 +1,163 @@
+from django.db import transaction
+from django.db.models import Min
+from django.db.models.signals import pre_delete, pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from list_vila.models import ContectUs
+
+from .analytics import reopen_periods
+from .cache import bump_property_version
+from .models import Property, PropertyImage, BedroomImage, PropertyVideo, Review, ReviewStatus, Booking, DailyAnalytics
+from .utils import apply_review_delta, refresh_primary_image, touch_property
+from .availability import rebuild_occupancy
+from .pricing import invalidate_rate_card
+from .rollups import months_between, refresh_month_stats
+
+
+def _review_contribution(status, rating):
+    """(count, rating sum) a review adds to its property's counters."""
+    if status == ReviewStatus.APPROVED:
+        return 1, rating
+    return 0, 0
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_state(sender, instance, **kwargs):
+    instance._counted_state = None
+    if instance.pk:
+        instance._counted_state = (
+            Review.objects.filter(pk=instance.pk)
+            .values_list('property_id', 'status', 'rating')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def update_review_counters_on_save(sender, instance, **kwargs):
+    previous = getattr(instance, '_counted_state', None)
+    count, total = _review_contribution(instance.status, instance.rating)
+
+    if previous:
+        old_property_id, old_status, old_rating = previous
+        old_count, old_total = _review_contribution(old_status, old_rating)
+        if old_property_id != instance.property_id:
+            apply_review_delta(old_property_id, -old_count, -old_total)
+        else:
+            count, total = count - old_count, total - old_total
+
+    apply_review_delta(instance.property_id, count, total)
+
+
+@receiver(post_delete, sender=Review)
+def update_review_counters_on_delete(sender, instance, **kwargs):
+    count, total = _review_contribution(instance.status, instance.rating)
+    apply_review_delta(instance.property_id, -count, -total)
+
+
+@receiver(pre_save, sender=Booking)
+def remember_booking_state(sender, instance, **kwargs):
+    instance._occupancy_state = None
+    if instance.pk:
+        instance._occupancy_state = (
+            Booking.objects.filter(pk=instance.pk)
+            .values_list('property_id', 'status', 'check_in', 'check_out', 'total_price', 'deposits')
+            .first()
+        )
+
+
+@receiver(post_save, sender=Booking)
+def update_occupancy_on_save(sender, instance, **kwargs):
+    previous = getattr(instance, '_occupancy_state', None)
+    previous = previous[:4] if previous else None
+    current = (instance.property_id, instance.status, instance.check_in, instance.check_out)
+    approved = Booking.STATUS.Approved
+
+    if previous == current:
+        return
+    if previous and previous[1] == approved and previous[0] != instance.property_id:
+        rebuild_occupancy(previous[0])
+    if instance.status == approved or (previous and previous[1] == approved):
+        rebuild_occupancy(instance.property_id)
+
+
+@receiver(post_delete, sender=Booking)
+def update_occupancy_on_delete(sender, instance, **kwargs):
+    if instance.status == Booking.STATUS.Approved:
+        rebuild_occupancy(instance.property_id, create=False)
+
+
+@receiver(post_save, sender=Booking)
+def update_month_stats_on_save(sender, instance, **kwargs):
+    previous = getattr(instance, '_occupancy_state', None)
+    current = (
+        instance.property_id, instance.status, instance.check_in, instance.check_out,
+        instance.total_price, instance.deposits,
+    )
+    approved = Booking.STATUS.Approved
+
+    if previous == current:
+        return
+    if previous and previous[1] == approved:
+        refresh_month_stats(previous[0], months_between(previous[2], previous[3]))
+    if instance.status == approved:
+        refresh_month_stats(instance.property_id, months_between(instance.check_in, instance.check_out))
+
+
+@receiver(post_delete, sender=Booking)
+def update_month_stats_on_delete(sender, instance, **kwargs):
+    if instance.status == Booking.STATUS.Approved:
+        refresh_month_stats(instance.property_id, months_between(instance.check_in, instance.check_out), create=False)
+
+
+@receiver(post_save, sender=PropertyImage)
+@receiver(post_delete, sender=PropertyImage)
+def update_primary_image(sender, instance, **kwargs):
+    refresh_primary_image(Property.objects.filter(pk=instance.property_id))
+
+
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+def drop_rate_card(sender, instance, **kwargs):
+    invalidate_rate_card(instance.pk)
+
+
+def property_content_changed(sender, instance, **kwargs):
+    if isinstance(instance, Property):
+        property_id = instance.pk
+    else:
+        property_id = instance.property_id
+        touch_property(property_id)
+    # bump now for this process and again after commit, so a reader that
+    # rebuilt the entry from pre-commit data cannot keep it alive
+    bump_property_version(property_id)
+    transaction.on_commit(lambda: bump_property_version(property_id))
+
+
+# Booking is included because property_stats/booking_count are part of the payload
+for model in (Property, PropertyImage, BedroomImage, PropertyVideo, Review, Booking):
+    post_save.connect(property_content_changed, sender=model, dispatch_uid=f'property_content_save_{model.__name__}')
+    post_delete.connect(property_content_changed, sender=model, dispatch_uid=f'property_content_delete_{model.__name__}')
+
+
+# the weekly/monthly rollups and cached analytics sum these rows, so a delete
+# reopens the periods from the deleted day on
+
+@receiver(post_delete, sender=ContectUs)
+def reopen_inquiry_day(sender, instance, **kwargs):
+    reopen_periods(timezone.localdate(instance.created_at))
+
+
+@receiver(post_delete, sender=DailyAnalytics)
+def reopen_analytics_day(sender, instance, origin=None, **kwargs):
+    # a property's own delete reopens once, from its first day (below)
+    if isinstance(origin, Property) or getattr(origin, 'model', None) is Property:
+        return
+    reopen_periods(instance.date)
+
+
+@receiver(pre_delete, sender=Property)
+def reopen_property_days(sender, instance, **kwargs):
+    first = DailyAnalytics.objects.filter(property=instance).aggregate(first=Min('date'))['first']
+    if first is not None:
+        reopen_periods(first)
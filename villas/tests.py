@@ -0,0 +1,1220 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from datetime import date, timedelta
+
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient, APIRequestFactory
+from auditlog.models import LogEntry
+
+from accounts.models import User
+from .models import Property, PropertyImage, PropertyOccupancy, Review, ReviewStatus, Booking, Favorite, DailyAnalytics
+from .models import ExternalCalendarBlock, ExternalCalendarSync, PropertyMonthStats, ArchivedBooking
+from .models import AnalyticsEvent, AnalyticsWatermark, SiteVisitorSketch, VisitorSketch, WeeklyAnalytics, MonthlyAnalytics
+from .utils import validate_date_range
+
+
+# the views count analytics as they serve; write them straight through so the
+# tests can read them back at once
+_write_through = override_settings(ANALYTICS_FLUSH_INTERVAL=0)
+
+
+def setUpModule():
+    _write_through.enable()
+
+
+def tearDownModule():
+    _write_through.disable()
+
+
+class ReviewCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='guest@test.com', name='Guest', password='guestpass')
+        self.other = User.objects.create_user(email='other@test.com', name='Other', password='otherpass')
+        self.prop = Property.objects.create(title='Sea Breeze', city='Speightstown')
+
+    def assertCounters(self, count, total, avg):
+        self.prop.refresh_from_db()
+        self.assertEqual(self.prop.review_count, count)
+        self.assertEqual(self.prop.rating_sum, total)
+        self.assertEqual(self.prop.avg_rating, Decimal(avg))
+
+    def test_only_approved_reviews_are_counted(self):
+        review = Review.objects.create(property=self.prop, user=self.user, rating=4)
+        self.assertCounters(0, 0, '0')
+
+        review.status = ReviewStatus.APPROVED
+        review.save()
+        Review.objects.create(property=self.prop, user=self.other, rating=5, status=ReviewStatus.APPROVED)
+        self.assertCounters(2, 9, '4.50')
+
+        review.status = ReviewStatus.DECLINED
+        review.save()
+        self.assertCounters(1, 5, '5.00')
+
+    def test_delete_and_rebuild(self):
+        review = Review.objects.create(property=self.prop, user=self.user, rating=3, status=ReviewStatus.APPROVED)
+        self.assertCounters(1, 3, '3.00')
+        review.delete()
+        self.assertCounters(0, 0, '0')
+
+        Review.objects.create(property=self.prop, user=self.user, rating=2, status=ReviewStatus.APPROVED)
+        Property.objects.filter(pk=self.prop.pk).update(review_count=7, rating_sum=1, avg_rating=0)
+        call_command('rebuild_review_counters', stdout=StringIO())
+        self.assertCounters(1, 2, '2.00')
+
+    def test_stale_property_save_keeps_counters(self):
+        stale = Property.objects.get(pk=self.prop.pk)
+        Review.objects.create(property=self.prop, user=self.user, rating=4, status=ReviewStatus.APPROVED)
+        stale.title = 'Sea Breeze Villa'
+        stale.save()
+        self.assertCounters(1, 4, '4.00')
+        self.assertEqual(self.prop.title, 'Sea Breeze Villa')
+
+
+class PropertyBookingStatsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        start = date.today() + timedelta(days=10)
+        for i in range(3):
+            prop = Property.objects.create(title=f'Villa {i}', status=Property.StatusType.PUBLISHED)
+            for status in (Booking.STATUS.Approved, Booking.STATUS.Pending, Booking.STATUS.Pending):
+                Booking.objects.create(
+                    property=prop, full_name='Guest', email='guest@test.com', status=status,
+                    check_in=start, check_out=start + timedelta(days=2),
+                )
+
+    def test_list_stats_use_one_grouped_query(self):
+        url = reverse('property-list')
+        with self.assertNumQueries(6):
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        for row in resp.data['results']:
+            self.assertEqual(row['booking_count'], 3)
+            self.assertEqual(row['property_stats']['approved'], 1)
+            self.assertEqual(row['property_stats']['pending'], 2)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        for i in range(5):
+            Property.objects.create(title=f'Villa {i}', status=Property.StatusType.PUBLISHED)
+
+    def test_cursor_mode_walks_every_row_without_count(self):
+        url = reverse('property-list')
+        resp = self.client.get(url, {'cursor': '', 'page_size': 2})
+        self.assertNotIn('count', resp.data)
+
+        seen = [row['id'] for row in resp.data['results']]
+        while resp.data['next']:
+            resp = self.client.get(resp.data['next'])
+            seen += [row['id'] for row in resp.data['results']]
+
+        expected = list(Property.objects.order_by('-created_at', 'id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_page_mode_is_unchanged(self):
+        resp = self.client.get(reverse('property-list'), {'page_size': 2})
+        self.assertEqual(resp.data['count'], 5)
+
+    def test_cursor_mode_rejects_search_and_near(self):
+        for params in ({'search': 'villa'}, {'near': '18.1,-63.1'}):
+            resp = self.client.get(reverse('property-list'), {'cursor': '', **params})
+            self.assertEqual(resp.status_code, 400)
+            self.assertIn('cursor', resp.data)
+
+
+class PropertySearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.beach = Property.objects.create(
+            title='Beach House', city='Holetown', status=Property.StatusType.PUBLISHED,
+            description='Steps from the sand.', outdoor_amenities={'pool': 'private'},
+        )
+        self.hill = Property.objects.create(
+            title='Hill Retreat', city='Bathsheba', status=Property.StatusType.PUBLISHED,
+            description='Quiet hillside villa with a view of the beach.',
+        )
+
+    def search(self, term):
+        resp = self.client.get(reverse('property-list'), {'search': term})
+        return [row['id'] for row in resp.data['results']]
+
+    def test_results_are_ranked_by_relevance(self):
+        self.assertEqual(self.search('beach'), [self.beach.id, self.hill.id])
+
+    def test_amenities_prefixes_and_updates_are_indexed(self):
+        self.assertEqual(self.search('priv'), [self.beach.id])
+        self.hill.title = 'Private Hill Retreat'
+        self.hill.save()
+        self.assertEqual(set(self.search('private')), {self.beach.id, self.hill.id})
+        self.assertEqual(self.search('"); DROP'), [])
+
+    def test_only_normalized_amenity_keys_are_indexed(self):
+        self.hill.interior_amenities = {'wifi': False, 'chef': True}
+        self.hill.save()
+        self.assertEqual(self.search('chef'), [self.hill.id])
+        self.assertEqual(self.search('wifi'), [])
+        self.assertEqual(self.search('true'), [])
+        self.assertEqual(self.search('false'), [])
+        self.hill.interior_amenities = {'wifi': True}
+        self.hill.save(update_fields=['interior_amenities'])
+        self.assertEqual(self.search('wifi'), [self.hill.id])
+
+
+class AmenityFilterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        published = Property.StatusType.PUBLISHED
+        self.both = Property.objects.create(
+            title='Both', status=published, price=900,
+            interior_amenities={'wifi': True}, outdoor_amenities={'pool': 'private'},
+        )
+        self.wifi = Property.objects.create(title='Wifi', status=published, price=300, interior_amenities=['WiFi'])
+        self.pool = Property.objects.create(
+            title='Pool', status=published, price=500, outdoor_amenities={'pool': 'private', 'wifi': False},
+        )
+
+    def ids(self, **params):
+        resp = self.client.get(reverse('property-list'), params)
+        return {row['id'] for row in resp.data['results']}
+
+    def test_all_and_any_semantics(self):
+        self.assertEqual(self.ids(amenities='wifi,pool_private'), {self.both.id})
+        self.assertEqual(
+            self.ids(amenities='wifi,pool_private', amenities_match='any'),
+            {self.both.id, self.wifi.id, self.pool.id},
+        )
+
+    def test_composes_with_price_and_follows_saves(self):
+        self.assertEqual(self.ids(amenities='wifi', max_price=500), {self.wifi.id})
+        self.pool.outdoor_amenities = {'pool': 'shared'}
+        self.pool.save()
+        self.assertEqual(self.ids(amenities='pool_private'), {self.both.id})
+        self.assertEqual(self.ids(amenities='pool'), {self.both.id, self.pool.id})
+
+
+class GeoSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        published = Property.StatusType.PUBLISHED
+        # Holetown, Bridgetown (~13 km apart) and Kingston, Jamaica
+        self.holetown = Property.objects.create(title='Holetown', status=published, latitude='13.1872', longitude='-59.6383')
+        self.bridgetown = Property.objects.create(title='Bridgetown', status=published, latitude='13.0975', longitude='-59.6167')
+        self.kingston = Property.objects.create(title='Kingston', status=published, latitude='17.9712', longitude='-76.7936')
+        Property.objects.create(title='Nowhere', status=published)
+
+    def get(self, **params):
+        return self.client.get(reverse('property-list'), params)
+
+    def test_radius_search_sorted_by_distance(self):
+        resp = self.get(near='13.19,-59.64', radius_km=20)
+        self.assertEqual([row['id'] for row in resp.data['results']], [self.holetown.id, self.bridgetown.id])
+        self.assertLess(resp.data['results'][0]['distance_km'], 1)
+        self.assertAlmostEqual(resp.data['results'][1]['distance_km'], 10.4, delta=0.5)
+
+    def test_bbox_and_invalid_params(self):
+        resp = self.get(bbox='-60,13,-59,14')
+        self.assertEqual({row['id'] for row in resp.data['results']}, {self.holetown.id, self.bridgetown.id})
+        self.assertEqual(self.get(near='abc').status_code, 400)
+
+
+class AvailabilityFilterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        published = Property.StatusType.PUBLISHED
+        self.booked = Property.objects.create(title='Booked', status=published)
+        self.pending = Property.objects.create(title='Pending only', status=published)
+        self.start = date.today() + timedelta(days=30)
+        for prop, status in ((self.booked, Booking.STATUS.Approved), (self.pending, Booking.STATUS.Pending)):
+            Booking.objects.create(
+                property=prop, full_name='Guest', email='guest@test.com', status=status,
+                check_in=self.start, check_out=self.start + timedelta(days=5),
+            )
+
+    def ids(self, check_in, check_out):
+        resp = self.client.get(reverse('property-list'), {'check_in': check_in, 'check_out': check_out})
+        return {row['id'] for row in resp.data['results']}
+
+    def test_overlapping_approved_booking_hides_property(self):
+        self.assertEqual(self.ids(self.start + timedelta(days=2), self.start + timedelta(days=9)), {self.pending.id})
+        self.assertEqual(
+            self.ids(self.start + timedelta(days=6), self.start + timedelta(days=9)),
+            {self.booked.id, self.pending.id},
+        )
+
+    def test_requires_valid_range(self):
+        resp = self.client.get(reverse('property-list'), {'check_in': self.start})
+        self.assertEqual(resp.status_code, 400)
+        resp = self.client.get(reverse('property-list'), {'check_out': self.start})
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn('check_in', resp.data)
+
+
+class AnonymousPropertyCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='guest@test.com', name='Guest', password='guestpass')
+        self.prop = Property.objects.create(title='Cached', slug='cached', status=Property.StatusType.PUBLISHED)
+
+    def test_list_is_served_from_cache_until_a_review_changes(self):
+        url = reverse('property-list')
+        self.client.get(url, {'page': 1})
+        with self.assertNumQueries(0):
+            resp = self.client.get(url, {'page': 1})
+        self.assertEqual(resp.data['results'][0]['total_reviews'], 0)
+
+        Review.objects.create(property=self.prop, user=self.user, rating=5, status=ReviewStatus.APPROVED)
+        resp = self.client.get(url, {'page': 1})
+        self.assertEqual(resp.data['results'][0]['total_reviews'], 1)
+
+    def test_signed_in_users_bypass_the_cache(self):
+        Favorite.objects.create(user=self.user, property=self.prop)
+        url = reverse('property-detail', kwargs={'pk': self.prop.pk})
+        self.assertFalse(self.client.get(url).data['is_favorited'])
+        self.client.force_authenticate(user=self.user)
+        self.assertTrue(self.client.get(url).data['is_favorited'])
+
+
+class PropertyCardViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.prop = Property.objects.create(title='Card', status=Property.StatusType.PUBLISHED, add_guest=6)
+        PropertyImage.objects.create(property=self.prop, image='properties/first.jpg')
+        PropertyImage.objects.create(property=self.prop, image='properties/second.jpg')
+
+    def test_card_rows_are_compact_and_skip_prefetches(self):
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('property-list'), {'view': 'card'})
+        row = resp.data['results'][0]
+        self.assertEqual(row['guests'], 6)
+        self.assertTrue(row['image'].endswith('/media/properties/first.jpg'))
+        self.assertNotIn('description', row)
+
+        PropertyImage.objects.filter(image='properties/first.jpg').get().delete()
+        self.prop.refresh_from_db()
+        self.assertEqual(self.prop.primary_image, 'properties/second.jpg')
+
+    def test_sparse_fieldsets(self):
+        resp = self.client.get(reverse('property-list'), {'fields': 'id,title,bogus'})
+        self.assertEqual(set(resp.data['results'][0]), {'id', 'title'})
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.prop = Property.objects.create(title='Etag', slug='etag', status=Property.StatusType.PUBLISHED)
+        self.url = reverse('property-detail', kwargs={'pk': self.prop.pk})
+
+    def test_matching_etag_skips_the_detail_query(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(4):  # validators row + analytics upsert (insert-or-ignore, update) + event log insert
+            resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+
+        slug_url = reverse('property-detail-by-slug', kwargs={'slug': 'etag'})
+        self.assertEqual(self.client.get(slug_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_child_change_invalidates_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        PropertyImage.objects.create(property=self.prop, image='properties/new.jpg')
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+
+
+class OccupancyIndexTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.prop = Property.objects.create(title='Occupied', status=Property.StatusType.PUBLISHED)
+        self.url = reverse('property-availability', kwargs={'property_pk': self.prop.pk})
+
+    def book(self, check_in, check_out, status=Booking.STATUS.Approved):
+        return Booking.objects.create(
+            property=self.prop, full_name='Guest', email='guest@test.com', status=status,
+            check_in=date.fromisoformat(check_in), check_out=date.fromisoformat(check_out),
+        )
+
+    def test_ranges_are_merged_across_a_twelve_month_window(self):
+        self.book('2030-01-03', '2030-01-06')
+        self.book('2030-01-05', '2030-01-09')
+        self.book('2030-01-10', '2030-01-12')  # touches the previous stay
+        self.book('2030-03-28', '2030-04-02')
+        self.book('2030-06-01', '2030-06-05', status=Booking.STATUS.Pending)
+
+        with self.assertNumQueries(1):
+            resp = self.client.get(self.url, {'month': 1, 'year': 2030, 'months': 12})
+        self.assertEqual(resp.data, [
+            {'start': '2030-01-03', 'end': '2030-01-12'},
+            {'start': '2030-03-28', 'end': '2030-04-02'},
+        ])
+
+        resp = self.client.get(self.url, {'month': 4, 'year': 2030})
+        self.assertEqual(resp.data, [{'start': '2030-04-01', 'end': '2030-04-02'}])
+
+    def test_leaving_approved_updates_the_index(self):
+        booking = self.book('2030-05-01', '2030-05-04')
+        booking.status = Booking.STATUS.Cancelled
+        booking.save()
+        resp = self.client.get(self.url, {'start': '2030-01-01', 'end': '2030-12-31'})
+        self.assertEqual(resp.data, [])
+
+        self.book('2030-07-01', '2030-07-04')
+        self.prop.delete()
+        self.assertFalse(PropertyOccupancy.objects.exists())
+
+
+class BatchAvailabilityTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.first = Property.objects.create(title='First', status=Property.StatusType.PUBLISHED)
+        self.second = Property.objects.create(title='Second', status=Property.StatusType.PUBLISHED)
+        for prop, check_in, check_out in (
+            (self.first, '2030-02-03', '2030-02-05'),
+            (self.first, '2030-02-05', '2030-02-08'),
+            (self.second, '2030-01-25', '2030-02-02'),
+        ):
+            Booking.objects.create(
+                property=prop, full_name='Guest', email='guest@test.com', status=Booking.STATUS.Approved,
+                check_in=date.fromisoformat(check_in), check_out=date.fromisoformat(check_out),
+            )
+
+    def test_booked_and_free_ranges_for_many_properties(self):
+        params = {'ids': f'{self.first.pk},{self.second.pk}', 'start': '2030-02-01', 'end': '2030-02-28'}
+        # visibility check, then one query over the bookings and blocks
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('property-availability-batch'), params)
+        first = resp.data['properties'][str(self.first.pk)]
+        self.assertEqual(first['booked'], [{'start': '2030-02-03', 'end': '2030-02-08'}])
+        self.assertEqual(first['free'], [
+            {'start': '2030-02-01', 'end': '2030-02-02'},
+            {'start': '2030-02-09', 'end': '2030-02-28'},
+        ])
+        second = resp.data['properties'][str(self.second.pk)]
+        self.assertEqual(second['free'], [{'start': '2030-02-03', 'end': '2030-02-28'}])
+        self.assertNotIn('Cache-Control', resp)
+
+    def test_past_windows_are_cacheable(self):
+        resp = self.client.get(reverse('property-availability-batch'), {'ids': self.first.pk, 'start': '2020-01-01', 'end': '2020-01-31'})
+        self.assertIn('max-age', resp['Cache-Control'])
+
+    def test_unknown_and_unpublished_ids_are_errors(self):
+        draft = Property.objects.create(title='Draft')
+        params = {'ids': f'{self.first.pk},{draft.pk},{draft.pk + 100}', 'start': '2030-02-01', 'end': '2030-02-28'}
+        resp = self.client.get(reverse('property-availability-batch'), params)
+        self.assertIn('booked', resp.data['properties'][str(self.first.pk)])
+        self.assertEqual(resp.data['properties'][str(draft.pk)], {'error': 'Property not found.'})
+        self.assertEqual(resp.data['properties'][str(draft.pk + 100)], {'error': 'Property not found.'})
+
+
+
+class PriceQuoteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(email='guest@test.com', name='Guest', password='guestpass')
+        self.prop = Property.objects.create(
+            title='Rated', price=Decimal('750'), security_deposit=Decimal('1000'), damage_deposit=Decimal('500'),
+            booking_rate={'booking': [{'day': 3, 'price': 600}], 'weekly': 3500, 'monthly': 'n/a'},
+            status=Property.StatusType.PUBLISHED,
+        )
+
+    def quote(self, *stays):
+        items = [{'property': pk, 'check_in': start, 'check_out': end} for pk, start, end in stays]
+        resp = self.client.post(reverse('property-quotes-batch'), {'items': items}, format='json')
+        self.assertEqual(resp.status_code, 200)
+        return resp.data['quotes']
+
+    def test_longest_applicable_tier_prices_the_stay(self):
+        short, mid, week, missing, empty = self.quote(
+            (self.prop.pk, '2030-01-01', '2030-01-03'),
+            (self.prop.pk, '2030-01-01', '2030-01-05'),
+            (self.prop.pk, '2030-01-01', '2030-01-11'),
+            (self.prop.pk + 100, '2030-01-01', '2030-01-03'),
+            (self.prop.pk, '2030-01-03', '2030-01-03'),
+        )
+        self.assertEqual((short['nightly_rate'], short['subtotal'], short['total']), ('750.00', '1500.00', '3000.00'))
+        self.assertEqual((mid['nightly_rate'], mid['subtotal']), ('600.00', '2400.00'))
+        self.assertEqual((week['nightly_rate'], week['subtotal']), ('500.00', '5000.00'))
+        self.assertEqual(week['security_deposit'], '1000.00')
+        self.assertEqual(missing['error'], 'Property not found.')
+        self.assertIn('error', empty)
+
+    def test_rate_card_is_cached_until_property_save(self):
+        self.quote((self.prop.pk, '2030-01-01', '2030-01-03'))
+        # only the visibility check
+        with self.assertNumQueries(1):
+            self.quote((self.prop.pk, '2030-01-01', '2030-01-03'))
+
+        self.prop.price = Decimal('800')
+        self.prop.save()
+        [quote] = self.quote((self.prop.pk, '2030-01-01', '2030-01-03'))
+        self.assertEqual(quote['subtotal'], '1600.00')
+
+    def test_unpublished_property_is_not_quoted(self):
+        draft = Property.objects.create(title='Draft', price=Decimal('500'))
+        [quote] = self.quote((draft.pk, '2030-01-01', '2030-01-03'))
+        self.assertEqual(quote['error'], 'Property not found.')
+        self.assertNotIn('total', quote)
+
+    def test_booking_total_price_is_quoted_server_side(self):
+        self.client.force_authenticate(self.user)
+        check_in = date.today() + timedelta(days=30)
+        resp = self.client.post(reverse('booking-list'), {
+            'property': self.prop.pk, 'full_name': 'Guest', 'email': 'guest@test.com',
+            'check_in': check_in, 'check_out': check_in + timedelta(days=4), 'total_price': '1.00',
+        }, format='json')
+        self.assertEqual(resp.status_code, 201)
+        booking = Booking.objects.get()
+        self.assertEqual((booking.total_price, booking.deposits), (Decimal('3900.00'), Decimal('1500.00')))
+
+        # the refundable deposits are not revenue
+        booking.status = Booking.STATUS.Approved
+        booking.save()
+        revenue = PropertyMonthStats.objects.filter(property=self.prop).aggregate(total=Sum('revenue'))['total']
+        self.assertEqual(revenue, Decimal('2400.00'))
+
+
+
+class BulkBookingStatusTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_user(email='manager@test.com', name='Manager', password='managerpass', role='manager')
+        )
+        self.prop = Property.objects.create(title='Busy')
+        self.other = Property.objects.create(title='Quiet')
+        start = date.today() + timedelta(days=10)
+        self.existing = self.book(self.prop, start, start + timedelta(days=3), Booking.STATUS.Approved)
+        self.clash = self.book(self.prop, start + timedelta(days=2), start + timedelta(days=5))
+        self.first = self.book(self.prop, start + timedelta(days=10), start + timedelta(days=12))
+        self.second = self.book(self.prop, start + timedelta(days=11), start + timedelta(days=14))
+        self.elsewhere = self.book(self.other, start, start + timedelta(days=3))
+
+    def book(self, prop, check_in, check_out, status=Booking.STATUS.Pending):
+        return Booking.objects.create(
+            property=prop, full_name='Guest', email='guest@test.com', status=status, check_in=check_in, check_out=check_out,
+        )
+
+    def transition(self, ids, status):
+        return self.client.post(reverse('booking-bulk-status'), {'ids': ids, 'status': status}, format='json')
+
+    def test_bulk_approve_checks_existing_and_in_batch_overlaps(self):
+        ids = [self.clash.pk, self.first.pk, self.second.pk, self.elsewhere.pk, self.existing.pk, 0]
+        resp = self.transition(ids, 'approved')
+        self.assertEqual(resp.status_code, 200)
+
+        results = {item['id']: item for item in resp.data['results']}
+        self.assertIn('error', results[self.clash.pk])
+        self.assertEqual(results[self.first.pk]['result'], 'updated')
+        self.assertIn('error', results[self.second.pk])
+        self.assertEqual(results[self.elsewhere.pk]['result'], 'updated')
+        self.assertEqual(results[self.existing.pk]['result'], 'unchanged')
+        self.assertEqual(results[0]['error'], 'Booking not found.')
+
+        approved = set(Booking.objects.filter(status=Booking.STATUS.Approved).values_list('pk', flat=True))
+        self.assertEqual(approved, {self.existing.pk, self.first.pk, self.elsewhere.pk})
+        counts = dict(DailyAnalytics.objects.values_list('property_id', 'bookings'))
+        self.assertEqual(counts, {self.prop.pk: 1, self.other.pk: 1})
+        self.assertEqual(len(PropertyOccupancy.objects.get(property=self.prop).intervals), 2)
+
+        entries = LogEntry.objects.get_for_objects(Booking.objects.filter(pk=self.first.pk))
+        entry = entries.get(action=LogEntry.Action.UPDATE)
+        self.assertEqual(entry.changes_dict, {'status': ['pending', 'approved']})
+        self.assertEqual(entry.actor.email, 'manager@test.com')
+        self.assertFalse(LogEntry.objects.get_for_objects(Booking.objects.filter(pk=self.clash.pk)).filter(
+            action=LogEntry.Action.UPDATE).exists())
+
+    def test_bulk_cancel_frees_the_dates(self):
+        resp = self.transition([self.existing.pk], 'cancelled')
+        self.assertEqual(resp.data['results'][0]['result'], 'updated')
+        self.assertEqual(PropertyOccupancy.objects.get(property=self.prop).intervals, [])
+        self.assertEqual(self.transition([self.clash.pk], 'approved').data['results'][0]['result'], 'updated')
+
+    def test_rejects_unknown_status(self):
+        self.assertEqual(self.transition([self.first.pk], 'maybe').status_code, 400)
+
+
+
+class BookingSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(
+            User.objects.create_user(email='manager@test.com', name='Manager', password='managerpass', role='manager')
+        )
+        prop = Property.objects.create(title='Searched')
+        for name, email, phone, check_in in (
+            ('Alice Walker', 'alice@example.com', '+1 (246) 555-0101', date(2030, 5, 1)),
+            ('Bob Stone', 'bob@mail.test', '246-555-0199', date(2030, 5, 1)),
+            ('Carol King', 'carol@example.com', '', date(2030, 6, 1)),
+        ):
+            Booking.objects.create(
+                property=prop, full_name=name, email=email, phone=phone,
+                check_in=check_in, check_out=check_in + timedelta(days=3),
+            )
+
+    def names(self, search):
+        resp = self.client.get(reverse('booking-list'), {'search': search})
+        return [item['full_name'] for item in resp.data['results']]
+
+    def test_substring_search_over_name_email_and_phone(self):
+        self.assertEqual(self.names('walk'), ['Alice Walker'])
+        self.assertEqual(self.names('EXAMPLE.COM'), ['Carol King', 'Alice Walker'])
+        self.assertEqual(self.names('2465550199'), ['Bob Stone'])
+        self.assertEqual(self.names('555-0101'), ['Alice Walker'])
+        self.assertEqual(self.names('ol'), ['Carol King'])
+
+    def test_index_follows_updates(self):
+        Booking.objects.filter(full_name='Bob Stone').first().delete()
+        carol = Booking.objects.get(full_name='Carol King')
+        carol.full_name = 'Carol Stone'
+        carol.save()
+        self.assertEqual(self.names('stone'), ['Carol Stone'])
+
+    def test_date_search_is_stably_ordered(self):
+        self.assertEqual(self.names('2030-05-01'), ['Bob Stone', 'Alice Walker'])
+
+
+
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.agent = User.objects.create_user(email='agent@test.com', name='Agent', password='agentpass', role='agent')
+        self.prop = Property.objects.create(title='Villa, Sunset', assigned_agent=self.agent, status=Property.StatusType.PUBLISHED)
+        self.other = Property.objects.create(title='Other', assigned_agent=self.agent)
+        self.booking = Booking.objects.create(
+            property=self.prop, full_name='Guest', email='guest@test.com', status=Booking.STATUS.Approved,
+            check_in=date.today() + timedelta(days=5), check_out=date.today() + timedelta(days=8),
+        )
+        Booking.objects.create(
+            property=self.other, full_name='Guest', email='guest@test.com',
+            check_in=date.today() + timedelta(days=5), check_out=date.today() + timedelta(days=8),
+        )
+
+    def test_property_feed_is_served_with_etag_until_a_booking_changes(self):
+        url = reverse('property-calendar-feed', args=[self.prop.pk])
+        resp = self.client.get(url)
+        self.assertEqual(resp['Content-Type'], 'text/calendar; charset=utf-8')
+        body = resp.content.decode()
+        self.assertIn(f'UID:booking-{self.booking.pk}@eastmondvilla', body)
+        self.assertIn(f"DTEND;VALUE=DATE:{(self.booking.check_out + timedelta(days=1)).strftime('%Y%m%d')}", body)
+        self.assertIn('SUMMARY:Booked - Villa\\, Sunset', body)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag']).status_code, 304)
+
+        self.booking.status = Booking.STATUS.Cancelled
+        self.booking.save()
+        fresh = self.client.get(url, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotIn('BEGIN:VEVENT', fresh.content.decode())
+
+    def test_unknown_or_hidden_property_is_404(self):
+        self.assertEqual(self.client.get(reverse('property-calendar-feed', args=[self.prop.pk + 100])).status_code, 404)
+
+        # an unpublished property's feed is only served to those who may see it
+        draft_url = reverse('property-calendar-feed', args=[self.other.pk])
+        self.assertEqual(self.client.get(draft_url).status_code, 404)
+        self.client.force_login(self.agent)
+        self.assertEqual(self.client.get(draft_url).status_code, 200)
+
+    def test_agent_feed_through_signed_link(self):
+        self.client.force_authenticate(self.agent)
+        url = self.client.get(reverse('agent-calendar-link')).data['url']
+        self.client.force_authenticate(None)
+
+        body = self.client.get(url).content.decode()
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        self.assertEqual(self.client.get(url.replace('.ics', 'x.ics')).status_code, 404)
+
+
+
+class FakeCalendarHandler(BaseHTTPRequestHandler):
+    """Serves `server.feeds[path]` as ICS, honouring If-None-Match."""
+
+    def do_GET(self):
+        feed = self.server.feeds.get(self.path)
+        self.server.requests.append((self.path, self.headers.get('If-None-Match')))
+        if feed is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = f'"{hash(feed)}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = feed.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/calendar')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def ics(*events):
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0']
+    for uid, start, end, extra in events:
+        lines += ['BEGIN:VEVENT', f'UID:{uid}', f'DTSTART;VALUE=DATE:{start}', f'DTEND;VALUE=DATE:{end}', *extra, 'END:VEVENT']
+    return '\r\n'.join(lines + ['END:VCALENDAR']) + '\r\n'
+
+
+class CalendarImportTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeCalendarHandler)
+        cls.server.feeds, cls.server.requests = {}, []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.feeds.clear()
+        self.server.requests.clear()
+        base = f'http://127.0.0.1:{self.server.server_port}'
+        self.prop = Property.objects.create(title='Synced', calendar_link=f'{base}/a.ics')
+        self.broken = Property.objects.create(title='Broken', calendar_link=f'{base}/missing.ics')
+        self.server.feeds['/a.ics'] = ics(
+            ('one@airbnb', '20300110', '20300115', ['SUMMARY:Reserved']),
+            ('two@airbnb', '20300201', '20300203', ['SUMMARY:Long summary that', ' continues here']),
+            ('gone@airbnb', '20300301', '20300302', ['STATUS:CANCELLED']),
+            ('booking-1@eastmondvilla', '20300401', '20300405', []),
+        )
+
+    def blocks(self):
+        return dict(ExternalCalendarBlock.objects.filter(property=self.prop).values_list('uid', 'end'))
+
+    def test_import_is_conditional_and_incremental(self):
+        out = StringIO()
+        with self.assertLogs('villas.calendar_import', 'WARNING'):
+            call_command('import_calendars', '--workers', '2', stdout=out)
+        self.assertIn('1 changed', out.getvalue())
+        self.assertIn('1 failed', out.getvalue())
+        self.assertEqual(self.blocks(), {'one@airbnb': date(2030, 1, 14), 'two@airbnb': date(2030, 2, 2)})
+        self.assertEqual(ExternalCalendarBlock.objects.get(uid='two@airbnb').summary, 'Long summary thatcontinues here')
+        self.assertTrue(validate_date_range(self.prop, date(2030, 1, 14), date(2030, 1, 20)))
+        self.assertFalse(validate_date_range(self.prop, date(2030, 1, 15), date(2030, 1, 20)))
+        self.assertEqual(PropertyOccupancy.objects.get(property=self.prop).intervals[0], ['2030-01-10', '2030-01-14'])
+        self.assertTrue(ExternalCalendarSync.objects.get(property=self.broken).error)
+
+        call_command('import_calendars', '--property', str(self.prop.pk), stdout=out)
+        self.assertIn('1 not modified', out.getvalue())
+        self.assertIsNotNone(self.server.requests[-1][1])
+
+        self.server.feeds['/a.ics'] = ics(('one@airbnb', '20300110', '20300112', []), ('three@vrbo', '20300501', '20300502', []))
+        block_id = ExternalCalendarBlock.objects.get(uid='one@airbnb').pk
+        call_command('import_calendars', '--property', str(self.prop.pk), stdout=out)
+        self.assertEqual(self.blocks(), {'one@airbnb': date(2030, 1, 11), 'three@vrbo': date(2030, 5, 1)})
+        self.assertEqual(ExternalCalendarBlock.objects.get(uid='one@airbnb').pk, block_id)
+
+    def test_removed_link_drops_its_blocks(self):
+        with self.assertLogs('villas.calendar_import', 'WARNING'):
+            call_command('import_calendars', stdout=StringIO())
+            Property.objects.filter(pk=self.prop.pk).update(calendar_link=None)
+            call_command('import_calendars', stdout=StringIO())
+        self.assertEqual(self.blocks(), {})
+
+
+
+class MonthStatsTests(TestCase):
+    def setUp(self):
+        self.agent = User.objects.create_user(email='agent@test.com', name='Agent', password='agentpass', role='agent')
+        self.prop = Property.objects.create(title='Rolled up', assigned_agent=self.agent)
+        # 3 nights in January, 2 in February
+        self.booking = Booking.objects.create(
+            property=self.prop, full_name='Guest', email='guest@test.com', status=Booking.STATUS.Approved,
+            check_in=date(2030, 1, 29), check_out=date(2030, 2, 3), total_price=Decimal('1000.00'),
+        )
+        Booking.objects.create(
+            property=self.prop, full_name='Pending', email='guest@test.com',
+            check_in=date(2030, 1, 5), check_out=date(2030, 1, 9), total_price=Decimal('800.00'),
+        )
+
+    def stats(self):
+        return {
+            row.month: (row.booked_nights, row.booking_count, row.revenue, row.occupancy_rate)
+            for row in PropertyMonthStats.objects.filter(property=self.prop)
+        }
+
+    def test_rollup_follows_booking_changes(self):
+        self.assertEqual(self.stats(), {
+            date(2030, 1, 1): (3, 1, Decimal('600.00'), Decimal('9.68')),
+            date(2030, 2, 1): (2, 1, Decimal('400.00'), Decimal('7.14')),
+        })
+
+        self.booking.check_out = date(2030, 1, 31)
+        self.booking.save()
+        self.assertEqual(self.stats(), {date(2030, 1, 1): (2, 1, Decimal('1000.00'), Decimal('6.45'))})
+
+        self.booking.status = Booking.STATUS.Cancelled
+        self.booking.save()
+        self.assertEqual(self.stats(), {})
+
+    def test_rebuild_command_matches_incremental_rows(self):
+        expected = self.stats()
+        PropertyMonthStats.objects.all().delete()
+        call_command('rebuild_month_stats', stdout=StringIO())
+        self.assertEqual(self.stats(), expected)
+
+    def test_agent_view_reads_rollup_and_pages_bookings(self):
+        client = APIClient()
+        client.force_authenticate(self.agent)
+        url = reverse('agent-monthly-booking')
+        with self.assertNumQueries(1):
+            resp = client.get(url, {'month': 2, 'year': 2030})
+        [row] = resp.data['data']
+        self.assertEqual((row['booked_nights'], row['total_bookings_this_month'], row['revenue']), (2, 1, Decimal('400.00')))
+
+        page = client.get(row['bookings_url'])
+        self.assertEqual([b['booking_id'] for b in page.data['results']], [self.booking.pk])
+        self.assertEqual(client.get(url, {'month': 2, 'year': 2030, 'property': self.prop.pk + 1}).status_code, 404)
+
+
+
+class BookingArchiveTests(TestCase):
+    def setUp(self):
+        self.guest = User.objects.create_user(email='guest@test.com', name='Guest', password='guestpass')
+        self.prop = Property.objects.create(title='Archived')
+        old = date.today() - timedelta(days=800)
+        self.old = [
+            Booking.objects.create(
+                property=self.prop, user=self.guest, full_name='Old', email='guest@test.com', status=status,
+                check_in=old + timedelta(days=i * 10), check_out=old + timedelta(days=i * 10 + 3),
+            )
+            for i, status in enumerate(['completed', 'cancelled', 'rejected', 'approved'])
+        ]
+        self.recent = Booking.objects.create(
+            property=self.prop, full_name='Recent', email='guest@test.com', status='completed',
+            check_in=date.today() - timedelta(days=20), check_out=date.today() - timedelta(days=15),
+        )
+
+    def test_old_terminal_bookings_move_in_batches(self):
+        version = Property.objects.get(pk=self.prop.pk).content_version
+        out = StringIO()
+        call_command('archive_bookings', '--batch-size', '2', stdout=out)
+        self.assertIn('Archived 3 bookings', out.getvalue())
+
+        archived = set(ArchivedBooking.objects.values_list('id', flat=True))
+        self.assertEqual(archived, {b.pk for b in self.old[:3]})
+        self.assertEqual(
+            set(Booking.objects.values_list('id', flat=True)), {self.old[3].pk, self.recent.pk}
+        )
+        self.assertGreater(Property.objects.get(pk=self.prop.pk).content_version, version)
+        self.assertEqual(ArchivedBooking.objects.get(pk=self.old[1].pk).status, 'cancelled')
+        deleted = LogEntry.objects.filter(action=LogEntry.Action.DELETE, object_id__in=archived)
+        self.assertEqual(deleted.count(), 3)
+
+    def test_history_endpoint_is_read_only_and_scoped(self):
+        call_command('archive_bookings', stdout=StringIO())
+        client = APIClient()
+        client.force_authenticate(self.guest)
+        url = reverse('booking-history-list')
+
+        resp = client.get(url, {'year': self.old[0].check_in.year})
+        self.assertTrue(resp.data['results'])
+        self.assertTrue(all(item['user'] == self.guest.pk for item in resp.data['results']))
+        self.assertEqual(client.get(url, {'year': 1999}).data['results'], [])
+        for year in ('0', '9999', 'soon'):
+            self.assertEqual(client.get(url, {'year': year}).status_code, 400)
+        self.assertEqual(client.delete(reverse('booking-history-detail', args=[self.old[0].pk])).status_code, 405)
+
+        other = User.objects.create_user(email='other@test.com', name='Other', password='otherpass')
+        client.force_authenticate(other)
+        self.assertEqual(client.get(url).data['results'], [])
+
+
+
+
+class AnalyticsEventTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.prop = Property.objects.create(title='Tracked', status=Property.StatusType.PUBLISHED)
+        self.other = Property.objects.create(title='Other', status=Property.StatusType.PUBLISHED)
+        self.user = User.objects.create_user(email='guest@test.com', name='Guest', password='guestpass')
+
+    def rollup(self):
+        from .events import rollup_events
+
+        return rollup_events(settle=timedelta(0))
+
+    def test_hyperloglog_estimates_and_merges(self):
+        from .hll import HyperLogLog
+
+        first, second = HyperLogLog(), HyperLogLog()
+        for i in range(6000):
+            first.add(f'visitor-{i}')
+        for i in range(3000, 9000):
+            second.add(f'visitor-{i}')
+        self.assertAlmostEqual(first.count(), 6000, delta=6000 * 0.05)
+        merged = HyperLogLog.merged([first.to_bytes(), second.to_bytes()])
+        self.assertAlmostEqual(merged.count(), 9000, delta=9000 * 0.05)
+        self.assertEqual(HyperLogLog().count(), 0)
+
+    def test_views_are_logged_with_visitor_and_referrer(self):
+        url = reverse('property-detail', kwargs={'pk': self.prop.pk})
+        self.client.get(url, HTTP_REFERER='https://example.com/', REMOTE_ADDR='10.0.0.1')
+        self.client.force_authenticate(self.user)
+        self.client.get(url)
+
+        anonymous, signed_in = AnalyticsEvent.objects.order_by('id')
+        self.assertEqual(anonymous.event_type, AnalyticsEvent.EventType.VIEW)
+        self.assertEqual(anonymous.referrer, 'https://example.com/')
+        self.assertTrue(anonymous.visitor_id.startswith('anon:'))
+        self.assertNotIn('10.0.0.1', anonymous.visitor_id)
+        self.assertEqual((signed_in.user_id, signed_in.visitor_id), (self.user.pk, f'user:{self.user.pk}'))
+
+    def test_forwarded_for_is_only_trusted_behind_a_proxy(self):
+        from .events import visitor_id
+
+        def visitor(remote, forwarded):
+            request = APIRequestFactory().get('/', REMOTE_ADDR=remote, HTTP_X_FORWARDED_FOR=forwarded)
+            request.user = AnonymousUser()
+            return visitor_id(request)
+
+        self.assertEqual(visitor('10.0.0.1', '1.1.1.1'), visitor('10.0.0.1', '2.2.2.2'))
+        with override_settings(TRUSTED_PROXY_COUNT=1):
+            # the proxy appends the real client address after whatever the client sent
+            self.assertEqual(visitor('10.0.0.1', '1.1.1.1, 3.3.3.3'), visitor('10.0.0.9', '2.2.2.2, 3.3.3.3'))
+            self.assertNotEqual(visitor('10.0.0.1', '3.3.3.3'), visitor('10.0.0.1', '4.4.4.4'))
+
+    def test_rollup_counts_repeat_visitors_once_and_resumes_from_watermark(self):
+        url = reverse('property-detail', kwargs={'pk': self.prop.pk})
+        for _ in range(5):
+            self.client.get(url, REMOTE_ADDR='10.0.0.1')
+        self.client.get(url, REMOTE_ADDR='10.0.0.2')
+        self.client.get(reverse('property-downloaded', kwargs={'pk': self.other.pk}), REMOTE_ADDR='10.0.0.1')
+
+        self.assertEqual(self.rollup(), 7)
+        today = timezone.now().date()
+        daily = DailyAnalytics.objects.get(property=self.prop, date=today)
+        self.assertEqual((daily.views, daily.unique_visitors), (6, 2))
+        self.assertEqual(AnalyticsWatermark.objects.get().last_event_id, AnalyticsEvent.objects.latest('id').id)
+
+        self.client.get(url, REMOTE_ADDR='10.0.0.3')
+        self.client.get(url, REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(self.rollup(), 2)
+        self.assertEqual(VisitorSketch.objects.filter(property=self.prop).count(), 1)
+        self.assertEqual(DailyAnalytics.objects.get(property=self.prop, date=today).unique_visitors, 3)
+        self.assertEqual(DailyAnalytics.objects.get(property=self.other, date=today).unique_visitors, 1)
+
+        from .analytics import site_visitors
+
+        # one site-wide sketch per day, across both properties
+        self.assertEqual(SiteVisitorSketch.objects.get().date, today)
+        self.assertEqual(site_visitors(today, today), 3)
+
+    def test_command_rebuilds_and_prunes(self):
+        url = reverse('property-detail', kwargs={'pk': self.prop.pk})
+        self.client.get(url, REMOTE_ADDR='10.0.0.1')
+        self.client.get(url, REMOTE_ADDR='10.0.0.2')
+        AnalyticsEvent.objects.update(created_at=F('created_at') - timedelta(days=3))
+
+        out = StringIO()
+        call_command('rollup_analytics', '--settle-seconds', '0', '--prune-days', '1', stdout=out)
+        self.assertIn('Rolled up 2 analytics events', out.getvalue())
+        self.assertIn('Pruned 2 rolled-up events', out.getvalue())
+        self.assertFalse(AnalyticsEvent.objects.exists())
+        # the sketch outlives the events it was built from
+        day = timezone.now().date() - timedelta(days=3)
+        self.assertEqual(DailyAnalytics.objects.get(property=self.prop, date=day).unique_visitors, 2)
+
+    def test_counters_are_kept_live_not_derived_from_the_log(self):
+        url = reverse('property-detail', kwargs={'pk': self.prop.pk})
+        self.client.get(url, REMOTE_ADDR='10.0.0.1')
+        self.client.get(url, REMOTE_ADDR='10.0.0.2')
+        today = timezone.now().date()
+        self.assertEqual(DailyAnalytics.objects.get(property=self.prop, date=today).views, 2)
+
+        # rolling up (or rebuilding) the sketches leaves the counters as they are
+        self.rollup()
+        call_command('rollup_analytics', '--settle-seconds', '0', '--rebuild', stdout=StringIO())
+        daily = DailyAnalytics.objects.get(property=self.prop, date=today)
+        self.assertEqual((daily.views, daily.unique_visitors), (2, 2))
+
+
+
+class AnalyticsPeriodRollupTests(TestCase):
+    def setUp(self):
+        from list_vila.models import ContectUs
+
+        cache.clear()
+        self.today = timezone.now().date()
+        props = [Property.objects.create(title=f'Rolled {i}') for i in range(2)]
+        rows = []
+        for offset in range(400):
+            day = self.today - timedelta(days=offset)
+            for i, prop in enumerate(props):
+                rows.append(DailyAnalytics(property=prop, date=day, views=offset % 7 + i, bookings=offset % 3, downloads=i))
+        DailyAnalytics.objects.bulk_create(rows)
+        for offset in range(0, 400, 5):
+            inquiry = ContectUs.objects.create(name='Guest', email='guest@test.com', phone='1', message='Hi')
+            ContectUs.objects.filter(pk=inquiry.pk).update(created_at=timezone.now() - timedelta(days=offset))
+        self.client = APIClient()
+
+    def summary(self, **params):
+        resp = self.client.get('/api/villas/analytics/', params)
+        self.assertEqual(resp.status_code, 200)
+        return resp.json()
+
+    def test_rollups_answer_long_ranges_like_the_daily_rows(self):
+        from .analytics import close_days
+
+        ranges = [{'range': '6m'}, {'range': '1y'}, {'range': '7d'},
+                  {'start': str(self.today - timedelta(days=250)), 'end': str(self.today - timedelta(days=20))}]
+        before = [self.summary(**params) for params in ranges]
+
+        yesterday = self.today - timedelta(days=1)
+        self.assertEqual(close_days(yesterday), 399)
+        cache.clear()
+        self.assertTrue(MonthlyAnalytics.objects.exists())
+        self.assertEqual(WeeklyAnalytics.objects.get(week=yesterday - timedelta(days=yesterday.weekday())).through, yesterday)
+        after = [self.summary(**params) for params in ranges]
+        self.assertEqual(before, after)
+        self.assertEqual(after[1]['totals']['inquiries'], 74)
+
+        # rows of closed whole months are no longer read
+        month = (self.today.replace(day=1) - timedelta(days=100)).replace(day=1)
+        DailyAnalytics.objects.filter(date=month + timedelta(days=10)).update(views=1000)
+        cache.clear()
+        self.assertEqual(self.summary(range='1y')['totals'], after[1]['totals'])
+
+    def test_deletes_reopen_closed_periods(self):
+        from list_vila.models import ContectUs
+        from .analytics import close_days
+
+        yesterday = self.today - timedelta(days=1)
+        close_days(yesterday)
+        before = self.summary(range='1y')['totals']
+
+        inquiry = ContectUs.objects.filter(created_at__lt=timezone.now() - timedelta(days=100)).latest('created_at')
+        with self.captureOnCommitCallbacks(execute=True):
+            inquiry.delete()
+        self.assertEqual(self.summary(range='1y')['totals']['inquiries'], before['inquiries'] - 1)
+        self.assertLess(AnalyticsWatermark.objects.get(name='period_rollup').last_day, yesterday)
+
+        prop = Property.objects.order_by('pk').last()
+        removed = DailyAnalytics.objects.filter(property=prop, date__gte=self.today - timedelta(days=365)).aggregate(
+            total=Sum('views'))['total']
+        with self.captureOnCommitCallbacks(execute=True):
+            prop.delete()
+        after = self.summary(range='1y')['totals']
+        self.assertEqual(after['views'], before['views'] - removed)
+
+        # the next run rebuilds the rollups without the deleted rows
+        close_days(yesterday)
+        cache.clear()
+        self.assertEqual(self.summary(range='1y')['totals'], after)
+
+    def test_closing_days_is_incremental(self):
+        from .analytics import close_days
+
+        close_days(self.today - timedelta(days=2))
+        month_row = MonthlyAnalytics.objects.order_by('month').first()
+        self.assertEqual(close_days(self.today - timedelta(days=2)), 0)
+        DailyAnalytics.objects.filter(date=self.today - timedelta(days=1)).update(views=50)
+
+        self.assertEqual(close_days(self.today - timedelta(days=1)), 1)
+        self.assertEqual(MonthlyAnalytics.objects.order_by('month').first().updated_at, month_row.updated_at)
+        current = MonthlyAnalytics.objects.get(month=(self.today - timedelta(days=1)).replace(day=1))
+        self.assertEqual(current.through, self.today - timedelta(days=1))
+        expected = DailyAnalytics.objects.filter(
+            date__range=(current.month, current.through)).aggregate(total=Sum('views'))['total']
+        self.assertEqual(current.views, expected)
+
+
+
+class AgentAnalyticsTests(TestCase):
+    def test_agent_totals_are_per_window_and_not_multiplied(self):
+        cache.clear()
+        today = timezone.now().date()
+        agent = User.objects.create_user(email='agent@test.com', name='Agent', password='agentpass', role='agent')
+        idle = User.objects.create_user(email='idle@test.com', name='Idle', password='idlepass', role='agent')
+        props = [Property.objects.create(title=f'Agent {i}', assigned_agent=agent) for i in range(2)]
+        DailyAnalytics.objects.bulk_create([
+            DailyAnalytics(property=prop, date=today - timedelta(days=offset), views=2, downloads=1, bookings=offset % 2)
+            for prop in props for offset in range(30)
+        ])
+
+        resp = APIClient().get('/api/villas/analytics/', {'range': '7d'})
+        agents = {row['id']: row for row in resp.json()['agents']}
+        self.assertEqual(agents[agent.pk], {
+            'id': agent.pk, 'name': 'Agent', 'total_properties': 2,
+            'total_views': 2 * 2 * 8, 'total_downloads': 2 * 8, 'total_bookings': 2 * 4,
+        })
+        self.assertEqual(
+            (agents[idle.pk]['total_properties'], agents[idle.pk]['total_views']), (0, 0),
+        )
+
+
+
+@override_settings(ANALYTICS_CACHE_TIMEOUT=0)
+class AnalyticsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.now().date()
+        self.agent = User.objects.create_user(email='agent@test.com', name='Agent', password='agentpass', role='agent')
+        self.prop = Property.objects.create(title='Cached', assigned_agent=self.agent)
+        DailyAnalytics.objects.bulk_create([
+            DailyAnalytics(property=self.prop, date=self.today - timedelta(days=offset), views=1, downloads=1)
+            for offset in range(200)
+        ])
+        self.client = APIClient()
+
+    def totals(self, **params):
+        return self.client.get('/api/villas/analytics/', params).json()['totals']
+
+    def test_closed_periods_are_cached_and_today_is_recounted(self):
+        first = self.totals(range='6m')
+        self.assertEqual(first['views'], 181)
+
+        # a closed day is served from the cache, today (no expiry here) is not
+        DailyAnalytics.objects.filter(date=self.today - timedelta(days=40)).update(views=100)
+        DailyAnalytics.objects.filter(date=self.today).update(views=5)
+        self.assertEqual(self.totals(range='6m')['views'], 185)
+
+        with self.assertNumQueries(6):  # today's counters and inquiries, today's sketches, agents + assignments + today
+            self.totals(range='6m')
+
+        # a rebuild drops everything cached
+        from .analytics import reset_periods
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reset_periods()
+        self.assertEqual(self.totals(range='6m')['views'], 284)
+
+    def test_visitor_sketches_are_dropped_when_the_rollup_changes_them(self):
+        from .events import rollup_events
+
+        AnalyticsEvent.objects.bulk_create([
+            AnalyticsEvent(event_type='view', property=self.prop, visitor_id=f'anon:{i}',
+                           created_at=timezone.now() - timedelta(days=3))
+            for i in range(3)
+        ])
+        self.assertEqual(self.client.get('/api/villas/analytics/').json()['totals']['unique_visitors'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            rollup_events(settle=timedelta(0))
+        self.assertEqual(self.client.get('/api/villas/analytics/').json()['totals']['unique_visitors'], 3)
+
+    def test_agent_summary_downloads_use_the_cache(self):
+        self.client.force_authenticate(self.agent)
+        url = reverse('agent-summary-list')
+        expected = self.today.day
+        self.assertEqual(self.client.get(url).json()['downloads_this_month'], expected)
+
+        DailyAnalytics.objects.filter(date=self.today.replace(day=1)).update(downloads=10)
+        DailyAnalytics.objects.filter(date=self.today).update(downloads=3)
+        data = self.client.get(url).json()
+        if self.today.day > 1:
+            self.assertEqual(data['downloads_this_month'], expected + 2)
+
+        # reassigning properties changes the agent's history, so it is recounted
+        other = Property.objects.create(title='Second', assigned_agent=self.agent)
+        DailyAnalytics.objects.create(property=other, date=self.today.replace(day=1), downloads=4)
+        self.assertEqual(self.client.get(url).json()['assigned_properties'], 2)
+        total = DailyAnalytics.objects.filter(date__gte=self.today.replace(day=1)).aggregate(n=Sum('downloads'))['n']
+        self.assertEqual(self.client.get(url).json()['downloads_this_month'], total)
+
+
+class CounterBufferTests(TransactionTestCase):
+    def setUp(self):
+        self.props = [Property.objects.create(title=f'Counted {i}') for i in range(3)]
+
+    def totals(self):
+        return {
+            pk: (views, downloads)
+            for pk, views, downloads in DailyAnalytics.objects.values_list('property_id', 'views', 'downloads')
+        }
+
+    def test_no_increment_is_lost_under_concurrent_load(self):
+        from .counters import CounterBuffer
+
+        buffer = CounterBuffer(interval=0.05)
+
+        def hit(i):
+            try:
+                prop = self.props[i % 3]
+                buffer.add(prop.pk, 'views')
+                if i % 2:
+                    buffer.add(prop.pk, 'downloads')
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(hit, range(600)))
+        buffer.stop()
+
+        self.assertEqual(buffer.pending(), 0)
+        self.assertEqual(self.totals(), {prop.pk: (200, 100) for prop in self.props})
+
+    def test_write_through_uses_atomic_upserts(self):
+        from .utils import update_daily_analytics
+
+        def hit(_):
+            try:
+                update_daily_analytics(self.props[0], 'views')
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            list(pool.map(hit, range(60)))
+        self.assertEqual(self.totals(), {self.props[0].pk: (60, 0)})
+
+    def test_shared_buffers_follow_the_setting(self):
+        from .counters import analytics_buffer, event_buffer
+
+        self.assertEqual((analytics_buffer.interval, event_buffer.interval), (0, 0))
+        with override_settings(ANALYTICS_FLUSH_INTERVAL=5):
+            self.assertEqual((analytics_buffer.interval, event_buffer.interval), (5, 5))
+
+
+class ConcurrentApprovalTests(TransactionTestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(email='admin@test.com', name='Admin', password='adminpass', role='admin')
+        self.prop = Property.objects.create(title='Contested')
+        self.bookings = [
+            Booking.objects.create(
+                property=self.prop, full_name=f'Guest {i}', email='guest@test.com',
+                check_in=date(2030, 3, 1 + i), check_out=date(2030, 3, 6 + i),
+            )
+            for i in range(6)
+        ]
+
+    def approve(self, booking_id):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        try:
+            return client.patch(reverse('booking-detail', args=[booking_id]), {'status': 'approved'}, format='json').status_code
+        finally:
+            connections.close_all()
+
+    def test_only_one_overlapping_booking_is_approved(self):
+        with ThreadPoolExecutor(max_workers=6) as pool:
+            codes = list(pool.map(self.approve, [b.pk for b in self.bookings]))
+
+        self.assertEqual(sorted(codes), [200] + [400] * 5)
+        self.assertEqual(Booking.objects.filter(status=Booking.STATUS.Approved).count(), 1)
@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PropertyViewSet, BookingViewSet, get_property_availability, FavoriteViewSet, ReviewViewSet, property_downloaded, DeshboardViewApi, AnalyticsSummaryView, AgentSummaryListView, AgentMonthlyBookingView, AssignPropertyView, AllUserListView, GetPropertyBySlugView
+from .views import PropertyViewSet, BookingViewSet, BookingHistoryViewSet, get_property_availability, batch_property_availability, batch_property_quotes, property_calendar_feed, agent_calendar_feed, agent_calendar_link, FavoriteViewSet, ReviewViewSet, property_downloaded, DeshboardViewApi, AnalyticsSummaryView, AgentSummaryListView, AgentMonthlyBookingView, AssignPropertyView, AllUserListView, GetPropertyBySlugView
 
 
 router = DefaultRouter()
 router.register(r'properties', PropertyViewSet, basename='property')
 router.register(r'bookings', BookingViewSet, basename='booking')
+router.register(r'booking-history', BookingHistoryViewSet, basename='booking-history')
 router.register(r'favorites', FavoriteViewSet, basename='favorite')
 router.register(r'reviews', ReviewViewSet, basename='review')
 
@@ -15,6 +16,11 @@ urlpatterns = [
     path('', include(router.urls)),
     path('dashboard/', DeshboardViewApi.as_view(), name='dashboard'),
     path('properties/<int:property_pk>/availability/', get_property_availability, name='property-availability'),
+    path('availability/', batch_property_availability, name='property-availability-batch'),
+    path('quotes/', batch_property_quotes, name='property-quotes-batch'),
+    path('properties/<int:property_pk>/calendar.ics', property_calendar_feed, name='property-calendar-feed'),
+    path('agent/calendar/', agent_calendar_link, name='agent-calendar-link'),
+    path('agent/calendar/<str:token>.ics', agent_calendar_feed, name='agent-calendar-feed'),
     path('properties/<int:pk>/downloaded/', property_downloaded, name='property-downloaded'),
     path("analytics/", AnalyticsSummaryView.as_view()),
     path("agents/summary/", AgentSummaryListView.as_view(), name="agent-summary-list"),
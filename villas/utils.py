@@ -1,25 +1,21 @@
 from django.utils import timezone
 from .models import DailyAnalytics
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Case, When, Value
+from django.db.models.functions import Cast, Coalesce
 
-def update_daily_analytics(property, field):
-    today = timezone.now().date()
-
-    analytics, created = DailyAnalytics.objects.get_or_create(
-        property=property,
-        date=today
-    )
-
-    # increment field
-    if field == "views":
-        analytics.views += 1
-    elif field == "bookings":
-        analytics.bookings += 1
-    elif field == "downloads":
-        analytics.downloads += 1
+def update_daily_analytics(property, field, request=None, user_id=None, email=None):
+    """
+    Count one view, booking or download for today. Increments go through the
+    process-wide counter buffer (villas.counters) and are written with atomic
+    upserts, so concurrent requests never lose one. The event itself is also
+    appended to the analytics event log (villas.events).
+    """
+    from .counters import analytics_buffer
+    from .events import record_event
 
-    analytics.save()
-    return analytics
+    analytics_buffer.add(property.pk, field)
+    record_event(property.pk, field, request=request, user_id=user_id, email=email)
 
 
 def get_analytics_for_property(property, start_date, end_date):
@@ -44,7 +40,222 @@ def get_total_analytics_for_property(property, start_date, end_date):
         'total_downloads': total_downloads,
     }
 
-from .models import Booking
+from .models import Booking, ExternalCalendarBlock, Property
+
+def approved_overlapping(start_date, end_date):
+    """Approved bookings whose stay touches [start_date, end_date] (same-day turnover counts)."""
+    return Booking.objects.filter(
+        status=Booking.STATUS.Approved,
+        check_in__lte=end_date,
+        check_out__gte=start_date
+    )
+
+
+def external_blocks_overlapping(start_date, end_date):
+    """Imported external-calendar blocks touching [start_date, end_date], same rule as approved_overlapping."""
+    return ExternalCalendarBlock.objects.filter(start__lte=end_date, end__gte=start_date)
+
+
+def unavailable_ranges(start_date, end_date, property_ids):
+    """
+    (property_id, start, end) rows of approved bookings and external blocks
+    touching [start_date, end_date] for the given properties, in one query.
+    """
+    bookings = approved_overlapping(start_date, end_date).filter(
+        property_id__in=property_ids
+    ).order_by().values_list('property_id', 'check_in', 'check_out')
+    blocks = external_blocks_overlapping(start_date, end_date).filter(
+        property_id__in=property_ids
+    ).order_by().values_list('property_id', 'start', 'end')
+    return bookings.union(blocks, all=True)
+
+
+class BookingConflict(Exception):
+    """The booking's dates overlap an approved booking (or are in the past)."""
+
+
+def take_write_lock():
+    """
+    On SQLite, take the database write lock for the rest of the current
+    transaction, waiting up to the busy timeout. SQLite has no row locks
+    (SELECT ... FOR UPDATE is a no-op), and a transaction that has already
+    read cannot safely upgrade, so call this before the first read of a
+    check-then-write block. A no-op on other databases.
+    """
+    connection = transaction.get_connection()
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            # writes no row, but starts the write transaction
+            cursor.execute(f'UPDATE {connection.ops.quote_name(Property._meta.db_table)} SET id = id WHERE 0')
+
+
+def approve_booking(booking):
+    """
+    Approve `booking` without racing other approvals of the same property.
+
+    The parent Property row is locked (SELECT ... FOR UPDATE) for the overlap
+    check and the write, so approvals for different properties still run in
+    parallel. On SQLite the lock is a no-op; take_write_lock() serializes the
+    writers instead. On PostgreSQL the villas_booking_no_approved_overlap
+    exclusion constraint is the backstop.
+    Returns the refreshed booking; raises BookingConflict on overlap.
+    """
+    with transaction.atomic():
+        take_write_lock()
+        list(Property.objects.select_for_update().filter(pk=booking.property_id).values_list('pk', flat=True))
+        booking = Booking.objects.select_for_update().select_related('property').get(pk=booking.pk)
+        if booking.status == Booking.STATUS.Approved:
+            return booking
+
+        if validate_date_range(booking.property, booking.check_in, booking.check_out):
+            raise BookingConflict()
+
+        booking.status = Booking.STATUS.Approved
+        try:
+            with transaction.atomic():
+                booking.save()
+        except IntegrityError as exc:
+            raise BookingConflict() from exc
+        update_daily_analytics(booking.property, "bookings", user_id=booking.user_id, email=booking.email)
+    return booking
+
+
+MAX_BULK_BOOKINGS = 100
+
+
+def increment_daily_analytics(counts, field, day=None):
+    """Add counts[property_id] to the `field` counter of each property for `day` (today), in two queries."""
+    if not counts:
+        return
+    today = day or timezone.now().date()
+    DailyAnalytics.objects.bulk_create(
+        [DailyAnalytics(property_id=property_id, date=today) for property_id in counts],
+        ignore_conflicts=True,
+    )
+    increment = Case(
+        *[When(property_id=property_id, then=Value(n)) for property_id, n in counts.items()],
+        default=Value(0),
+    )
+    DailyAnalytics.objects.filter(date=today, property_id__in=counts).update(**{field: F(field) + increment})
+
+
+def _ranges_overlap(a_start, a_end, b_start, b_end):
+    # same inclusive rule as approved_overlapping
+    return a_start <= b_end and a_end >= b_start
+
+
+def bulk_transition_bookings(booking_ids, new_status, actor=None):
+    """
+    Move many bookings to `new_status` at once. Returns one result per id, in
+    order: {"id", "status", "result": "updated" | "unchanged"} or {"id", "error"}.
+
+    Approvals are checked with a single overlap query against approved
+    bookings and external blocks, and then against each other, in the order given: the first of
+    two overlapping bookings wins. Accepted rows are written with one UPDATE
+    under the same property locks as approve_booking(). A queryset update
+    sends no model signals, so the audit log entries (attributed to `actor`),
+    occupancy index, month rollups, property versions and analytics are
+    written here instead.
+    """
+    from auditlog.models import LogEntry
+
+    from .availability import rebuild_occupancy
+    from .cache import bump_property_version
+    from .events import record_event
+    from .rollups import months_between, refresh_month_stats
+
+    booking_ids = list(dict.fromkeys(booking_ids))
+    approved = Booking.STATUS.Approved
+    results = {}
+
+    with transaction.atomic():
+        take_write_lock()
+        property_ids = set(Booking.objects.filter(pk__in=booking_ids).values_list('property_id', flat=True))
+        # locks in pk order, so overlapping batches cannot deadlock
+        list(Property.objects.select_for_update().filter(pk__in=property_ids).order_by('pk').values_list('pk', flat=True))
+        bookings = {
+            row['id']: row
+            for row in Booking.objects.select_for_update().filter(pk__in=booking_ids).order_by('pk').values(
+                'id', 'property_id', 'status', 'check_in', 'check_out', 'user_id', 'email'
+            )
+        }
+
+        changes = [bookings[pk] for pk in booking_ids if pk in bookings and bookings[pk]['status'] != new_status]
+        accepted = changes
+        if new_status == approved and changes:
+            accepted = []
+            today = timezone.now().date()
+            taken = {}
+            for property_id, start, end in unavailable_ranges(
+                min(row['check_in'] for row in changes), max(row['check_out'] for row in changes),
+                {row['property_id'] for row in changes},
+            ):
+                taken.setdefault(property_id, []).append((start, end))
+
+            for row in changes:
+                ranges = taken.setdefault(row['property_id'], [])
+                if row['check_in'] < today or any(
+                    _ranges_overlap(row['check_in'], row['check_out'], start, end) for start, end in ranges
+                ):
+                    results[row['id']] = {"id": row['id'], "error": "The selected date range overlaps with existing bookings or is invalid."}
+                    continue
+                ranges.append((row['check_in'], row['check_out']))
+                accepted.append(row)
+
+        if accepted:
+            try:
+                with transaction.atomic():
+                    Booking.objects.filter(pk__in=[row['id'] for row in accepted]).update(status=new_status)
+            except IntegrityError as exc:
+                raise BookingConflict() from exc
+
+            # one entry per booking, as booking.save() would have logged
+            for booking in Booking.objects.filter(pk__in=[row['id'] for row in accepted]):
+                LogEntry.objects.log_create(
+                    booking,
+                    action=LogEntry.Action.UPDATE,
+                    changes={'status': [bookings[booking.pk]['status'], new_status]},
+                    actor=actor,
+                )
+
+            touched = {row['property_id'] for row in accepted}
+            Property.objects.filter(pk__in=touched).update(
+                content_version=F('content_version') + 1,
+                updated_at=timezone.now(),
+            )
+            for property_id in touched:
+                bump_property_version(property_id)
+                transaction.on_commit(lambda property_id=property_id: bump_property_version(property_id))
+            months = {}
+            for row in accepted:
+                if approved in (row['status'], new_status):
+                    months.setdefault(row['property_id'], set()).update(months_between(row['check_in'], row['check_out']))
+            for property_id, property_months in months.items():
+                rebuild_occupancy(property_id)
+                refresh_month_stats(property_id, property_months)
+            if new_status == approved:
+                counts = {}
+                for row in accepted:
+                    counts[row['property_id']] = counts.get(row['property_id'], 0) + 1
+                increment_daily_analytics(counts, "bookings")
+                for row in accepted:
+                    record_event(row['property_id'], "bookings", user_id=row['user_id'], email=row['email'])
+
+    updated = {row['id'] for row in accepted}
+    output = []
+    for pk in booking_ids:
+        if pk in results:
+            output.append(results[pk])
+        elif pk not in bookings:
+            output.append({"id": pk, "error": "Booking not found."})
+        else:
+            output.append({
+                "id": pk,
+                "status": new_status,
+                "result": "updated" if pk in updated else "unchanged",
+            })
+    return output
+
 
 def validate_date_range(property, start_date, end_date):
     today = timezone.now().date()
@@ -52,12 +263,10 @@ def validate_date_range(property, start_date, end_date):
     if start_date < today:
         return True
 
-    has_overlap = Booking.objects.filter(
-        property=property,
-        status__in=['approved'],
-        check_in__lte=end_date,
-        check_out__gte=start_date
-    ).exists()
+    has_overlap = (
+        approved_overlapping(start_date, end_date).filter(property=property).exists()
+        or external_blocks_overlapping(start_date, end_date).filter(property=property).exists()
+    )
 
     if has_overlap:
         return True 
@@ -65,6 +274,7 @@ def validate_date_range(property, start_date, end_date):
     return False
 
 from datetime import datetime
+from decimal import Decimal
 
 def is_valid_date(date):
 
@@ -73,4 +283,92 @@ def is_valid_date(date):
         datetime.strptime(str(date), "%Y-%m-%d")
         return True
     except ValueError:
-        return False
\ No newline at end of file
+        return False
+
+
+from .models import PropertyImage, Review, ReviewStatus
+
+RATING_FIELD = models.DecimalField(max_digits=3, decimal_places=2)
+
+
+def apply_review_delta(property_id, count_delta, sum_delta):
+    """Shift the stored review counters of one property in a single UPDATE."""
+    if not count_delta and not sum_delta:
+        return
+    new_count = F('review_count') + count_delta
+    new_sum = F('rating_sum') + sum_delta
+    Property.objects.filter(pk=property_id).update(
+        review_count=new_count,
+        rating_sum=new_sum,
+        # every right-hand side is evaluated against the old row values
+        avg_rating=Case(
+            When(review_count__gt=-count_delta, then=Cast(
+                Cast(new_sum, models.FloatField()) / new_count, RATING_FIELD
+            )),
+            default=Value(0),
+            output_field=RATING_FIELD,
+        ),
+    )
+
+
+def rebuild_review_counters(properties=None):
+    """Recompute review counters from the approved reviews. Returns the number of properties updated."""
+    properties = Property.objects.all() if properties is None else properties
+    totals = {
+        row['property']: row
+        for row in Review.objects.filter(status=ReviewStatus.APPROVED, property__in=properties)
+        .values('property')
+        .annotate(count=models.Count('id'), total=models.Sum('rating'))
+    }
+
+    changed = []
+    for prop in properties.only('id', 'review_count', 'rating_sum', 'avg_rating'):
+        row = totals.get(prop.pk, {'count': 0, 'total': 0})
+        avg = round(Decimal(row['total']) / row['count'], 2) if row['count'] else Decimal('0')
+        if (prop.review_count, prop.rating_sum, prop.avg_rating) != (row['count'], row['total'], avg):
+            prop.review_count, prop.rating_sum, prop.avg_rating = row['count'], row['total'], avg
+            changed.append(prop)
+
+    Property.objects.bulk_update(changed, ['review_count', 'rating_sum', 'avg_rating'], batch_size=500)
+    return len(changed)
+
+
+BOOKING_STATS_KEYS = tuple(Booking.STATUS.values)
+
+
+def attach_booking_stats(properties):
+    """Set `booking_stats` on each property from one grouped query over their bookings."""
+    properties = [prop for prop in properties if not hasattr(prop, 'booking_stats')]
+    if not properties:
+        return
+
+    stats = {}
+    for prop in properties:
+        stats[prop.pk] = dict.fromkeys(('total_bookings',) + BOOKING_STATS_KEYS, 0)
+        prop.booking_stats = stats[prop.pk]
+
+    rows = (
+        Booking.objects.filter(property_id__in=stats.keys())
+        .order_by()
+        .values_list('property_id', 'status')
+        .annotate(n=models.Count('id'))
+    )
+    for property_id, status, n in rows:
+        entry = stats[property_id]
+        entry['total_bookings'] += n
+        if status in entry:
+            entry[status] += n
+
+
+def refresh_primary_image(properties):
+    """Point Property.primary_image at each property's first image ('' if it has none)."""
+    first_image = PropertyImage.objects.filter(property=models.OuterRef('pk')).order_by('id').values('image')[:1]
+    return properties.update(primary_image=Coalesce(models.Subquery(first_image), Value('')))
+
+
+def touch_property(property_id):
+    """Mark a property's representation as changed after one of its child rows changed."""
+    Property.objects.filter(pk=property_id).update(
+        content_version=F('content_version') + 1,
+        updated_at=timezone.now(),
+    )
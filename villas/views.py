@@ -7,16 +7,18 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.decorators import api_view, permission_classes, action
 from datetime import datetime, timedelta, date
 from calendar import monthrange
-from django.db.models import Exists, OuterRef, F, Count, Avg, Sum, Q
+from django.db.models import Exists, OuterRef, F, Count, Q
 
-from .utils import update_daily_analytics, validate_date_range
+from .utils import update_daily_analytics, approve_booking, BookingConflict
+from .utils import MAX_BULK_BOOKINGS, bulk_transition_bookings
 
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from auditlog.registry import auditlog
 
-from .models import Property, Media, Booking, PropertyImage, BedroomImage, Review, ReviewImage, Favorite, DailyAnalytics, PropertyVideo
+from .models import Property, Media, Booking, ArchivedBooking, PropertyImage, BedroomImage, Review, ReviewImage, Favorite, PropertyVideo
+from .serializers import DynamicFieldsMixin, PropertyCardSerializer, ArchivedBookingSerializer
 from .serializers import PropertySerializer , BookingSerializer, MediaSerializer, PropertyImageSerializer, BedroomImageSerializer, ReviewSerializer, ReviewImageSerializer, FavoriteSerializer, ReadReviewSerializer
 from accounts.serializers import SimpleUserSerializer
 
@@ -25,20 +27,77 @@ from accounts.permissions import IsAdminOrManager, IsAgentWithFullAccess, IsAgen
 from rest_framework.permissions import IsAdminUser
 
 
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 
 from django.utils.timezone import now
-from list_vila.models import ContectUs
-from django.db.models.functions import TruncMonth, TruncDay
 from django.db.models import Value, BooleanField
 
+class KeysetResultsSetPagination(CursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', 'id')
+
+
 class StandardResultsSetPagination(PageNumberPagination):
+    """
+    Page-number pagination with an opt-in keyset mode: passing `?cursor=`
+    (empty for the first page) switches to KeysetResultsSetPagination and
+    skips the COUNT(*) entirely. The cursor seeks on the first ordering field
+    (-created_at, or the ?ordering= field) and steps over rows that tie with
+    the page boundary by an offset. It re-orders the queryset, so a view lists
+    the parameters that bring their own order in `keyset_unsupported_params`;
+    combining those with `?cursor=` is a 400.
+    """
     page_size = 20
     page_size_query_param = 'page_size'
     max_page_size = 100
+    cursor_query_param = 'cursor'
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param in request.query_params:
+            conflicts = [param for param in getattr(view, 'keyset_unsupported_params', ()) if request.query_params.get(param)]
+            if conflicts:
+                raise serializers.ValidationError(
+                    {self.cursor_query_param: f"cursor cannot be combined with {', '.join(conflicts)}; use page= instead."}
+                )
+            self.keyset = KeysetResultsSetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.keyset = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class SparseFieldsetMixin:
+    """`?fields=id,title` on list endpoints trims every row to the named fields."""
+    fields_query_param = 'fields'
+
+    def get_serializer(self, *args, **kwargs):
+        raw = self.request.query_params.get(self.fields_query_param) if self.action == 'list' else None
+        if raw and issubclass(self.get_serializer_class(), DynamicFieldsMixin):
+            kwargs.setdefault('fields', [name.strip() for name in raw.split(',') if name.strip()])
+        return super().get_serializer(*args, **kwargs)
 
 
 from .filters import PropertyFilter
+from .search import PropertySearchFilter, booking_search_q
+from .availability import MAX_AVAILABILITY_DAYS, MAX_BATCH_PROPERTIES, batch_availability, booked_ranges, get_occupancy
+from .pricing import MAX_BATCH_QUOTES, batch_quotes
+from .calendar_feed import CONTENT_TYPE as CALENDAR_CONTENT_TYPE, agent_feed, agent_feed_token, agent_id_from_token, property_feed
+from .analytics import agent_downloads, agent_totals, site_visitors, summarize
+from django.http import Http404, HttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from .cache import safe_cache, get_cached_list, set_cached_list, get_cached_detail, set_cached_detail, property_version
+from .cache import property_validators, set_validators
+from django.utils.cache import get_conditional_response
 from datetime import datetime
 
 from rest_framework.views import APIView
@@ -46,29 +105,44 @@ from rest_framework.views import APIView
 from django.contrib.auth import get_user_model
 User = get_user_model()
 
+CLOSED_WINDOW_CACHE_TIMEOUT = 60 * 60 * 24
+
 
 # Property ViewSet
 
-class PropertyViewSet(viewsets.ModelViewSet):
+class PropertyViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
 
     serializer_class = PropertySerializer
     parser_classes = [MultiPartParser, FormParser]
     pagination_class = StandardResultsSetPagination
-    filter_backends = [SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, PropertySearchFilter, OrderingFilter]
     filterset_class = PropertyFilter
     search_fields = ['^title', '^city', '^description', '^interior_amenities', '^outdoor_amenities']
     ordering_fields = ['price', 'created_at', 'bedrooms', 'bathrooms']
+    # ordered by relevance / distance, which the cursor cannot seek on
+    keyset_unsupported_params = ('search', 'near')
     
 
+    def is_card_view(self):
+        return self.action == 'list' and self.request.query_params.get('view') == 'card'
+
+    def get_serializer_class(self):
+        if self.is_card_view():
+            return PropertyCardSerializer
+        return super().get_serializer_class()
+
     def get_queryset(self):
         
         user = self.request.user
 
-        queryset = Property.objects.annotate(total_reviews=Count("reviews"),avg_rating=Avg("reviews__rating")).prefetch_related("media_images", "bedrooms_images")
-
-        if user.is_authenticated:
+        if self.is_card_view():
+            # compact rows: only the card columns, no media prefetches
+            queryset = Property.objects.only(*PropertyCardSerializer.CARD_FIELDS)
+        elif user.is_authenticated:
+            queryset = Property.objects.prefetch_related("media_images", "bedrooms_images", "media_videos")
             queryset = queryset.annotate(is_favorited=Exists(Favorite.objects.filter(property=OuterRef('pk'), user=user))).prefetch_related('favorited_by')
         else:
+            queryset = Property.objects.prefetch_related("media_images", "bedrooms_images", "media_videos")
             queryset = queryset.annotate(is_favorited=Value(False, output_field=BooleanField()))
 
         if not user.is_authenticated:
@@ -83,14 +157,55 @@ class PropertyViewSet(viewsets.ModelViewSet):
         
         return queryset.filter(status=Property.StatusType.PUBLISHED).order_by('-created_at')
     
+    def list(self, request, *args, **kwargs):
+        # anonymous responses carry no personalization (is_favorited is always
+        # False), so they can be shared; signed-in users always hit the database
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+
+        data, cache_key = get_cached_list(request)
+        if data is not None:
+            return Response(data)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            set_cached_list(cache_key, response.data)
+        return response
+
     def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_field]
+
+        # conditional GET: answer 304 from a single-row values() query,
+        # before the full annotated/prefetched detail query runs
+        try:
+            row = (
+                self.get_queryset().prefetch_related(None).filter(pk=pk)
+                .values('id', 'updated_at', 'content_version', 'is_favorited').first()
+            )
+        except (TypeError, ValueError):
+            row = None
+        validators = property_validators(row) if row else None
+        if validators:
+            not_modified = get_conditional_response(request, *validators)
+            if not_modified is not None:
+                update_daily_analytics(Property(pk=row['id']), "views", request)
+                return not_modified
+
+        if not request.user.is_authenticated:
+            data = get_cached_detail(request, pk)
+            if data is not None:
+                update_daily_analytics(Property(pk=data['id']), "views", request)
+                return set_validators(Response(data), validators)
+            version = property_version(pk)
+
         instance = self.get_object()
         serializer = self.get_serializer(instance)
 
         # Update daily analytics for views
-        update_daily_analytics(instance, "views")
+        update_daily_analytics(instance, "views", request)
 
-        return Response(serializer.data)
+        if not request.user.is_authenticated:
+            set_cached_detail(request, pk, instance.pk, version, serializer.data)
+        return set_validators(Response(serializer.data), validators)
 
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
@@ -208,10 +323,10 @@ def property_downloaded(request, pk):
     except Property.DoesNotExist:
         return Response({"error": "Property not found."}, status=status.HTTP_404_NOT_FOUND)
 
-    update_daily_analytics(prop, "downloads")
+    update_daily_analytics(prop, "downloads", request)
     return Response({"detail": "Download recorded."}, status=status.HTTP_200_OK)
 
-class BookingViewSet(viewsets.ModelViewSet):
+class BookingViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
    
     serializer_class = BookingSerializer
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
@@ -234,7 +349,8 @@ class BookingViewSet(viewsets.ModelViewSet):
         else:
             queryset = Booking.objects.filter(user=user).select_related("property", "user")
 
-        return queryset
+        # unique tie-breaker so pages do not shift between requests
+        return queryset.order_by('-created_at', 'id')
 
     def filter_queryset(self, queryset):
         """
@@ -252,14 +368,10 @@ class BookingViewSet(viewsets.ModelViewSet):
         except ValueError:
             pass
 
-        # Text search
-        q = (
-            Q(full_name__icontains=search) |
-            Q(email__icontains=search) |
-            Q(phone__icontains=search)
-        )
+        # Text search on name / email / phone, through the booking search index
+        q = booking_search_q(search)
 
-        # If looks like a date, include check_in / check_out
+        # If looks like a date, include check_in / check_out (indexed)
         if date_value:
             q |= Q(check_in=date_value) | Q(check_out=date_value)
 
@@ -270,7 +382,7 @@ class BookingViewSet(viewsets.ModelViewSet):
             permission_classes = [IsAuthenticated]
         elif self.action == 'retrieve':
             permission_classes = [IsOwnerOrAdminOrManager]
-        elif self.action in ['update', 'partial_update', 'destroy']:
+        elif self.action in ['update', 'partial_update', 'destroy', 'bulk_status']:
             permission_classes = [IsAdminOrManager]
         else:  # list action
             permission_classes = [IsAuthenticated]
@@ -296,64 +408,276 @@ class BookingViewSet(viewsets.ModelViewSet):
         if new_status != booking.status:
 
             if new_status == 'approved':
-                if validate_date_range(booking.property, booking.check_in, booking.check_out):
+                try:
+                    booking = approve_booking(booking)
+                except BookingConflict:
                     return Response(
                         {"error": "The selected date range overlaps with existing bookings or is invalid."},
                         status=400
                     )
-                booking.status = new_status
-                update_daily_analytics(booking.property, "bookings")
 
             elif new_status in ['cancelled', 'rejected', 'completed', 'pending']:
                 booking.status = new_status
+                booking.save()
             else:
                 return Response({"error": "Invalid status"}, status=400)
-            booking.save()
 
         # return updated instance ONLY
         serializer = self.get_serializer(booking)
         return Response(serializer.data, status=200)
+
+    @action(detail=False, methods=['post'], url_path='bulk-status')
+    def bulk_status(self, request):
+        """
+        Move many bookings to one status: `{"ids": [1, 2, 3], "status": "approved"}`.
+        Returns a result per id; bookings that cannot be approved are reported, not fatal.
+        """
+        new_status = request.data.get('status')
+        ids = request.data.get('ids')
+
+        if new_status not in Booking.STATUS.values:
+            return Response({"error": "Invalid status"}, status=400)
+        try:
+            if not isinstance(ids, list):
+                raise TypeError
+            ids = [int(pk) for pk in ids]
+        except (TypeError, ValueError):
+            return Response({"error": "ids must be a list of booking ids."}, status=400)
+        if not 1 <= len(ids) <= MAX_BULK_BOOKINGS:
+            return Response({"error": f"Provide between 1 and {MAX_BULK_BOOKINGS} booking ids."}, status=400)
+
+        try:
+            results = bulk_transition_bookings(ids, new_status, actor=request.user)
+        except BookingConflict:
+            return Response({"error": "Bookings changed concurrently, please retry."}, status=409)
+        return Response({"status": new_status, "results": results}, status=200)
     
 
+class BookingHistoryViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Archived bookings (see the archive_bookings command), read-only. Admins and
+    managers see all of them, everyone else only their own.
+    `?property__id=`, `?status=`, `?user__id=` and `?year=` (check-in year) filter.
+    """
+    serializer_class = ArchivedBookingSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_fields = ['status', 'property__id', 'user__id']
+    ordering_fields = ['check_in', 'check_out', 'created_at']
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = ArchivedBooking.objects.select_related("property", "user")
+        if getattr(user, "role", None) not in ["admin", "manager"]:
+            queryset = queryset.filter(user=user)
+
+        year = self.request.query_params.get("year")
+        if year:
+            try:
+                year = int(year)
+            except ValueError:
+                raise serializers.ValidationError({"year": "year must be an integer."})
+            # date(year + 1, 1, 1) below must exist
+            if not date.min.year <= year < date.max.year:
+                raise serializers.ValidationError({"year": f"year must be between {date.min.year} and {date.max.year - 1}."})
+            # a range, so the check_in index is used
+            queryset = queryset.filter(check_in__gte=date(year, 1, 1), check_in__lt=date(year + 1, 1, 1))
+        return queryset.order_by('-check_in', 'id')
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_property_availability(request, property_pk):
+    """
+    Booked date ranges (merged) of a property. Either `?start=&end=` (ISO dates)
+    or `?month=&year=` with an optional `&months=` span, e.g. months=12.
+    """
+    start_param = request.query_params.get('start')
+    end_param = request.query_params.get('end')
+
     try:
-        prop = Property.objects.get(pk=property_pk)
-    except Property.DoesNotExist:
+        if start_param and end_param:
+            window_start = date.fromisoformat(start_param)
+            window_end = date.fromisoformat(end_param)
+        else:
+            month = int(request.query_params.get('month', datetime.now().month))
+            year = int(request.query_params.get('year', datetime.now().year))
+            months = int(request.query_params.get('months', 1))
+            if not 1 <= months <= 24:
+                raise ValueError
+            window_start = date(year, month, 1)
+            last_month = date(year + (month - 1 + months - 1) // 12, (month - 1 + months - 1) % 12 + 1, 1)
+            window_end = last_month.replace(day=monthrange(last_month.year, last_month.month)[1])
+    except (ValueError, TypeError):
+        return Response({"error": "Invalid month or year parameter."}, status=status.HTTP_400_BAD_REQUEST)
+
+    if window_end < window_start or (window_end - window_start).days > MAX_AVAILABILITY_DAYS:
+        return Response({"error": f"Invalid date range (max {MAX_AVAILABILITY_DAYS} days)."}, status=status.HTTP_400_BAD_REQUEST)
+
+    occupancy = get_occupancy(property_pk)
+    if occupancy is None:
         return Response({"error": "Property not found."}, status=status.HTTP_404_NOT_FOUND)
 
+    booked_dates = booked_ranges(occupancy.intervals, window_start, window_end)
+    return Response(booked_dates, status=status.HTTP_200_OK)
+
+def visible_property_ids(user, ids):
+    """
+    The subset of `ids` the user may see, with the rules of
+    PropertyViewSet: everyone sees published properties, agents also their
+    own, admins and managers everything. One query.
+    """
+    properties = Property.objects.filter(pk__in=ids)
+    role = getattr(user, 'role', None) if user.is_authenticated else None
+    if role not in ('admin', 'manager'):
+        visible = Q(status=Property.StatusType.PUBLISHED)
+        if role == 'agent':
+            visible |= Q(assigned_agent=user)
+        properties = properties.filter(visible)
+    return set(properties.values_list('pk', flat=True))
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def batch_property_availability(request):
+    """
+    Booked and free ranges for many properties in one call:
+    `?ids=1,2,3&start=2026-01-01&end=2026-03-31`.
+    """
     try:
-        month = int(request.query_params.get('month', datetime.now().month))
-        year = int(request.query_params.get('year', datetime.now().year))
+        ids = sorted({int(pk) for pk in request.query_params.get('ids', '').split(',') if pk.strip()})
+        window_start = date.fromisoformat(request.query_params.get('start', ''))
+        window_end = date.fromisoformat(request.query_params.get('end', ''))
     except (ValueError, TypeError):
-        return Response({"error": "Invalid month or year parameter."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"error": "ids (comma-separated) and start/end (YYYY-MM-DD) are required."}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not ids or len(ids) > MAX_BATCH_PROPERTIES:
+        return Response({"error": f"Provide between 1 and {MAX_BATCH_PROPERTIES} property ids."}, status=status.HTTP_400_BAD_REQUEST)
+    if window_end < window_start or (window_end - window_start).days > MAX_AVAILABILITY_DAYS:
+        return Response({"error": f"Invalid date range (max {MAX_AVAILABILITY_DAYS} days)."}, status=status.HTTP_400_BAD_REQUEST)
+
+    # unknown ids and properties the caller may not see are reported, not
+    # shown as free
+    visible = sorted(visible_property_ids(request.user, ids))
+
+    # a window that ended before today can no longer change
+    closed = window_end < timezone.now().date()
+    cache_key = f"villas:availability:{window_start}:{window_end}:{','.join(map(str, visible))}"
+    properties = safe_cache(None, cache.get, cache_key) if closed and visible else None
+    if properties is None:
+        properties = batch_availability(visible, window_start, window_end) if visible else {}
+        if closed and visible:
+            safe_cache(None, cache.set, cache_key, properties, CLOSED_WINDOW_CACHE_TIMEOUT)
+    properties = {
+        str(pk): properties.get(str(pk), {"error": "Property not found."})
+        for pk in ids
+    }
+
+    response = Response({"start": window_start, "end": window_end, "properties": properties}, status=status.HTTP_200_OK)
+    if closed:
+        # agents and staff may see unpublished properties: keep theirs out of shared caches
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, max_age=CLOSED_WINDOW_CACHE_TIMEOUT)
+        else:
+            patch_cache_control(response, public=True, max_age=CLOSED_WINDOW_CACHE_TIMEOUT)
+    return response
 
-    start_of_month = date(year, month, 1)
-    last_day = monthrange(year, month)[1]
-    end_of_month = date(year, month, last_day)
 
-    bookings = Booking.objects.filter(
-        property=prop,
-        status__in=['approved'],
-        check_in__lte=end_of_month,
-        check_out__gte=start_of_month
-    )
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def batch_property_quotes(request):
+    """
+    Price many stays in one call, e.g. for search results:
+    `{"items": [{"property": 1, "check_in": "2026-01-01", "check_out": "2026-01-08"}, ...]}`.
+    Each result carries either the quote or an `error`.
+    """
+    items = request.data.get('items') if isinstance(request.data, dict) else None
+    if not isinstance(items, list) or not 1 <= len(items) <= MAX_BATCH_QUOTES:
+        return Response({"error": f"items must be a list of 1 to {MAX_BATCH_QUOTES} stays."}, status=status.HTTP_400_BAD_REQUEST)
+
+    stays = []
+    for index, item in enumerate(items):
+        try:
+            stays.append((
+                int(item['property']),
+                date.fromisoformat(item['check_in']),
+                date.fromisoformat(item['check_out']),
+            ))
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {"error": f"items[{index}] needs property, check_in and check_out (YYYY-MM-DD)."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
 
-    booked_dates = []
-    for booking in bookings:
-        start = max(booking.check_in, start_of_month)
-        end = min(booking.check_out, end_of_month)
+    # drafts and other unpublished properties are reported like unknown ids
+    visible = visible_property_ids(request.user, {property_id for property_id, _, _ in stays})
+    return Response({"quotes": batch_quotes(stays, visible)}, status=status.HTTP_200_OK)
+
+
+def _calendar_response(request, etag, render):
+    if etag:
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+    body = render()
+    if body is None:
+        raise Http404
+    response = HttpResponse(body, content_type=CALENDAR_CONTENT_TYPE)
+    if etag:
+        response['ETag'] = etag
+    # clients must revalidate, which is a cheap 304 until the next booking change
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+# plain Django views: calendar clients send Accept headers DRF cannot negotiate
+@require_GET
+def property_calendar_feed(request, property_pk):
+    """iCalendar feed of a property's approved bookings."""
+    etag, render = property_feed(property_pk)
+
+    def render_visible():
+        # every Property save changes the ETag, so a 304 never outlives a
+        # change of status; only a full render has to check visibility
+        if property_pk not in visible_property_ids(request.user, [property_pk]):
+            return None
+        return render()
+
+    return _calendar_response(request, etag, render_visible)
+
+
+@require_GET
+def agent_calendar_feed(request, token):
+    """iCalendar feed of approved bookings across an agent's properties, addressed by a signed token."""
+    agent = None
+    agent_id = agent_id_from_token(token)
+    if agent_id is not None:
+        agent = User.objects.filter(pk=agent_id).first()
+    if agent is None:
+        raise Http404
+    return _calendar_response(request, *agent_feed(agent))
 
-        booked_dates.append({
-            "start": start.strftime('%Y-%m-%d'),
-            "end": end.strftime('%Y-%m-%d')
-        })
 
-    return Response(booked_dates, status=status.HTTP_200_OK)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def agent_calendar_link(request):
+    """
+    Subscription URL of the agent-wide feed for the current user; admins and
+    managers may pass `?agent=<id>`.
+    """
+    agent_id = request.user.pk
+    if request.query_params.get('agent') and request.user.role in ['admin', 'manager']:
+        try:
+            agent_id = int(request.query_params['agent'])
+        except ValueError:
+            return Response({"error": "agent must be a user id."}, status=status.HTTP_400_BAD_REQUEST)
+    url = request.build_absolute_uri(reverse('agent-calendar-feed', args=[agent_feed_token(agent_id)]))
+    return Response({"url": url}, status=status.HTTP_200_OK)
+
 
 from .models import ReviewStatus
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     # serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
@@ -399,7 +723,7 @@ class ReviewViewSet(viewsets.ModelViewSet):
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-class FavoriteViewSet(viewsets.ModelViewSet):
+class FavoriteViewSet(SparseFieldsetMixin, viewsets.ModelViewSet):
     serializer_class = FavoriteSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
@@ -504,114 +828,25 @@ class AnalyticsSummaryView(APIView):
         # Grouping logic => ≤60 days = daily, otherwise monthly
         is_monthly = range_days > 60
 
-        # --- BASE QS ---
-        analytics_qs = DailyAnalytics.objects.filter(
-            date__gte=start_date, date__lte=end_date
-        )
-
-        # --- TOTALS ---
-        totals = analytics_qs.aggregate(
-            total_views=Sum("views"),
-            total_downloads=Sum("downloads"),
-            total_bookings=Sum("bookings"),
-        )
-
-        total_inquiries = ContectUs.objects.filter(
-            created_at__date__gte=start_date,
-            created_at__date__lte=end_date,
-        ).count()
-
-        # --- PERFORMANCE (Daily or Monthly) ---
-        if not is_monthly:
-            # DAY-WISE
-            performance = (
-                analytics_qs
-                .annotate(day=TruncDay("date"))
-                .values("day")
-                .annotate(
-                    total_views=Sum("views"),
-                    total_downloads=Sum("downloads"),
-                    total_bookings=Sum("bookings"),
-                )
-                .order_by("day")
-            )
-
-            # inquiries daily
-            inquiry_qs = (
-                ContectUs.objects.filter(
-                    created_at__date__gte=start_date,
-                    created_at__date__lte=end_date,
-                )
-                .annotate(day=TruncDay("created_at"))
-                .values("day")
-                .annotate(inquiries=Count("id"))
-            )
-
-            inquiry_map = {i["day"]: i["inquiries"] for i in inquiry_qs}
-
-            performance_list = []
-            for p in performance:
-                day_name = p["day"].strftime("%a")  # Mon, Tue, Wed
-                performance_list.append({
-                    "name": day_name,
-                    "views": p["total_views"] or 0,
-                    "downloads": p["total_downloads"] or 0,
-                    "bookings": p["total_bookings"] or 0,
-                    "inquiries": inquiry_map.get(p["day"], 0),
-                })
-
-        else:
-            # MONTH-WISE
-            performance = (
-                analytics_qs
-                .annotate(month=TruncMonth("date"))
-                .values("month")
-                .annotate(
-                    total_views=Sum("views"),
-                    total_downloads=Sum("downloads"),
-                    total_bookings=Sum("bookings")
-                )
-                .order_by("month")
-            )
-
-            # inquiries month-wise
-            inquiry_qs = (
-                ContectUs.objects.filter(
-                    created_at__date__gte=start_date,
-                    created_at__date__lte=end_date
-                )
-                .annotate(month=TruncMonth("created_at"))
-                .values("month")
-                .annotate(inquiries=Count("id"))
-            )
-
-            inquiry_map = {i["month"]: i["inquiries"] for i in inquiry_qs}
-
-            performance_list = []
-            for p in performance:
-                label = p["month"].strftime("%b")  # Jan, Feb, Mar
-                performance_list.append({
-                    "name": label,
-                    "views": p["total_views"] or 0,
-                    "downloads": p["total_downloads"] or 0,
-                    "bookings": p["total_bookings"] or 0,
-                    "inquiries": inquiry_map.get(p["month"], 0),
-                })
+        # --- TOTALS + PERFORMANCE (Daily or Monthly) ---
+        # whole weeks/months come from the rollup tables, the edges from daily rows
+        totals, series = summarize(start_date, end_date, is_monthly)
+        total_visitors = site_visitors(start_date, end_date)
+
+        performance_list = []
+        for bucket, values, has_data in series:
+            if not has_data:
+                continue
+            performance_list.append({
+                "name": bucket.strftime("%b" if is_monthly else "%a"),  # Jan / Mon
+                "views": values["views"],
+                "downloads": values["downloads"],
+                "bookings": values["bookings"],
+                "inquiries": values["inquiries"],
+            })
 
         # --- AGENT ANALYTICS ---
-        agents = (
-            User.objects.filter(role="agent")
-            .annotate(
-                total_properties=Count("assigned_villas"),
-                total_views=Sum("assigned_villas__daily_analytics__views"),
-                total_downloads=Sum("assigned_villas__daily_analytics__downloads"),
-                total_bookings=Sum("assigned_villas__daily_analytics__bookings"),
-            )
-            .values(
-                "id", "name", "total_properties",
-                "total_views", "total_downloads", "total_bookings"
-            )
-        )
+        agents = agent_totals(User.objects.filter(role="agent"), start_date, end_date)
 
         return Response({
             "range": range_type,
@@ -619,17 +854,17 @@ class AnalyticsSummaryView(APIView):
             "end_date": end_date,
 
             "totals": {
-                "views": totals["total_views"] or 0,
-                "downloads": totals["total_downloads"] or 0,
-                "bookings": totals["total_bookings"] or 0,
-                "inquiries": total_inquiries,
+                "views": totals["views"],
+                "downloads": totals["downloads"],
+                "bookings": totals["bookings"],
+                "inquiries": totals["inquiries"],
+                "unique_visitors": total_visitors,
             },
 
             "performance": performance_list,
-            "agents": list(agents),
+            "agents": agents,
         })
 
-from django.db.models import Subquery
 from rest_framework import generics
 from .serializers import AgentOptimizedSerializer
 
@@ -640,18 +875,8 @@ class AgentSummaryListView(generics.ListAPIView):
 
 
     def get_queryset(self):
-        today = timezone.now().date()
-        first_day = today.replace(day=1)
-
         user_email = self.request.user.email
 
-        monthly_downloads = DailyAnalytics.objects.filter(
-            property__assigned_agent=OuterRef("pk"),
-            date__gte=first_day,
-        ).values('property__assigned_agent') \
-         .annotate(total=Sum('downloads')) \
-         .values('total')
-
         return (
             User.objects.filter(role="agent", email=user_email)
             .annotate(
@@ -661,9 +886,7 @@ class AgentSummaryListView(generics.ListAPIView):
                     filter=Q(assigned_villas__status="published"),
                     distinct=True,
                 ),
-                downloads_this_month=Subquery(monthly_downloads[:1]),
             )
-            .prefetch_related("assigned_villas")
         )
 
     def list(self, request, *args, **kwargs):
@@ -683,14 +906,19 @@ class AgentSummaryListView(generics.ListAPIView):
             return Response(empty_data)
 
         # Normal response with serializer
-        serializer = self.get_serializer(queryset.first())
+        agent = queryset.first()
+        today = timezone.now().date()
+        # closed days come from the analytics cache, only today is recounted
+        agent.downloads_this_month = agent_downloads(agent.pk, today.replace(day=1), today)
+        serializer = self.get_serializer(agent)
         return Response(serializer.data)
 
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.db.models import Prefetch
+from django.db.models import FilteredRelation
+from decimal import Decimal
 from datetime import datetime
 
 
@@ -741,59 +969,77 @@ class AgentMonthlyBookingView(APIView):
         month_start = date(year, month, 1 )
         month_end =  date(year, month, monthrange(year, month)[1])
 
-        # -------- prefetch monthly bookings (N+1 fixed) --------
-        monthly_bookings = Booking.objects.filter(
-            # check_in__year=year,
-            # check_in__month=month,
-            check_in__lte=month_end,
-            check_out__gte=month_start,
-            status=Booking.STATUS.Approved
-        ).order_by("-check_in")
+        # -------- one property's bookings, page by page --------
+        if request.query_params.get("property"):
+            return self.booking_page(request, user, month_start, month_end)
 
+        # -------- summaries from the month rollup, one query --------
         properties = (
             Property.objects
             .filter(assigned_agent=user)
-            .select_related("assigned_agent")
-            .prefetch_related(
-                Prefetch("bookings", queryset=monthly_bookings, to_attr="monthly_bookings")
+            .annotate(stats=FilteredRelation("month_stats", condition=Q(month_stats__month=month_start)))
+            .order_by("-created_at", "id")
+            .values(
+                "id", "title", "city", "status", "listing_type",
+                "stats__booked_nights", "stats__occupancy_rate", "stats__booking_count", "stats__revenue",
             )
         )
 
-        # -------- prepare response --------
         data = []
         for prop in properties:
-
-            booking_list = [
-                {
-                    "booking_id": b.id,
-                    "full_name": b.full_name,
-                    "check_in": b.check_in,
-                    "check_out": b.check_out,
-                    "status": b.status,
-                    "total_price": b.total_price,
-                    
-                }
-                for b in prop.monthly_bookings
-            ]
-
             data.append({
-                "property_id": prop.id,
-                "property_title": prop.title,
-                "city": prop.city,
-                "total_bookings_this_month": len(prop.monthly_bookings),
-                "bookings": booking_list,
-                "status": prop.status,
-                "listing_type": prop.listing_type,
+                "property_id": prop["id"],
+                "property_title": prop["title"],
+                "city": prop["city"],
+                "total_bookings_this_month": prop["stats__booking_count"] or 0,
+                "booked_nights": prop["stats__booked_nights"] or 0,
+                "occupancy_rate": prop["stats__occupancy_rate"] or Decimal("0"),
+                "revenue": prop["stats__revenue"] or Decimal("0"),
+                "bookings_url": request.build_absolute_uri(
+                    f"{request.path}?month={month}&year={year}&property={prop['id']}"
+                ),
+                "status": prop["status"],
+                "listing_type": prop["listing_type"],
             })
 
         return Response({
             "agent": user.id,
             "month": month,
             "year": year,
-            "properties_count": properties.count(),
+            "properties_count": len(data),
             "data": data
         })
 
+    def booking_page(self, request, user, month_start, month_end):
+        """Approved bookings with a night in the month for one of the agent's properties."""
+        try:
+            property_id = int(request.query_params["property"])
+        except ValueError:
+            return Response({"error": "property must be an id."}, status=400)
+        if not Property.objects.filter(pk=property_id, assigned_agent=user).exists():
+            return Response({"error": "Property not found."}, status=404)
+
+        bookings = Booking.objects.filter(
+            property_id=property_id,
+            status=Booking.STATUS.Approved,
+            check_in__lte=month_end,
+            check_out__gt=month_start,
+        ).order_by("-check_in", "id").values("id", "full_name", "check_in", "check_out", "status", "total_price")
+
+        paginator = StandardResultsSetPagination()
+        page = paginator.paginate_queryset(bookings, request, view=self)
+        return paginator.get_paginated_response([
+            {
+                "booking_id": b["id"],
+                "full_name": b["full_name"],
+                "check_in": b["check_in"],
+                "check_out": b["check_out"],
+                "status": b["status"],
+                "total_price": b["total_price"],
+            }
+            for b in page
+        ])
+
 
 from .serializers import PropertyAssignmentSerializer
 
@@ -859,13 +1105,32 @@ class GetPropertyBySlugView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request, slug):
+        row = (
+            Property.objects.filter(slug=slug, status=Property.StatusType.PUBLISHED)
+            .values('id', 'updated_at', 'content_version').first()
+        )
+        validators = property_validators(row) if row else None
+        if validators:
+            not_modified = get_conditional_response(request, *validators)
+            if not_modified is not None:
+                return not_modified
+
+        anonymous = not request.user.is_authenticated
+        if anonymous:
+            data = get_cached_detail(request, slug)
+            if data is not None:
+                return set_validators(Response(data, status=status.HTTP_200_OK), validators)
+
         try:
             prop = Property.objects.get(slug=slug, status=Property.StatusType.PUBLISHED)
         except Property.DoesNotExist:
             return Response({"error": "Property not found."}, status=status.HTTP_404_NOT_FOUND)
 
+        version = property_version(prop.pk) if anonymous else None
         serializer = PropertySerializer(prop, context={"request": request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        if anonymous:
+            set_cached_detail(request, slug, prop.pk, version, serializer.data)
+        return set_validators(Response(serializer.data, status=status.HTTP_200_OK), validators)
 
 
 